@@ -32,3 +32,4 @@ atexit.register(cleaner)
 # import the routes
 from .routes.routes_api import *
 from .routes.routes_generic import *
+from .routes.routes_jobs import *
@@ -3,11 +3,12 @@ from io import StringIO
 from lxml import etree
 import traceback
 import datetime
-import json
 import re
 
 from ..app import app
-from ..utils.constantes import DATA
+from ..utils.corpus_store import item_store, catalogue_store
+from ..utils.corpus_columns import item_columns
+from ..utils.tree_cache import tree_cache
 from ..utils.api_classes.match import Match
 from ..utils.api_classes.representations_tei import XmlTei
 from ..utils.api_classes.representations_json import Json
@@ -49,15 +50,15 @@ from ..utils.api_classes.client_server import APIInvalidInput, APIInternalServer
 def katapi_cat_full(req_id):
     """
     return a full tei catalogue from its id
-    only iterables can be sent through WSGI => xml needs to be sent in a file with mimetype application/xml,
-    not as an etree.
+    the catalogue is retrieved from the cache of parsed catalogues. it is shared, so it isn't
+    modified: XmlTei.build_response() adds the context of the query to its serialization.
     :param req_id: the id of the catalogue
-    :return: results, a file object
+    :return: results, an lxml tree
     """
     found = True  # boolean indicating wether a file has been found, which will define the
     #               way the response object is built
     try:
-        results = open(f"{DATA}/{req_id}.xml", mode="r", encoding="utf-8")
+        results = tree_cache.get(req_id)
     except FileNotFoundError:
         results = etree.Element("div", nsmap=XmlTei.ns)
         results.set("type", "search-results")
@@ -102,13 +103,12 @@ def katapi_cat_stat(req):
     :return:
     """
     results = {}
-    with open(f"{DATA}/json/export_catalog.json", mode="r") as fh:
-        data = json.load(fh)
+    data = catalogue_store.get()
 
     # if we're searching for an ID
     if "id" in req.keys():
         if req["id"] in data.keys():
-            results[req["id"]] = data[req["id"]]
+            results[req["id"]] = data[req["id"]].to_dict()
 
     # if we're searching for a name with an optional sell_date
     else:
@@ -116,7 +116,7 @@ def katapi_cat_stat(req):
         req_sell_date = req["sell_date"] if "sell_date" in req.keys() else None
         for k, v in data.items():
             if Match.match_cat(req_name, req_sell_date, v) is True:
-                results[k] = v
+                results[k] = v.to_dict()
 
     # if req["format"] == "tei", translate results to tei
     if req["format"] == "tei":
@@ -169,24 +169,22 @@ def katapi_item(req):
     """
     # json format
     if req["format"] == "json":
-        with open(f"{DATA}/json/export_item.json", mode="r") as fh:
-            data = json.load(fh)
+        data = item_store.get()
         results = {}
         # if querying an id
         if "id" in req.keys():
             if req["id"] in data.keys():
-                results[req["id"]] = data[req["id"]]
+                results[req["id"]] = data[req["id"]].to_dict()
 
         # if we're querying a name
         else:
             # determine on which params to query in the json
             mode = Match.set_match_mode(req)
 
-            # loop through all items and search results using the supplied parameters
-            for k, v in data.items():
-                if v["author"] is not None:
-                    if Match.match_item(req, v, mode) is True:
-                        results[k] = v
+            # search results in the columns of the json using the supplied parameters
+            columns = item_columns.get()
+            for k in columns.keys(Match.match_items(req, columns, mode)):
+                results[k] = data[k].to_dict()
 
     # tei format
     else:
@@ -200,15 +198,12 @@ def katapi_item(req):
         else:
             # build a list of relevant items's @xml:id from the json in order to retrieve
             # these elements in the xml-tei catalogues
-            with open(f"{DATA}/json/export_item.json", mode="r") as fh:
-                data = json.load(fh)
+            columns = item_columns.get()
             relevant = []  # list of relevant @xml:id
             mode = Match.set_match_mode(req)  # determine on which params to query in the json
-            for k, v in data.items():
-                if v["author"] is not None:
-                    if Match.match_item(req, v, mode) is True:
-                        # add the item's id to the list of relevant ids
-                        relevant.append(re.search(r"^CAT_\d+_e\d+", k)[0])
+            for k in columns.keys(Match.match_items(req, columns, mode)):
+                # add the item's id to the list of relevant ids
+                relevant.append(re.search(r"^CAT_\d+_e\d+", k)[0])
             relevant = set(relevant)  # deduplicate
             data = []
 
@@ -283,16 +278,29 @@ def katapi():
                      if id is provided, the only other allowed params are level and format
     :return:
     """
-    # =================== VARABLES =================== #
     timestamp = datetime.datetime.utcnow().isoformat()  # timestamp for when a request is sent
+    req = dict(request.args)  # get arguments requested by client
+    katapi_validate(req, timestamp)
+    return katapi_response(req, timestamp)
+
+
+def katapi_validate(req, timestamp):
+    """
+    check the parameters of a query of the api (see katapi() for the allowed parameters):
+    if they are invalid, an APIInvalidInput error (http 422) is raised.
+    the validation is separated from katapi_response() so that a query can be checked when it
+    is submitted as a job (see routes_jobs.py), before it is run.
+    :param req: the user's request (the parameters of the query). if it is invalid, a default
+                format is set in it to build the error response
+    :param timestamp: timestamp for when the query was sent
+    :return: None
+    """
+    # =================== VARABLES =================== #
     errors = []  # keys to errors that happened
     allowed_params = ["level", "orig_date", "sell_date", "name", "format", "id"]  # list of all allowed parameters
     incompatible_params = []  # list of incompatible parameters (for certain error messages)
-    status_code = 200  # HTTP status code: 200 by default. custom codes will
-    #                    be added if there are errors
 
     # =================== PROCESS THE USER INPUT =================== #
-    req = dict(request.args)  # get arguments requested by client
     unallowed_params = [p for p in req.keys() if p not in allowed_params]  # list of forbidden params
     #                                                                        (aka, parameters that are never allowed)
 
@@ -347,7 +355,6 @@ def katapi():
         if "format" in req.keys() and req["format"] != "tei":
             errors.append("cat_full_format")
 
-    # =================== RUN THE USER QUERY =================== #
     # if there's an error, raise an http 422 error for which we have custom handling:
     # a custom response object with the user query, a status code and a response log
     # will be returned to the user.
@@ -358,51 +365,65 @@ def katapi():
         elif "format" not in req.keys():
             req["format"] = "json"
         raise APIInvalidInput(req, errors, incompatible_params, unallowed_params, timestamp)
+    return None
 
-    # if there's no error, proceed and try and retrieve results
-    else:
-        # if there's an error here, throwback an unexpected server error (http 500)
-        try:
-            # define default behaviour
-            if "level" in req.keys() and req["level"] == "cat_full" and "format" not in req.keys():
-                req["format"] = "tei"
-            if "level" not in req.keys():
-                req["level"] = "item"
-            if "format" not in req.keys():
-                req["format"] = "json"
-
-            # if we're working at item level
-            if req["level"] == "item":
-                response_body = katapi_item(req)
-
-            # if we're retrieving catalogue statistics
-            elif req["level"] == "cat_stat":
-                response_body = katapi_cat_stat(req)
-
-            # if we're retrieving a full catalogue in xml-tei (req_level=="cat_full")
-            else:
-                response_body, found = katapi_cat_full(req["id"])
-
-            # build the complete response (build_response functions build a body
-            # from a template + call APIGlobal.set_headers to append headers to the body)
-            if "level" in req and req["level"] == "cat_full":  # full catalogue in tei
-                response = XmlTei.build_response(req, response_body, timestamp, status_code, found)
-            elif req["format"] == "tei":  # other tei formats
-                response = XmlTei.build_response(req, response_body, timestamp, status_code)
-            else:  # json formats
-                response = Json.build_response(req, response_body, status_code, timestamp)
-
-        # raise an error that will build a valid json/tei response and return it to the user
-        except:
-            # prepare the error stack
-            dummy1 = StringIO()  # dummy file object to write the stack to
-            dummy2 = StringIO()  # dummy file object to write the exception to
-            traceback.print_stack(file=dummy1)
-            traceback.print_exc(file=dummy2)
-            stack = dummy1.getvalue() + dummy2.getvalue()  # extract the string from stack
-            stack = f"Error on {timestamp} \n" + stack
-
-            ErrorLog.dump_error(stack)
-            raise APIInternalServerError(req, timestamp)
+
+def katapi_response(req, timestamp):
+    """
+    run a query of the api that has been checked by katapi_validate() and build the response.
+    if an unexpected error happens, it is logged and an APIInternalServerError (http 500) is raised.
+    the response is built with the json|tei representations, which need an application context
+    (but no request context: the query can be run as a job, see routes_jobs.py)
+    :param req: the user's request (the parameters of the query), completed with the default values
+    :param timestamp: timestamp for when the query was sent
+    :return: response, a complete response object
+    """
+    status_code = 200  # HTTP status code: 200 by default. custom codes will
+    #                    be added if there are errors
+
+    # =================== RUN THE USER QUERY =================== #
+    # if there's an error here, throwback an unexpected server error (http 500)
+    try:
+        # define default behaviour
+        if "level" in req.keys() and req["level"] == "cat_full" and "format" not in req.keys():
+            req["format"] = "tei"
+        if "level" not in req.keys():
+            req["level"] = "item"
+        if "format" not in req.keys():
+            req["format"] = "json"
+
+        # if we're working at item level
+        if req["level"] == "item":
+            response_body = katapi_item(req)
+
+        # if we're retrieving catalogue statistics
+        elif req["level"] == "cat_stat":
+            response_body = katapi_cat_stat(req)
+
+        # if we're retrieving a full catalogue in xml-tei (req_level=="cat_full")
+        else:
+            response_body, found = katapi_cat_full(req["id"])
+
+        # build the complete response (build_response functions build a body
+        # from a template + call APIGlobal.set_headers to append headers to the body)
+        if "level" in req and req["level"] == "cat_full":  # full catalogue in tei
+            response = XmlTei.build_response(req, response_body, timestamp, status_code, found)
+        elif req["format"] == "tei":  # other tei formats
+            response = XmlTei.build_response(req, response_body, timestamp, status_code)
+        else:  # json formats
+            response = Json.build_response(req, response_body, status_code, timestamp)
+
+    # raise an error that will build a valid json/tei response and return it to the user
+    except:
+        # prepare the error stack
+        dummy1 = StringIO()  # dummy file object to write the stack to
+        dummy2 = StringIO()  # dummy file object to write the exception to
+        traceback.print_stack(file=dummy1)
+        traceback.print_exc(file=dummy2)
+        stack = dummy1.getvalue() + dummy2.getvalue()  # extract the string from stack
+        stack = f"Error on {timestamp} \n" + stack
+
+        ErrorLog.dump_error(stack)
+        raise APIInternalServerError(req, timestamp)
 
     return response
@@ -1,4 +1,4 @@
-from flask import render_template, request
+from flask import render_template, request, Response, stream_with_context, url_for, abort
 import json
 import glob
 import os
@@ -6,12 +6,19 @@ import os
 from ..app import app
 from ..utils.main_functions import *
 from ..utils.constantes import TEMPLATES, TEST
-from ..utils.reconciliator import reconciliator
+from ..utils.reconciliator import reconciliator, reconciliator_stream, filter_entries, sort_entries, sort_fields
+from ..utils.search_cache import search_cache
+from ..utils.profiler import profile_logger
 from ..utils.figmaker import figmaker_idx, figmaker_cat
+from ..utils.corpus_columns import item_columns
 
 
-# The index is generated when the app is launched.
+# The index is generated when the app is launched, the positions of the items are indexed
+# and the columns of export_item.json are built if needed (with `gunicorn --preload`, this
+# is done once, before the workers are forked: they all map the same columns in memory).
 created_index = create_index()
+item_index.refresh()
+item_columns.refresh()
 
 
 @app.before_first_request
@@ -20,11 +27,43 @@ def make_figidx():
     create the figures to be displayed
     :return:
     """
-    created_index = create_index()
     fig = figmaker_idx()
     return None
 
 
+MAX_PAGE_SIZE = 500  # maximum number of entries per page on the catalogue and search pages
+
+
+def stream_template(template_name, **context):
+    """
+    render a template as a stream of strings instead of a single string
+    (see https://flask.palletsprojects.com/en/1.1.x/patterns/streaming/)
+    :param template_name: the name of the template
+    :param context: the variables passed to the template
+    :return: a generator of strings, to be sent in a streamed response
+    """
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(20)  # send the page by groups of 20 chunks rather than chunk by chunk
+    return stream
+
+
+def get_entries_page(doc, page, size):
+    """
+    get a page of entries of a catalogue
+    :param doc: the catalogue, parsed by lxml
+    :param page: the number of the page, starting from 1
+    :param size: the number of entries per page
+    :return: a list of entries, and the number of the next page (None if it is the last page)
+    """
+    start = (page - 1) * size
+    content = list(iter_entries(doc, start, start + size + 1))  # 1 extra entry to know if there's a next page
+    if len(content) > size:
+        return content[:size], page + 1
+    return content, None
+
+
 # ============ MAIN ROUTES ============ #
 @app.route("/")
 def home():
@@ -58,24 +97,125 @@ def search():
     """
     route to search the database by author name and manuscript date and see the results.
     the results can be accessed by sale or by manuscript. the results are reconciliated
-    using reconciliator()
+    using reconciliator(), whose output is cached (see search_cache.py): the results are
+    displayed page by page, and moving between pages or sorting the results doesn't run
+    the search again.
+    a search that isn't cached is streamed: the page is rendered as soon as the entries have been
+    filtered, and the groups are then sent by search_stream() and added to the page as they are found.
+    query parameters (besides author and date):
+    - page: the number of the page, starting at 1
+    - size: the number of entries per page (defaults to 50, max 500)
+    - sort: the order of the entries (see reconciliator.sort_fields), prefixed by "-" for a descending order
+    - stream: 0 to render the page once the groups have been found (for the browsers without javascript)
     :return: render_template for the search page
     """
     author = request.args.get('author')
     date = request.args.get('date')
     if author:
-        results = reconciliator(author, date)
-        for CAT in results["filtered_data"]:
-            file = validate_id(CAT)
-            doc = open_file(file)
-            results["filtered_data"][CAT]["metadata"] = get_metadata(doc)
-            results["filtered_data"][CAT]["cat_id"] = validate_id(CAT)
-            results["filtered_data"][CAT]["desc_id"] = CAT
-            results["filtered_data"][CAT]["text"] = get_entry(id_to_item(doc, CAT))
-        return render_template('pages/Search.html', results=results, author=author)
+        results = search_cache.peek(author, date)
+        stream = results is None and request.args.get('stream') != '0'
+        if stream:
+            # only the entries are needed: the rest of the search is run by search_stream(), with
+            # the entries filtered here (they are kept by the search cache until then)
+            filtered = search_cache.entries(author, date, filter_entries)
+            event, results = next(reconciliator_stream(author, date, filtered=filtered))
+        elif results is None:
+            results = search_cache.get(author, date, reconcile)
+
+        # invalid parameters are replaced by the closest valid ones
+        sort = request.args.get('sort', 'id')
+        if sort.lstrip("-") not in sort_fields:
+            sort = 'id'
+        size = min(max(request.args.get('size', 50, type=int), 1), MAX_PAGE_SIZE)
+        ids = sort_entries(results["filtered_data"], sort)
+        pages = max(1, -(-len(ids) // size))
+        page = min(max(request.args.get('page', 1, type=int), 1), pages)
+        shown = ids[(page - 1) * size:page * size]
+
+        # only the entries of the page are decorated, catalogue by catalogue: each catalogue is read
+        # once (see get_catalogues_entries()), however many of its entries are in the page. the
+        # entries are copied, so that the cached results aren't modified
+        decorations = get_catalogues_entries(shown)
+        filtered_data = {}
+        for CAT in shown:
+            metadata, text = decorations[CAT]
+            filtered_data[CAT] = dict(results["filtered_data"][CAT])
+            filtered_data[CAT]["metadata"] = metadata
+            filtered_data[CAT]["cat_id"] = validate_id(CAT)
+            filtered_data[CAT]["desc_id"] = CAT
+            filtered_data[CAT]["text"] = text
+        results = dict(results, filtered_data=filtered_data)
+        pagination = {"page": page, "pages": pages, "size": size, "sort": sort, "start": (page - 1) * size}
+        return render_template('pages/Search.html', results=results, author=author, date=date,
+                               pagination=pagination, sort_fields=sort_fields, stream=stream)
     return render_template('pages/Search.html')
 
 
+@app.route("/Search/stream")
+def search_stream():
+    """
+    route to send the results of a search as they are computed, as server-sent events
+    (see https://developer.mozilla.org/en-US/docs/Web/API/Server-sent_events). the events
+    are those of reconciliator_stream(), with their data in json:
+    - entries: {"result": the number of entries, "filtered_data": the entries}, as soon as they are filtered
+    - groups: a list of groups found in a block of entries, each being the list of its entries
+      {"desc_id", "cat_id", "cat_entry", "sell_date", "url"}, in the order of the search page
+    - done: {"result": the number of entries, "groups": the number of groups, "partial": see reconciliator()}
+    the entries filtered by search() for the search page are reused (see SearchCache.entries()). the
+    complete output of the search is then cached (see search_cache.py), so that moving between
+    its pages doesn't run it again.
+    query parameters: author and date, like search() ; entries=0 leaves the entries out of the
+    entries event (the search page has already displayed them)
+    :return: a streamed response of server-sent events
+    """
+    author = request.args.get('author')
+    date = request.args.get('date')
+    if not author:
+        abort(400)
+    with_entries = request.args.get('entries') != '0'
+    stamp = search_cache.stamp()
+
+    def event(name, data):
+        return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+    def events():
+        filtered = search_cache.entries(author, date, filter_entries)
+        for name, data in reconciliator_stream(author, date, filtered=filtered):
+            if name == "entries":
+                yield event(name, data if with_entries else {"result": data["result"]})
+            elif name == "groups":
+                yield event(name, [
+                    [
+                        {"desc_id": key, "cat_id": desc["cat_id"], "cat_entry": desc["cat_entry"],
+                         "sell_date": desc["sell_date"],
+                         "url": f"{url_for('view', cat_id=desc['cat_id'])}#{desc['cat_entry']}"}
+                        for member in group[1:] for key, desc in member.items()
+                    ]
+                    for group in data
+                ])
+            else:
+                profile_logger.info(f"reconciliator_stream({author!r}, {date!r}): {json.dumps(data['profile'])}")
+                search_cache.put(author, date, stamp, data)
+                yield event(name, {"result": data["result"], "groups": len(data["groups"]), "partial": data["partial"]})
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def reconcile(author, date):
+    """
+    run a search with reconciliator() (see search_cache.get()) and log the time spent in each
+    phase of the reconciliation, to see which one dominates for an author (the profile is also
+    displayed on the search page in debug mode)
+    :param author: the searched author
+    :param date: the searched date, or None
+    :return: the output of reconciliator()
+    """
+    results = reconciliator(author, date)
+    profile_logger.info(f"reconciliator({author!r}, {date!r}): {json.dumps(results['profile'])}")
+    return results
+
+
 @app.route("/Index")
 def index():
     """
@@ -120,16 +260,60 @@ def katapi_documentation():
 def view(cat_id):
     """
     route to see the main page of a catalogue : description, link to the encoded catalogue,
-    description and price of each item
+    description and price of each item.
+    the page is streamed: the beginning of the page (the metadata of the catalogue, read from its
+    snapshot) is sent first, and the figures are then made and the catalogue parsed (if it isn't in
+    the cache of parsed catalogues) while the page is being sent, so that the time to get the
+    beginning of the page doesn't depend on the size of the catalogue.
+    if a `size` is given in the url, only the first `size` entries are displayed and the
+    following ones can be loaded from the page (see view_entries()).
     :param id: the @xml:id of the catalogue
-    :return: render_template for the main catalogue
+    :return: a streamed response for the main catalogue
+    """
+    file = validate_id(cat_id)
+    metadata = get_cat_metadata(file)  # a missing catalogue fails here, before anything is sent
+    size = request.args.get("size", type=int)
+
+    def figure():
+        # create the visualisations for the current catalogue ; if there is price
+        # info on that catalogue, figpath is True; else, it is False
+        return figmaker_cat(cat_id)
+
+    def entries():
+        doc = open_file(file)
+        if size is not None and size >= 1:
+            content, next_page = get_entries_page(doc, 1, min(size, MAX_PAGE_SIZE))
+            next_page = url_for("view_entries", cat_id=file, page=next_page, size=size) if next_page else None
+        else:
+            content, next_page = iter_entries(doc), None
+        return content, next_page
+
+    # figure() and entries() are called by the template, once the beginning of the page has been rendered
+    return Response(stream_with_context(stream_template(
+        "pages/View.html", metadata=metadata, figure=figure, entries=entries, file=file, cat_id=cat_id
+    )))
+
+
+@app.route("/View/<cat_id>/entries")
+def view_entries(cat_id):
+    """
+    route to get a page of entries of a catalogue, to load the entries of a catalogue incrementally.
+    url parameters:
+    - page: the number of the page, starting from 1 (defaults to 1)
+    - size: the number of entries per page (defaults to 50, max 500)
+    :param cat_id: the @xml:id of the catalogue
+    :return: the html of the entries, with the url of the next page (if there is one) in the
+             `X-Next-Page` header
     """
-    figpath = figmaker_cat(cat_id)  # create the visualisations for the current catalogue ; if there is price
-    #                                  info on that catalogue, figpath is True; else, it is False
     file = validate_id(cat_id)
     doc = open_file(file)
-    return render_template("pages/View.html", metadata=get_metadata(doc), content=get_entries(doc),
-                           file=file, figpath=figpath, cat_id=cat_id)
+    page = max(request.args.get("page", 1, type=int), 1)
+    size = min(max(request.args.get("size", 50, type=int), 1), MAX_PAGE_SIZE)
+    content, next_page = get_entries_page(doc, page, size)
+    response = Response(render_template("partials/view_entries.html", content=content))
+    if next_page:
+        response.headers["X-Next-Page"] = url_for("view_entries", cat_id=file, page=next_page, size=size)
+    return response
 
 
 # ============ AUXILIAIRY ROUTES ============ #
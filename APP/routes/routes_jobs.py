@@ -0,0 +1,155 @@
+from flask import request, jsonify, send_file, url_for
+from werkzeug.exceptions import HTTPException
+import datetime
+import json
+
+from ..app import app
+from ..utils.jobs import job_queue
+from ..utils.reconciliator import reconciliator
+from .routes_api import katapi_validate, katapi_response
+
+
+# ---------------------------------------------------------
+# routes to run the long queries as jobs (see jobs.py): a
+# search or a query of the api is submitted and the id of
+# the job is returned at once ; the client polls the status
+# of the job until it is done, and then gets its output.
+#
+# - POST /jobs/search: submit a search (same parameters as the Search page)
+# - POST /jobs/katapi: submit a query of the api (same parameters as /katapi)
+# - GET /jobs/<job_id>: the status of a job
+# - GET /jobs/<job_id>/result: the output of a job
+#
+# contains the functions running each kind of job:
+# - run_search()
+# - run_katapi()
+# ---------------------------------------------------------
+
+
+def run_search(params, progress):
+    """
+    run a search with reconciliator(). the search isn't bound by the time budget of the
+    searches run by the Search page (RECONCILE_BUDGET), since it doesn't hold a worker of the app
+    :param params: the parameters of the job: {"author": ..., "date": ...}
+    :param progress: the function reporting the current step of the job: the phases of reconciliator()
+    :return: the output of reconciliator() in json, its mimetype and http status code
+    """
+    results = reconciliator(params["author"], params["date"], budget=0, progress=progress)
+    return json.dumps(results).encode("utf-8"), "application/json", 200
+
+
+def run_katapi(params, progress):
+    """
+    run a query of the api, validated when it was submitted (see submit_katapi()).
+    the response is built in an application context, as when it is built by katapi()
+    :param params: the parameters of the job: {"req": the parameters of the query, "timestamp": when it was sent}
+    :param progress: the function reporting the current step of the job
+    :return: the body of the response of the api, its mimetype and http status code
+    """
+    progress("query")
+    with app.app_context():
+        try:
+            response = katapi_response(params["req"], params["timestamp"])
+        except HTTPException as e:  # an error response of the api (APIInternalServerError)
+            response = e.get_response()
+    return response.get_data(), response.mimetype, response.status_code
+
+
+job_queue.register("search", run_search)
+job_queue.register("katapi", run_katapi)
+
+
+def job_description(job):
+    """
+    describe a job for the client
+    :param job: the status of the job (see JobQueue.submit())
+    :return: a json serializable dict with the status of the job and the urls to follow it
+    """
+    description = {k: job[k] for k in ("id", "kind", "params", "state", "step", "error")}
+    for k in ("submitted", "started", "finished", "expires"):
+        description[k] = datetime.datetime.utcfromtimestamp(job[k]).isoformat() if job[k] else None
+    description["status"] = url_for("job_status", job_id=job["id"])
+    description["result"] = url_for("job_result", job_id=job["id"])
+    return description
+
+
+def job_submitted(job):
+    """
+    :param job: the status of a job which has just been submitted
+    :return: a http 202 response describing the job, pointing to its status
+    """
+    response = jsonify(job_description(job))
+    response.status_code = 202
+    response.headers["Location"] = url_for("job_status", job_id=job["id"])
+    return response
+
+
+@app.route("/jobs/search", methods=["POST"])
+def submit_search():
+    """
+    route to submit a search as a job.
+    parameters (in the url or in a form):
+    - author: the searched author. compulsory
+    - date: the searched date (YYYY or YYYY-YYYY). optional
+    :return: a http 202 response describing the job, or a http 400 response if there is no author
+    """
+    author = request.values.get("author")
+    date = request.values.get("date") or None
+    if not author:
+        response = jsonify({"error": "the author is compulsory"})
+        response.status_code = 400
+        return response
+    return job_submitted(job_queue.submit("search", {"author": author, "date": date}))
+
+
+@app.route("/jobs/katapi", methods=["POST"])
+def submit_katapi():
+    """
+    route to submit a query of the api as a job. the parameters (in the url or in a form) are
+    those of katapi(): they are checked at once, and an invalid query gets the same http 422
+    error response as from katapi().
+    :return: a http 202 response describing the job
+    """
+    timestamp = datetime.datetime.utcnow().isoformat()  # timestamp for when a request is sent
+    req = dict(request.values)
+    katapi_validate(req, timestamp)
+    return job_submitted(job_queue.submit("katapi", {"req": req, "timestamp": timestamp}))
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    """
+    route to get the status of a job: its state (queued, running, done or failed), the current
+    step of a running job, the error of a failed job and the times when the job was submitted,
+    started and finished, and when it expires.
+    :param job_id: the id of the job
+    :return: a json response describing the job, or a http 404 response if there is no such job
+    """
+    job = job_queue.status(job_id)
+    if job is None:
+        response = jsonify({"error": "no such job (it may have expired)"})
+        response.status_code = 404
+        return response
+    return jsonify(job_description(job))
+
+
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    """
+    route to get the output of a job: the output of reconciliator() in json for a search,
+    the response of the api for a query of the api.
+    :param job_id: the id of the job
+    :return: the output of the job if it is done ; else, a json response describing the job,
+             with a http 409 status code if it isn't finished, 500 if it failed and 404 if there
+             is no such job
+    """
+    job = job_queue.status(job_id)
+    if job is None:
+        return job_status(job_id)
+    if job["state"] != "done":
+        response = jsonify(job_description(job))
+        response.status_code = 500 if job["state"] == "failed" else 409
+        return response
+    response = send_file(job_queue.result_path(job_id), mimetype=job["mimetype"])
+    response.status_code = job["status_code"]
+    return response
@@ -72,6 +72,29 @@ if (dwn != null) {
 
 /*****************************************************************************/
 
+// LOAD THE NEXT ENTRIES ON A CATALOGUE PAGE
+
+// if the button exists (if we are on a catalogue page displaying a limited number of
+// entries), load the next page of entries when it is clicked and add it to the page.
+// the url of the following page is sent by the server in the X-Next-Page header
+$(document).ready(function() {
+  const more = $("#more-entries");
+  if (more.length > 0) {
+    $(more).click(async function() {
+      const response = await fetch($(more).attr("data-next"));
+      $("#entries").append(await response.text());
+      const next = response.headers.get("X-Next-Page");
+      if (next) {
+        $(more).attr("data-next", next);
+      } else {
+        $(more).remove();
+      };
+    });
+  };
+});
+
+/*****************************************************************************/
+
 // API: CODE COLOURING + ASYNC REQUESTS TO LIVE TEST THE API
 
 $(document).ready(function(){
@@ -176,4 +199,62 @@ function colorApiOut() {
   */
   let apicode = document.querySelector("#apiOut");
   hljs.highlightElement(apicode);
-}
\ No newline at end of file
+}
+/*****************************************************************************/
+
+// SEARCH: ADD THE MANUSCRIPTS SOLD MULTIPLE TIMES AS THEY ARE FOUND
+
+// if the search is being run (if the search page has a #search-groups element with the url
+// of the stream of the search), receive the groups of entries as server-sent events and
+// display them with the entries of the page (see the search_stream() route)
+$(document).ready(function() {
+  const status = $("#search-groups");
+  if (status.length > 0 && status.attr("data-stream")) {
+    const source = new EventSource(status.attr("data-stream"));
+    let found = 0;  // number of groups received
+
+    // each group replaces the sale of its entries (if they are on the page) by the list of their sales
+    source.addEventListener("groups", function(event) {
+      for (const group of JSON.parse(event.data)) {
+        found += 1;
+        for (const member of group) {
+          const list = $(document.getElementById(`groups-${member.desc_id}`));
+          if (list.length == 0) {
+            continue;
+          };
+          list.empty();
+          for (const sale of group) {
+            list.append($("<p>").append(
+              $("<i>").addClass("fas fa-arrow-circle-right"),
+              " Sell date : ",
+              $("<a>").attr({"href": sale.url, "target": "_blank"}).text(sale.sell_date),
+              ` - price : ${list.attr("data-price")} - ${list.attr("data-pages")} page(s).`
+            ));
+          };
+        };
+      };
+      status.text(`${found} manuscript(s) sold multiple times have been found so far...`);
+    });
+
+    // at the end of the search, display the number of groups as when the search isn't streamed
+    source.addEventListener("done", function(event) {
+      source.close();
+      const done = JSON.parse(event.data);
+      if (done.groups == 0) {
+        status.text("there is no manuscript sold multiple times.");
+      } else if (done.groups == 1) {
+        status.text("1 manuscript is sold multiple times.");
+      } else {
+        status.text(`${done.groups} manuscripts are sold multiple times.`);
+      };
+      if (done.partial) {
+        $("#search-partial").removeAttr("hidden");
+      };
+    });
+
+    source.onerror = function() {
+      source.close();
+      status.text("the manuscripts sold multiple times could not be looked for.");
+    };
+  };
+});
@@ -3,6 +3,7 @@ from lxml import etree
 from io import StringIO
 import unittest
 import json
+import time
 import os
 
 
@@ -10,6 +11,11 @@ import os
 from ..app import app
 from ..utils.constantes import TEST
 from ..utils.api_classes.representations_tei import XmlTei
+from ..utils.api_classes.match import Match
+from ..utils.corpus_store import item_store
+from ..utils.corpus_columns import item_columns
+from ..utils.tree_cache import tree_cache
+from . import legacy
 
 
 # -----------------------------------------------------
@@ -365,6 +371,9 @@ class APITest(unittest.TestCase):
                     self.assertEqual(
                         tei_availability.xpath("count(./tei:p[tei:ref])", namespaces=XmlTei.ns), 2
                     )  # assert that there are 2 links: for the mozilla documentation on http status code + for katabase
+                    self.assertEqual(
+                        tree_cache.get(v["id"]).xpath("count(.//tei:availability/tei:p)", namespaces=XmlTei.ns), 0
+                    )  # assert that the catalogue in the cache of parsed catalogues hasn't been modified
 
                 # p2 will return no results => check the body
                 if k == "p2":
@@ -377,6 +386,71 @@ class APITest(unittest.TestCase):
 
         return None
 
+    def api_match_items(self):
+        """
+        test that Match.match_items(), which matches the columns of export_item.json with a
+        query of the api, finds the same entries as the former match_item(), run on each entry
+        of export_item.json, for each mode (name only, orig_date and/or sell_date). the dates
+        of the queries include years and ranges whose bounds are years of matching entries
+        :return: None
+        """
+        data = item_store.get()
+        columns = item_columns.get()
+        queries = [
+            {"name": "Napoléon"},
+            {"name": "Napoléon", "sell_date": "1880"},
+            {"name": "Napoléon", "sell_date": "1880-1899"},
+            {"name": "Napoléon", "orig_date": "1804"},
+            {"name": "Napoléon", "orig_date": "1777-1815"},
+            {"name": "Napoléon", "sell_date": "1880-1899", "orig_date": "1777-1815"},
+            {"name": "Napoléon", "sell_date": "1893", "orig_date": "1813"},
+            {"name": "Louis", "orig_date": "1777"},
+        ]
+        for req in queries:
+            with self.subTest(msg=f"error on {req}"):
+                mode = Match.set_match_mode(req)
+                # like the former katapi(), the entries without an author aren't compared
+                expected = [k for k, v in data.items() if v["author"] is not None and legacy.match_item(req, v, mode)]
+                self.assertTrue(expected)
+                self.assertEqual(columns.keys(Match.match_items(req, columns, mode)), expected)
+        return None
+
+    def api_jobs(self):
+        """
+        test that a query of the api run as a job (see routes_jobs.py) returns the same
+        results as when it is run directly, and that an invalid query is rejected when
+        it is submitted
+        :return: None
+        """
+        params = {"name": "Cherubini", "format": "json"}
+        r = self.app.post(f"/jobs/katapi?{urlencode(params)}")
+        self.assertEqual(str(r.status_code), "202")
+        job = json.loads(r.get_data())
+        self.assertEqual(r.headers["Location"], job["status"])
+
+        # poll the status of the job until it is finished
+        for i in range(600):
+            job = json.loads(self.app.get(job["status"]).get_data())
+            if job["state"] in ("done", "failed"):
+                break
+            time.sleep(0.1)
+        self.assertEqual(job["state"], "done")
+
+        r = self.app.get(job["result"])
+        self.assertEqual(str(r.status_code), "200")
+        self.assertEqual(r.headers["Content-Type"], "application/json")
+        self.assertEqual(
+            json.loads(r.get_data())["results"],
+            json.loads(self.app.get(f"/katapi?{urlencode(params)}").get_data())["results"]
+        )
+
+        # invalid queries and unknown jobs
+        r = self.app.post(f"/jobs/katapi?{urlencode({'format': 'xml'})}")
+        self.assertEqual(str(r.status_code), "422")
+        r = self.app.get(f"/jobs/{'0' * 32}/result")
+        self.assertEqual(str(r.status_code), "404")
+        return None
+
 
 def suite():
     """
@@ -389,18 +463,21 @@ def suite():
     suite.addTest(APITest("api_item"))
     suite.addTest(APITest("api_cat_stat"))
     suite.addTest(APITest("api_cat_full"))
+    suite.addTest(APITest("api_match_items"))
+    suite.addTest(APITest("api_jobs"))
     suite.addTest(APITest("tearDown"))
     return suite
 
 
-def run():
+def run(*suites):
     """
     run the tests
+    :param suites: the suites of tests of the other modules of this directory, run after those of the API
     :return: None
     """
     stream = StringIO()
     runner = unittest.TextTestRunner(stream=stream)
-    result = runner.run(suite())
+    result = runner.run(unittest.TestSuite([suite(), *suites]))
     stream.seek(0)
     print("test output", stream.read())
     os.remove("./save.xml")
@@ -0,0 +1,89 @@
+import subprocess
+import argparse
+import resource
+import timeit
+import json
+import sys
+import gc
+import os
+
+# modules inside ../APP must be imported from run, and thus be imported in run.py
+from ..utils.corpus_store import Entry, item_store, catalogue_store
+
+
+# -----------------------------------------------------
+# measure the memory used by the json exports when they
+# are loaded as plain dicts (as they were before the
+# corpus store) and as Entry records (corpus_store.py).
+# each layout is loaded in a new process, so that the
+# resident memory of one doesn't affect the other.
+#
+# to use: `python -m APP.test.bench_corpus`
+# -----------------------------------------------------
+
+
+def rss():
+    """
+    get the resident memory of the current process. on systems without
+    /proc, the peak resident memory is used instead.
+    :return: the resident memory, in bytes
+    """
+    try:
+        with open("/proc/self/statm", mode="r") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # bytes on macos, kilobytes elsewhere
+
+
+def measure(fpath, layout):
+    """
+    load a json export with one of the layouts and print the memory it uses.
+    this is run in a subprocess by bench().
+    :param fpath: the path to the json export
+    :param layout: "dict" or "entry"
+    :return: None
+    """
+    gc.collect()
+    before = rss()
+    with open(fpath, mode="r") as fh:
+        data = json.load(fh) if layout == "dict" else Entry.load(fh)
+    gc.collect()
+    after = rss()
+    keys = list(data.keys())
+    lookups = timeit.timeit(lambda: [data[k]["sell_date"] for k in keys if "sell_date" in data[k]], number=3) / 3
+    print(json.dumps({"entries": len(data), "rss": after - before, "lookups": lookups}))
+    return None
+
+
+def bench():
+    """
+    compare the resident memory used by both layouts for each json export
+    :return: None
+    """
+    for store in (item_store, catalogue_store):
+        results = {}
+        for layout in ("dict", "entry"):
+            out = subprocess.run(
+                [sys.executable, "-m", "APP.test.bench_corpus", "--measure", store.fpath, layout],
+                capture_output=True, text=True, check=True
+            )
+            results[layout] = json.loads(out.stdout.splitlines()[-1])
+        print(f"{os.path.basename(store.fpath)} ({results['dict']['entries']} entries, "
+              + f"{os.path.getsize(store.fpath) / 1024 ** 2:.1f} MiB on disk)")
+        for layout, r in results.items():
+            print(f"- {layout:<5}: {r['rss'] / 1024 ** 2:7.1f} MiB resident, "
+                  + f"{r['lookups'] * 1000:6.1f} ms to read a key in every entry")
+        print(f"- saved: {(1 - results['entry']['rss'] / results['dict']['rss']) * 100:.0f}% of resident memory")
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--measure", nargs=2, metavar=("FPATH", "LAYOUT"),
+                        help="measure a single layout (used internally by the benchmark).")
+    args = parser.parse_args()
+    if args.measure:
+        measure(*args.measure)
+    else:
+        bench()
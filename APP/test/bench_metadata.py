@@ -0,0 +1,60 @@
+from lxml import etree
+import argparse
+import timeit
+import glob
+import os
+
+# modules inside ../APP must be imported from run, and thus be imported in run.py
+from ..utils.constantes import DATA
+from ..utils.main_functions import get_metadata, parse_header
+from .legacy import get_metadata as legacy_get_metadata
+
+
+# -----------------------------------------------------
+# micro-benchmark of get_metadata() against its former
+# implementation (kept in legacy.py). both implementations
+# are run on the same parsed catalogues, and their outputs
+# are compared (metadata_test.py checks that they are
+# the same).
+#
+# to use: `python -m APP.test.bench_metadata -n 5`
+# -----------------------------------------------------
+
+
+def bench(number, header_only):
+    """
+    time both implementations of get_metadata() on all the catalogues
+    :param number: the number of times each implementation is run on the corpus
+    :param header_only: if True, the catalogues are parsed with parse_header() ; else, in full
+    :return: None
+    """
+    files = sorted(glob.glob(os.path.join(DATA, "CAT_*.xml")))
+    if header_only:
+        trees = [parse_header(f) for f in files]
+    else:
+        trees = [etree.parse(f) for f in files]
+
+    # both implementations must return the same metadata
+    different = [f for f, t in zip(files, trees) if get_metadata(t) != legacy_get_metadata(t)]
+    print(f"{len(files)} catalogues, {len(different)} with a different output")
+    for f in different:
+        print(f"- {os.path.basename(f)}")
+
+    legacy = timeit.timeit(lambda: [legacy_get_metadata(t) for t in trees], number=number)
+    current = timeit.timeit(lambda: [get_metadata(t) for t in trees], number=number)
+    print(f"legacy get_metadata():  {legacy / number * 1000:.1f} ms per corpus "
+          + f"({legacy / number / len(files) * 1e6:.0f} µs per catalogue)")
+    print(f"current get_metadata(): {current / number * 1000:.1f} ms per corpus "
+          + f"({current / number / len(files) * 1e6:.0f} µs per catalogue)")
+    print(f"speedup: x{legacy / current:.1f}")
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=5,
+                        help="number of times each implementation is run on the corpus.")
+    parser.add_argument("--full", action="store_true",
+                        help="parse the complete catalogues instead of their teiHeader only.")
+    args = parser.parse_args()
+    bench(args.number, header_only=not args.full)
@@ -0,0 +1,196 @@
+from unittest import mock
+import unittest
+import tempfile
+import shutil
+import os
+import re
+
+# modules inside ../APP must be imported from run, and thus be imported in run.py
+from ..utils.constantes import DATA
+from ..utils import tree_cache, item_index, catalogue_snapshot, search_cache
+from ..utils.corpus_store import CorpusStore
+from ..utils.main_functions import get_metadata, parse_header
+
+
+# -----------------------------------------------------
+# tests that the caches of the data are invalidated when
+# their source changes on disk: each cache is checked on
+# a copy of a catalogue (or of export_item.json) in a
+# temporary directory, which is touched (only its mtime
+# changes) and then modified
+# -----------------------------------------------------
+
+class CacheTest(unittest.TestCase):
+    """
+    the caches read the catalogues from DATA: it is replaced by the temporary directory
+    in their modules during each test
+    """
+    cat_id = "CAT_000001"  # the catalogue copied in the temporary directory
+
+    def setUp(self):
+        """
+        set up the test fixture: the temporary directory, with a copy of a catalogue
+        and an export_item.json
+        :return: None
+        """
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.fpath = os.path.join(self.tmp, f"{self.cat_id}.xml")
+        shutil.copyfile(os.path.join(DATA, f"{self.cat_id}.xml"), self.fpath)
+        self.json = os.path.join(self.tmp, "export_item.json")
+        with open(self.json, mode="w") as fh:
+            fh.write('{}')
+        for module in (tree_cache, item_index, catalogue_snapshot):
+            patch = mock.patch.object(module, "DATA", self.tmp)
+            patch.start()
+            self.addCleanup(patch.stop)
+        return None
+
+    @staticmethod
+    def touch(fpath):
+        """
+        change the mtime of a file (one second later), but not its content
+        :param fpath: the path to the file
+        :return: None
+        """
+        stat = os.stat(fpath)
+        os.utime(fpath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        return None
+
+    @staticmethod
+    def modify(fpath):
+        """
+        change the content of a catalogue: a comment is added before its first tei:item,
+        so that all the items are moved
+        :param fpath: the path to the catalogue
+        :return: None
+        """
+        with open(fpath, mode="rb") as fh:
+            content = fh.read()
+        with open(fpath, mode="wb") as fh:
+            fh.write(re.sub(rb"<item\b", b"<!-- modified --><item", content, count=1))
+        return None
+
+    def tree_cache_invalidation(self):
+        """
+        test that a parsed catalogue is parsed again once its file is touched or modified
+        :return: None
+        """
+        cache = tree_cache.TreeCache()
+        tree = cache.get(self.cat_id)
+        self.assertIs(cache.get(self.cat_id), tree)
+        self.touch(self.fpath)
+        touched = cache.get(self.cat_id)
+        self.assertIsNot(touched, tree)
+        self.modify(self.fpath)
+        self.assertIsNot(cache.get(self.cat_id), touched)
+        self.assertEqual(cache.stats()["misses"], 3)
+        self.assertEqual(cache.stats()["entries"], 1)
+        return None
+
+    def item_index_invalidation(self):
+        """
+        test that the index of a catalogue is rebuilt once its file is touched or modified,
+        and that the items are read at their new position
+        :return: None
+        """
+        index = item_index.ItemIndex(os.path.join(self.tmp, "items"))
+        items = index.get(self.cat_id)["items"]
+        item_id = next(iter(items))
+        self.touch(self.fpath)
+        self.assertEqual(index.get(self.cat_id)["mtime"], os.stat(self.fpath).st_mtime_ns)
+        self.modify(self.fpath)
+        # a new instance only reads the index saved on disk
+        for reader in (index, item_index.ItemIndex(index.dpath)):
+            moved = reader.get(self.cat_id)
+            self.assertEqual(moved["size"], os.stat(self.fpath).st_size)
+            self.assertEqual(moved["items"][item_id], [n + len("<!-- modified -->") for n in items[item_id]])
+            self.assertEqual(reader.read(item_id).get("{http://www.w3.org/XML/1998/namespace}id"), item_id)
+        return None
+
+    def catalogue_snapshot_invalidation(self):
+        """
+        test that the metadata of a catalogue isn't read from the snapshot once its file is
+        touched or modified, and that it is only extracted again if the content of the file changed
+        :return: None
+        """
+        extracted = []
+
+        def extract(fpaths):
+            extracted.extend(fpaths)
+            return [get_metadata(parse_header(fpath)) for fpath in fpaths]
+
+        snapshot = catalogue_snapshot.CatalogueSnapshot(os.path.join(self.tmp, "catalogue_index.json"))
+        metadata = snapshot.refresh(extract)[self.cat_id]
+        self.assertEqual(snapshot.get(self.cat_id), metadata)
+        self.touch(self.fpath)
+        self.assertIsNone(snapshot.get(self.cat_id))
+        snapshot.refresh(extract)
+        self.assertEqual(snapshot.get(self.cat_id), metadata)
+        self.modify(self.fpath)
+        self.assertIsNone(snapshot.get(self.cat_id))
+        snapshot.refresh(extract)
+        self.assertEqual(snapshot.get(self.cat_id), metadata)
+        self.assertEqual(extracted, [self.fpath, self.fpath])  # not extracted again when touched
+        return None
+
+    def search_cache_invalidation(self):
+        """
+        test that a search is run again once export_item.json is touched or modified
+        :return: None
+        """
+        searches = []
+
+        def search(author, date):
+            searches.append((author, date))
+            return {"result": len(searches)}
+
+        with mock.patch.object(search_cache, "item_store", CorpusStore(self.json)):
+            cache = search_cache.SearchCache()
+            self.assertEqual(cache.get("Sévigné", None, search), {"result": 1})
+            self.assertEqual(cache.get("Sévigné", None, search), {"result": 1})
+            self.touch(self.json)
+            self.assertIsNone(cache.peek("Sévigné", None))
+            self.assertEqual(cache.get("Sévigné", None, search), {"result": 2})
+            with open(self.json, mode="w") as fh:
+                fh.write('{"CAT_000001_e1_d1": {}}')
+            self.assertIsNone(cache.peek("Sévigné", None))
+            self.assertEqual(cache.get("Sévigné", None, search), {"result": 3})
+            self.assertEqual(cache.stats()["misses"], 3)
+        return None
+
+    def search_cache_entries(self):
+        """
+        test that the entries of a streamed search are selected once, until its output is
+        cached or export_item.json is touched
+        :return: None
+        """
+        selections = []
+
+        def select(author, date):
+            selections.append((author, date))
+            return {"entries": len(selections)}
+
+        with mock.patch.object(search_cache, "item_store", CorpusStore(self.json)):
+            cache = search_cache.SearchCache()
+            self.assertEqual(cache.entries("Sévigné", None, select), {"entries": 1})
+            self.assertEqual(cache.entries("Sévigné", None, select), {"entries": 1})
+            self.touch(self.json)
+            self.assertEqual(cache.entries("Sévigné", None, select), {"entries": 2})
+            cache.put("Sévigné", None, cache.stamp(), {"result": 2})
+            self.assertEqual(cache.entries("Sévigné", None, select), {"entries": 3})
+        return None
+
+
+def suite():
+    """
+    build the suite of tests
+    :return: suite
+    """
+    suite = unittest.TestSuite()
+    suite.addTest(CacheTest("tree_cache_invalidation"))
+    suite.addTest(CacheTest("item_index_invalidation"))
+    suite.addTest(CacheTest("catalogue_snapshot_invalidation"))
+    suite.addTest(CacheTest("search_cache_invalidation"))
+    suite.addTest(CacheTest("search_cache_entries"))
+    return suite
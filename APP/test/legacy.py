@@ -0,0 +1,250 @@
+import re
+
+# modules inside ../APP must be imported from run, and thus be imported in run.py
+from ..utils.main_functions import ns
+from ..utils.api_classes.match import Match
+from ..utils.reconciliator import similar
+
+
+# -----------------------------------------------------
+# the former implementations of the functions of the app
+# which have been optimised, kept as they were before the
+# optimisations: the tests and benchmarks compare the
+# current functions with them. they must not be modified.
+#
+# used by the tests and benchmarks of this directory
+#
+# contains:
+# - get_metadata() (from main_functions.py, which compiled
+#   and evaluated every XPath expression from the root of
+#   the fully parsed catalogue)
+# - similarity_score(), author_filtering(), year_filtering()
+#   (from reconciliator.py, which compared the searched
+#   author and dates to every entry and scored every pair
+#   of entries one after the other)
+# - match_item() (from api_classes/match.py, which matched
+#   the entries of export_item.json with a query of the
+#   api one by one)
+# -----------------------------------------------------
+
+
+def get_metadata(file):
+    """
+    This function retrieves metadata from the file.
+    :param file: an XML file
+    :return: a dictionary containing the metadata
+    """
+    metadata = {}
+    # Information about the printed publication.
+    if file.xpath('//tei:titleStmt//tei:title/text()', namespaces=ns):
+        metadata["main_title"] = file.xpath('//tei:titleStmt//tei:title/text()', namespaces=ns)[0]
+    if file.xpath('//tei:sourceDesc//tei:bibl/tei:title/text()', namespaces=ns):
+        metadata["title"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:title/text()', namespaces=ns)[0]
+    if file.xpath('//tei:sourceDesc//tei:bibl/tei:num/text()', namespaces=ns):
+        metadata["num"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:num/text()', namespaces=ns)[0]
+    if file.xpath('//tei:sourceDesc//tei:bibl/tei:editor/text()', namespaces=ns):
+        metadata["editor"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:editor/text()', namespaces=ns)[0]
+    if file.xpath('//tei:sourceDesc//tei:bibl/tei:publisher/text()', namespaces=ns):
+        metadata["publisher"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:publisher/text()', namespaces=ns)[0]
+    if file.xpath('//tei:sourceDesc//tei:bibl/tei:pubPlace/text()', namespaces=ns):
+        metadata["pubPlace"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:pubPlace/text()', namespaces=ns)[0]
+    if file.xpath('//tei:sourceDesc//tei:bibl/tei:date', namespaces=ns):
+        try:
+            metadata["date"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:date/text()', namespaces=ns)[0]
+        except:
+            metadata["date"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:date/@when', namespaces=ns)[0]
+    if file.xpath('//tei:sourceDesc//tei:bibl/tei:date/@when', namespaces=ns):
+        metadata["norm_date"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:date/@when', namespaces=ns)[0]
+    if file.xpath('//tei:sourceDesc//tei:bibl/tei:date/@to', namespaces=ns):
+        metadata["norm_date"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:date/@to', namespaces=ns)[0]
+
+    # Information about the digital publication.
+    if file.xpath('//tei:titleStmt//tei:respStmt/tei:persName/text()', namespaces=ns):
+        metadata["encoder"] = file.xpath('//tei:titleStmt//tei:respStmt/tei:persName/text()', namespaces=ns)[0]
+    if file.xpath('//tei:publicationStmt//tei:publisher/text()', namespaces=ns):
+        metadata["XML_publisher"] = file.xpath('//tei:publicationStmt//tei:publisher/text()', namespaces=ns)[0]
+    if file.xpath('//tei:publicationStmt//tei:licence/text()', namespaces=ns):
+        metadata["licence"] = file.xpath('//tei:publicationStmt//tei:licence/text()', namespaces=ns)[0]
+
+    # Information about the auction.
+    if file.xpath('//tei:sourceDesc//tei:event[@type="auction"]', namespaces=ns):
+        if file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:addrLine/text()', namespaces=ns):
+            metadata["auction_place"] = file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:addrLine/text()', namespaces=ns)[0]
+        if file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:persName[@type="auctioneer"]/text()', namespaces=ns):
+            metadata["auctioneer"] = file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:persName[@type="auctioneer"]/text()', namespaces=ns)
+        if file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:persName[@type="expert"]/text()', namespaces=ns):
+            metadata["expert"] = file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:persName[@type="expert"]/text()', namespaces=ns)
+        if file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:persName[@type="collector"]/text()', namespaces=ns):
+            metadata["collector"] = file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:persName[@type="collector"]/text()', namespaces=ns)
+        if file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:date/text()', namespaces=ns):
+            metadata["auction_date"] = file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:date/text()', namespaces=ns)[0]
+
+    # Information about the witness(es)
+    if file.xpath('//tei:sourceDesc//tei:listWit//tei:msDesc', namespaces=ns):
+        witnesses = file.xpath('//tei:sourceDesc//tei:listWit/tei:witness', namespaces=ns)
+        witnesses_list = []
+        for witness in witnesses:
+            witness_dict = {}
+            if witness.xpath('.//tei:country/text()', namespaces=ns):
+                witness_dict["ms_country"] = witness.xpath('.//tei:country/text()', namespaces=ns)[0]
+            if witness.xpath('.//tei:settlement/text()', namespaces=ns):
+                witness_dict["ms_settlement"] = witness.xpath('.//tei:settlement/text()', namespaces=ns)[0]
+            if witness.xpath('.//tei:repository/text()', namespaces=ns):
+                witness_dict["ms_repository"] = witness.xpath('.//tei:repository/text()', namespaces=ns)[0]
+            if witness.xpath('.//tei:institution/text()', namespaces=ns):
+                witness_dict["ms_institution"] = witness.xpath('.//tei:institution/text()', namespaces=ns)[0]
+            if witness.xpath('.//tei:idno/text()', namespaces=ns):
+                witness_dict["ms_idno"] = witness.xpath('.//tei:idno/text()', namespaces=ns)[0]
+            if witness.xpath('.//tei:desc/text()', namespaces=ns):
+                witness_dict["desc"] = witness.xpath('.//tei:desc/text()', namespaces=ns)[0]
+            # Sometimes, there are multiple pointers for a single witness.
+            if witness.xpath('./tei:ptr', namespaces=ns):
+                ptrs = witness.xpath('./tei:ptr', namespaces=ns)
+                ptrs_list = []
+                for ptr in ptrs:
+                    ptr_dict = {}
+                    if ptr.xpath('./@type', namespaces=ns):
+                        if ptr.xpath('./@type', namespaces=ns)[0] == "digit":
+                            ptr_dict["ptr_type"] = "digital version"
+                        else:
+                            ptr_dict["ptr_type"] = ptr.xpath('./@type', namespaces=ns)[0]
+                    if ptr.xpath('./@target', namespaces=ns):
+                        ptr_dict["ptr_target"] = ptr.xpath('./@target', namespaces=ns)[0]
+                    ptrs_list.append(ptr_dict)
+                witness_dict["ptr"] = ptrs_list
+
+            witnesses_list.append(witness_dict)
+
+        metadata["witness"] = witnesses_list
+
+    return metadata
+
+
+def similarity_score(desc_a, desc_b):
+    """
+    This function calculates the similarity score between two descs.
+    :param desc_a: first desc to compare
+    :param desc_b: second desc to compare
+    :return: the score
+    """
+
+    def equals(field):
+        return desc_a[field] == desc_b[field]
+
+    score = 0
+    # Desc of a same document are often strongly similar.
+    if similar(desc_b["desc"], desc_a["desc"]) > 0.75:
+        score = score + 0.3
+    else:
+        score = score - 0.2
+
+    if equals("term"):
+        score = score + 0.2
+    else:
+        score = score - 0.1
+
+    if equals("date") and desc_b["date"] is not None:
+        score = score + 0.5
+    else:
+        score = score - 0.5
+
+    if equals("number_of_pages"):
+        score = score + 0.1
+    else:
+        score = score - 0.1
+
+    if equals("format"):
+        score = score + 0.1
+    else:
+        score = score - 0.3
+
+    if equals("price"):
+        score = score + 0.1
+    else:
+        score = score - 0.1
+
+    return score
+
+
+def author_filtering(dictionary, name):
+    """
+    This function extracts the entries based on the similarity with the searched author name.
+    :param dictionary: a dictionary
+    :param name: a string
+    :return: a dictionary
+    """
+    output_dict = {}
+    for key in dictionary:
+        if dictionary[key]["author"] is not None and similar(dictionary[key]["author"].lower(), name.lower()) > 0.80:
+            output_dict[key] = dictionary[key]
+
+    return output_dict
+
+
+def year_filtering(dictionary, date):
+    output_dict = {}
+    # a= stands for after.
+    if re.compile("^a=").match(date):
+        norm_date = date.split("=")[1]
+        for key in dictionary:
+            if dictionary[key]["date"] is not None and dictionary[key]["date"] >= norm_date:
+                output_dict[key] = dictionary[key]
+    # b= stands for before.
+    elif re.compile("^b=").match(date):
+        norm_date = date.split("=")[1]
+        for key in dictionary:
+            if dictionary[key]["date"] is not None and dictionary[key]["date"] <= norm_date:
+                output_dict[key] = dictionary[key]
+    # Any year range.
+    else:
+        date_before = date.split("-")[0]
+        date_after = date.split("-")[1]
+        for key in dictionary:
+            if dictionary[key]["date"] is not None and date_before <= dictionary[key]["date".split("-")[0]] <= date_after:
+                output_dict[key] = dictionary[key]
+
+    return output_dict
+
+
+def match_item(req: dict, entry: dict, mode: int):
+    """
+    for routes_api.py
+    try to match a dict entry using a list of dict params
+    :param req: the user request on which to perform the match
+    :param entry: the json entry (from export_item.json) to try a match with
+    :param mode: the mode (an indicator of the supplied query params)
+    :return:
+    """
+    match = False  # whether the entry matches with req or not
+    name = None
+    sell_date = None
+    orig_date = None
+    if "author" in entry.keys() and entry["author"] is not None:
+        name = entry["author"].lower()
+    if "sell_date" in entry.keys() and entry["sell_date"] is not None and entry["sell_date"] != "none":
+        try:
+            sell_date = re.match(r"\d{4}", entry["sell_date"])[0]
+        except TypeError:
+            sell_date = None
+    if "date" in entry.keys() and entry["date"] is not None and entry["date"] != "none":
+        try:
+            orig_date = re.match(r"\d{4}", entry["date"])[0]
+        except TypeError:
+            orig_date = None
+
+    if Match.compare(req["name"], name) is True:
+        # filter by dates if client used dates in their query
+        if mode == 0 and sell_date is not None and orig_date is not None:
+            if Match.match_date(req["sell_date"], sell_date) is True and \
+                    Match.match_date(req["orig_date"], orig_date) is True:
+                match = True
+        elif mode == 1 and orig_date is not None:
+            if Match.match_date(req["orig_date"], orig_date) is True:
+                match = True
+        elif mode == 2 and sell_date is not None:
+            if Match.match_date(req["sell_date"], sell_date) is True:
+                match = True
+        elif mode == 3:
+            match = True
+
+    return match
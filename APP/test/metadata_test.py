@@ -0,0 +1,55 @@
+from lxml import etree
+import unittest
+import glob
+import os
+
+# modules inside ../APP must be imported from run, and thus be imported in run.py
+from ..utils.constantes import DATA
+from ..utils.main_functions import get_metadata, get_cat_metadata, parse_header
+from . import legacy
+
+
+# -----------------------------------------------------
+# tests that the metadata of the catalogues is the same
+# as with the former implementation of get_metadata(),
+# which compiled and evaluated every XPath expression
+# from the root of the fully parsed catalogue
+# -----------------------------------------------------
+
+class MetadataTest(unittest.TestCase):
+    """
+    the former get_metadata() is kept in legacy.py
+    """
+    def setUp(self):
+        """
+        set up the test fixture: a sample of the catalogues
+        :return: None
+        """
+        self.files = sorted(glob.glob(os.path.join(DATA, "CAT_*.xml")))[::20]
+        return None
+
+    def metadata_equivalence(self):
+        """
+        test that get_metadata(), on a complete catalogue and on its teiHeader only, and
+        get_cat_metadata(), which reads the snapshot of the metadata, give the same
+        metadata as the former get_metadata() on the complete catalogue
+        :return: None
+        """
+        for fpath in self.files:
+            cat_id = os.path.splitext(os.path.basename(fpath))[0]
+            with self.subTest(msg=f"error on {cat_id}"):
+                expected = legacy.get_metadata(etree.parse(fpath))
+                self.assertEqual(get_metadata(etree.parse(fpath)), expected)
+                self.assertEqual(get_metadata(parse_header(fpath)), expected)
+                self.assertEqual(get_cat_metadata(cat_id), expected)
+        return None
+
+
+def suite():
+    """
+    build the suite of tests
+    :return: suite
+    """
+    suite = unittest.TestSuite()
+    suite.addTest(MetadataTest("metadata_equivalence"))
+    return suite
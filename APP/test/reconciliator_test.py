@@ -0,0 +1,254 @@
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+import numpy as np
+import unittest
+import itertools
+
+# modules inside ../APP must be imported from run, and thus be imported in run.py
+from ..utils import reconciliator
+from ..utils.reconciliator import (similar, similarity_score, score_pairs, score_pairs_parallel, candidate_pairs,
+                                   filter_entries, prepare_items, date_bounds, reconcile_corpus, reconcile_update)
+from ..utils.corpus_store import item_store
+from ..utils.corpus_columns import item_columns
+from ..utils.main_functions import validate_id
+from ..utils.profiler import Profile
+from . import legacy
+
+
+# -----------------------------------------------------
+# tests that the searches and the reconciliation of their
+# entries give the same results as the former implementation
+# of the reconciliator, which compared the searched author
+# and dates to every entry and scored every pair of entries
+# one after the other with similarity_score() ; and that
+# the reconciliation of export_item.json computed ahead of
+# time is the same when it is updated incrementally
+# -----------------------------------------------------
+
+class ReconciliatorTest(unittest.TestCase):
+    """
+    the former functions are kept in legacy.py
+    """
+    authors = ("Sévigné", "Musset", "Flaubert")  # the searches whose entries are compared
+    searched_authors = ("Napoléon", "Henri", "Sévigné")  # the searches whose entries are filtered
+    # the searched dates: the bounds are dates of entries, and "1848" is lower than "1848-03-01"
+    searched_dates = ("a=1848", "b=1848", "1792-1848", "1848-1848", "a=1848-03-01", "b=1792-10-18", "1000-1002")
+
+    def setUp(self):
+        """
+        set up the test fixture: the entries of a few searches
+        :return: None
+        """
+        self.items = {author: prepare_items(filter_entries(author, None, Profile())[0]) for author in self.authors}
+        return None
+
+    def legacy_pairs(self, items, scores):
+        """
+        the matching pairs of entries, found like the former double_loop() did: every pair
+        of entries is scored with the former similarity_score()
+        :param items: a list of tuples (id, entry)
+        :param scores: the scores of every pair by the former similarity_score(): {(i, j): score}
+        :return: a list of tuples (i, j, score, author distance) like score_pairs()
+        """
+        pairs = []
+        for i, j in scores:
+            desc_a, desc_b = items[i][1], items[j][1]
+            if desc_a["cat_entry"] == desc_b["cat_entry"]:
+                continue
+            if desc_b["author"] and desc_a["author"] and similar(desc_b["author"], desc_a["author"]) < 0.75:
+                continue
+            score = scores[(i, j)]
+            try:
+                distance = similar(desc_b["author"], desc_a["author"])
+            except:
+                distance = 0
+            if score > 0.6 and distance >= 0.4:
+                pairs.append((i, j, score, distance))
+        return pairs
+
+    def scoring_equivalence(self):
+        """
+        test that similarity_score() gives the same score as the former one for every pair
+        of entries, and that score_pairs(), on every pair and on the candidate pairs only,
+        keeps the same pairs with the same scores and author distances as the former double_loop()
+        :return: None
+        """
+        for author, items in self.items.items():
+            with self.subTest(msg=f"error on {author}"):
+                every_pair = list(itertools.combinations(range(len(items)), 2))
+                scores = {(i, j): legacy.similarity_score(items[i][1], items[j][1]) for i, j in every_pair}
+                for (i, j), score in scores.items():
+                    self.assertEqual(similarity_score(items[i][1], items[j][1]), score)
+                expected = self.legacy_pairs(items, scores)
+                self.assertTrue(expected)  # the searches have matching entries
+                self.assertEqual(score_pairs(items, every_pair), expected)
+                self.assertEqual(score_pairs(items, candidate_pairs(items)), expected)
+        return None
+
+    def parallel_scoring(self):
+        """
+        test that score_pairs_parallel(), with 2 or 3 processes, keeps the same pairs in the same order
+        and counts the same pairs as score_pairs(), and that it falls back on score_pairs() when
+        the pool of processes can't be started or breaks
+        :return: None
+        """
+        for author, items in self.items.items():
+            candidates = candidate_pairs(items)
+            expected_report = {}
+            expected = score_pairs(items, candidates, report=expected_report)
+            self.assertTrue(expected)
+            for workers in (2, 3):
+                with self.subTest(msg=f"error on {author} with {workers} processes"):
+                    report = {}
+                    # the pairs are scored by the processes, not by score_pairs() in this one
+                    with mock.patch.object(reconciliator, "score_pairs", wraps=score_pairs) as fallback:
+                        scored_pairs = score_pairs_parallel(items, candidates, workers=workers, report=report)
+                    self.assertFalse(fallback.called)
+                    self.assertEqual(scored_pairs, expected)
+                    self.assertEqual(report, expected_report)
+            # the pool can't be started, or a process dies while the pairs are scored
+            broken_pool = mock.MagicMock()
+            broken_pool.return_value.__enter__.return_value.map.side_effect = BrokenProcessPool("a process died")
+            pools = {"a pool which can't be started": mock.Mock(side_effect=OSError("no process")),
+                     "a broken pool": broken_pool}
+            for name, pool in pools.items():
+                with self.subTest(msg=f"error on {author} with {name}"):
+                    with mock.patch.object(reconciliator, "ProcessPoolExecutor", pool):
+                        report = {}
+                        self.assertEqual(score_pairs_parallel(items, candidates, workers=2, report=report), expected)
+                        self.assertEqual(report, expected_report)
+                    pool.assert_called_once()
+        return None
+
+    def author_lookup(self):
+        """
+        test that the entries of a search, whose authors are found with the index of the
+        authors, are the entries found by the former author_filtering(), which compared the
+        searched author to the author of every entry of export_item.json
+        :return: None
+        """
+        data = item_store.get()
+        for author in self.searched_authors:
+            with self.subTest(msg=f"error on {author}"):
+                expected = list(legacy.author_filtering(data, author))
+                self.assertTrue(expected)
+                self.assertEqual(list(filter_entries(author, None, Profile())[0]), expected)
+        return None
+
+    def date_lookup(self):
+        """
+        test that the entries in a range of dates, found with a binary search in the sorted
+        dates of the entries, are the entries found by the former year_filtering(), which
+        compared the searched dates to the date of every entry of export_item.json
+        :return: None
+        """
+        data = item_store.get()
+        columns = item_columns.get()
+        for date in self.searched_dates:
+            with self.subTest(msg=f"error on {date}"):
+                expected = list(legacy.year_filtering(data, date))
+                self.assertTrue(expected)
+                self.assertEqual(columns.keys(columns.mask(columns.date_rows(*date_bounds(date)))), expected)
+        return None
+
+
+class ReconciliationUpdateTest(unittest.TestCase):
+    """
+    the reconciliation of export_item.json is updated with reconcile_update() on a subset of
+    its entries, and compared with the reconciliation of the subset by reconcile_corpus()
+    """
+    authors = ("Sévigné", "Musset", "Flaubert")  # the subset is made of the entries of these searches
+
+    def setUp(self):
+        """
+        set up the test fixture: the subset of export_item.json, its reconciliation, and the
+        catalogues of two entries in a pair, which are added to or removed from the subset
+        :return: None
+        """
+        keys = set()
+        for author in self.authors:
+            keys.update(filter_entries(author, None)[0])
+        self.data = {key: entry.to_dict() for key, entry in item_store.get().items() if key in keys}
+        self.full = reconcile_corpus(self.data, workers=1)
+        ids = list(self.data)
+        self.paired = [ids[self.full["first"][0]], ids[self.full["second"][-1]]]  # two entries with matches
+        self.catalogues = {validate_id(key) for key in self.paired}
+        return None
+
+    def without_catalogues(self):
+        """
+        :return: the subset of export_item.json without the entries of self.catalogues
+        """
+        return {key: entry for key, entry in self.data.items() if validate_id(key) not in self.catalogues}
+
+    def assertSameReconciliation(self, updated, expected):
+        """
+        test that two reconciliations have the same pairs, with the same scores, and the same clusters
+        (the numbers of the clusters may be different)
+        :param updated: the arrays of the updated reconciliation (see reconcile_update())
+        :param expected: the arrays of the reconciliation of the same entries by reconcile_corpus()
+        :return: None
+        """
+        self.assertIsNotNone(updated)
+        for name in ("first", "second", "score", "distance", "ids_offsets", "ids_data", "fingerprint"):
+            np.testing.assert_array_equal(updated[name], expected[name], err_msg=name)
+
+        def partition(cluster):
+            grouped = {}
+            for row, n in enumerate(cluster.tolist()):
+                if n >= 0:
+                    grouped.setdefault(n, []).append(row)
+            return sorted(grouped.values())
+
+        self.assertEqual(partition(updated["cluster"]), partition(expected["cluster"]))
+        return None
+
+    def incremental_reconciliation(self):
+        """
+        test that updating the reconciliation after entries have been added, changed or removed,
+        or when nothing has changed, gives the same pairs and clusters as reconciling the entries again
+        :return: None
+        """
+        self.assertTrue(len(self.full["first"]))
+        with self.subTest(msg="error with added entries"):
+            previous = reconcile_corpus(self.without_catalogues(), workers=1)
+            self.assertSameReconciliation(reconcile_update(self.data, previous, workers=1), self.full)
+        with self.subTest(msg="error with a changed entry"):
+            changed = dict(self.data)
+            changed[self.paired[0]] = dict(self.data[self.paired[0]], desc="something else entirely", price=-1)
+            previous = reconcile_corpus(changed, workers=1)
+            self.assertSameReconciliation(reconcile_update(self.data, previous, workers=1), self.full)
+        with self.subTest(msg="error with removed entries"):
+            removed = self.without_catalogues()
+            self.assertSameReconciliation(
+                reconcile_update(removed, self.full, workers=1), reconcile_corpus(removed, workers=1)
+            )
+        with self.subTest(msg="error with the same entries"):
+            self.assertSameReconciliation(reconcile_update(self.data, self.full, workers=1), self.full)
+        return None
+
+    def update_fallbacks(self):
+        """
+        test that the reconciliation can't be updated (reconcile_update() returns None) when the
+        former one doesn't have the ids of the entries, or when the entries have been reordered
+        :return: None
+        """
+        previous = {name: array for name, array in self.full.items() if name not in ("ids_offsets", "ids_data")}
+        self.assertIsNone(reconcile_update(self.data, previous, workers=1))
+        self.assertIsNone(reconcile_update(dict(reversed(list(self.data.items()))), self.full, workers=1))
+        return None
+
+
+def suite():
+    """
+    build the suite of tests
+    :return: suite
+    """
+    suite = unittest.TestSuite()
+    suite.addTest(ReconciliatorTest("scoring_equivalence"))
+    suite.addTest(ReconciliatorTest("parallel_scoring"))
+    suite.addTest(ReconciliatorTest("author_lookup"))
+    suite.addTest(ReconciliatorTest("date_lookup"))
+    suite.addTest(ReconciliationUpdateTest("incremental_reconciliation"))
+    suite.addTest(ReconciliationUpdateTest("update_fallbacks"))
+    return suite
@@ -0,0 +1,65 @@
+from unittest import mock
+import unittest
+
+# modules inside ../APP must be imported from run, and thus be imported in run.py
+from ..app import app
+from ..routes import routes_generic
+
+
+# -----------------------------------------------------
+# tests of the pages of the app which are streamed:
+# the beginning of a page must be sent before the
+# slow parts of the page are computed
+# -----------------------------------------------------
+
+class RoutesTest(unittest.TestCase):
+    """
+    the pages are read chunk by chunk with Flask().test_client(), without buffering the responses
+    """
+    cat_id = "CAT_000002"  # a catalogue with prices, so that its page has figures
+
+    def setUp(self):
+        """
+        set up the test fixture
+        :return: None
+        """
+        app.config["TESTING"] = True
+        app.config["DEBUG"] = False
+        self.app = app.test_client()
+        return None
+
+    def view_streaming(self):
+        """
+        test that the first chunk of the page of a catalogue is sent before the catalogue is
+        parsed and its figures are made, and that the complete page has the figures and the entries
+        :return: None
+        """
+        for url in (f"/View/{self.cat_id}", f"/View/{self.cat_id}?size=5"):
+            with self.subTest(msg=f"error on {url}"):
+                with mock.patch.object(routes_generic, "open_file", wraps=routes_generic.open_file) as open_file, \
+                        mock.patch.object(routes_generic, "figmaker_cat", wraps=routes_generic.figmaker_cat) as figure:
+                    response = self.app.get(url, buffered=False)
+                    try:
+                        chunks = response.iter_encoded()
+                        page = next(chunks)
+                        self.assertFalse(open_file.called)
+                        self.assertFalse(figure.called)
+                        page += b"".join(chunks)
+                    finally:
+                        response.close()
+                    open_file.assert_called_once()
+                    figure.assert_called_once()
+                self.assertIn(b'<iframe class="cat"', page)
+                self.assertIn(b'<p class="text-right">', page)
+                self.assertEqual(b"more-entries" in page, url.endswith("size=5"))
+        return None
+
+
+def suite():
+    """
+    build the suite of tests
+    :return: suite
+    """
+    suite = unittest.TestSuite()
+    suite.addTest(RoutesTest("view_streaming"))
+    return suite
@@ -78,47 +78,46 @@ class Match:
         return match
 
     @staticmethod
-    def match_item(req: dict, entry: dict, mode: int):
+    def match_dates(req_date: str, columns, name: str):
         """
         for routes_api.py
-        try to match a dict entry using a list of dict params
+        match_date() on a column of years (see corpus_columns.py), using the sorted
+        index of the column: only the matching entries are read
+        :param req_date: the date (or date range) supplied by user, with format \d{4}(-\d{4})?
+        :param columns: the Columns of export_item.json
+        :param name: the name of the column: "sell_year" or "orig_year"
+        :return: a boolean array, True for the entries whose year matches req_date
+        """
+        if re.match(r"\d{4}-\d{4}", req_date):
+            req_date = req_date.split("-")
+            # the bounds are excluded
+            rows = columns.rows_between(name, int(req_date[0]) + 1, int(req_date[1]))
+        else:
+            rows = columns.rows_between(name, int(req_date), int(req_date) + 1)
+        return columns.mask(rows)
+
+    @staticmethod
+    def match_items(req: dict, columns, mode: int):
+        """
+        for routes_api.py
+        try to match the entries of export_item.json with a request: their author is the requested
+        name (see compare()) and, depending on the mode, the year at the start of their sell_date
+        and/or date matches the requested dates (see match_date()). all the entries are matched at
+        once, using the columns of export_item.json (see corpus_columns.py) instead of its entries.
         :param req: the user request on which to perform the match
-        :param entry: the json entry (from export_item.json) to try a match with
+        :param columns: the Columns of export_item.json
         :param mode: the mode (an indicator of the supplied query params)
-        :return:
+        :return: a boolean array, True for the entries that match
         """
-        match = False  # whether the entry matches with req or not
-        name = None
-        sell_date = None
-        orig_date = None
-        if "author" in entry.keys() and entry["author"] is not None:
-            name = entry["author"].lower()
-        if "sell_date" in entry.keys() and entry["sell_date"] is not None and entry["sell_date"] != "none":
-            try:
-                sell_date = re.match(r"\d{4}", entry["sell_date"])[0]
-            except TypeError:
-                sell_date = None
-        if "date" in entry.keys() and entry["date"] is not None and entry["date"] != "none":
-            try:
-                orig_date = re.match(r"\d{4}", entry["date"])[0]
-            except TypeError:
-                orig_date = None
-
-        if Match.compare(req["name"], name) is True:
-            # filter by dates if client used dates in their query
-            if mode == 0 and sell_date is not None and orig_date is not None:
-                if Match.match_date(req["sell_date"], sell_date) is True and \
-                        Match.match_date(req["orig_date"], orig_date) is True:
-                    match = True
-            elif mode == 1 and orig_date is not None:
-                if Match.match_date(req["orig_date"], orig_date) is True:
-                    match = True
-            elif mode == 2 and sell_date is not None:
-                if Match.match_date(req["sell_date"], sell_date) is True:
-                    match = True
-            elif mode == 3:
-                match = True
-
+        # the names are compared once per distinct author
+        match = columns.author_mask(lambda author: Match.compare(req["name"], author.lower()))
+        if mode == 0:
+            match &= Match.match_dates(req["sell_date"], columns, "sell_year") \
+                & Match.match_dates(req["orig_date"], columns, "orig_year")
+        elif mode == 1:
+            match &= Match.match_dates(req["orig_date"], columns, "orig_year")
+        elif mode == 2:
+            match &= Match.match_dates(req["sell_date"], columns, "sell_year")
         return match
 
     @staticmethod
@@ -1,10 +1,13 @@
 from lxml import etree
 import subprocess
+import copy
 import re
 import os
 
 
-from ..constantes import DATA, TEMPLATES
+from ..constantes import TEMPLATES
+from ..tree_cache import tree_cache
+from ..item_index import item_index
 
 
 # ---------------------------------------------------------------
@@ -214,15 +217,21 @@ class XmlTei:
         :param item_id: the item's desc's id, from export_item.json
         :return: tei_item, a tei:item with the relevant tei:desc
         """
-        tei_item = None
+        # read the item alone, using the index of the items' positions
+        tei_item = item_index.read(item_id)
+        if tei_item is not None:
+            return tei_item
+
+        # if it can't be read alone, search it in the whole catalogue
         cat = re.search(r"^CAT_\d+", item_id)[0]
         try:
-            with open(f"{DATA}/{cat}.xml", mode="r") as fh:
-                tree = etree.parse(fh)
-                tei_item = tree.xpath(
-                    f"./tei:text//tei:item[@xml:id='{item_id}']",
-                    namespaces=XmlTei.ns
-                )[0]
+            tree = tree_cache.get(cat)
+            tei_item = tree.xpath(
+                f"./tei:text//tei:item[@xml:id='{item_id}']",
+                namespaces=XmlTei.ns
+            )[0]
+            # the cached tree is shared: copy the item, since it will be appended to the response
+            tei_item = copy.deepcopy(tei_item)
         except FileNotFoundError:  # the xml file doesn't exist
             pass
         except IndexError:  # if no tei:item matches the 1st xpath().
@@ -426,7 +435,8 @@ class XmlTei:
           - a tei:text/tei:body to store the results
         - append headers
         :param req: the user's request
-        :param response_body: the response body, an lxml tree or string representation of tree
+        :param response_body: the response body, an lxml tree (for level=cat_full, the complete
+                              catalogue from the cache of parsed catalogues, which must not be modified)
         :param status_code: the http status code
         :param timestamp: a timestamp in iso compliant format of when the katapi function was called
         :param found: a flag for req["level"] == "cat_full" indicating wether
@@ -467,15 +477,17 @@ class XmlTei:
             tei_body.append(response_body)
 
             tree = XmlTei.pretty_print(tree)
+            body = etree.tostring(tree, pretty_print=True)
 
         # if a full tei catalogue has been found
         # append paragraphs to tei:publicationStmt//tei:availability
-        # describing the whole context of the request: query, date, status code, producer
+        # describing the whole context of the request: query, date, status code, producer.
+        # the catalogue is shared by the requests, so the paragraphs are built in a tei:availability
+        # of their own and inserted in the serialized catalogue instead of in the catalogue itself
         elif "level" in req.keys() \
                 and req["level"] == "cat_full" \
                 and found is True:
-            tree = etree.parse(response_body)
-            tei_availability = tree.xpath(".//tei:publicationStmt//tei:availability", namespaces=XmlTei.ns)[0]
+            tei_availability = etree.Element("availability", nsmap=XmlTei.ns)
 
             # 1st paragrah = general context of the query
             tei_p = etree.Element("p", nsmap=XmlTei.ns)
@@ -510,9 +522,23 @@ class XmlTei:
             tei_p.append(tei_query_table)
             tei_p = XmlTei.pretty_print(tei_p)
             tei_availability.append(tei_p)
-            tei_availability = XmlTei.pretty_print(tei_availability)
 
-        response = APIGlobal.set_headers(etree.tostring(tree, pretty_print=True), req["format"], status_code)
+            body = etree.tostring(response_body, pretty_print=True)
+            end = body.find(b"</availability>")
+            if end != -1:
+                # the paragraphs, without the start and end tags of their tei:availability
+                paragraphs = etree.tostring(tei_availability)
+                paragraphs = paragraphs[paragraphs.index(b">") + 1:-len(b"</availability>")]
+                body = body[:end] + paragraphs + body[end:]
+            else:
+                # an empty <availability/>: the paragraphs are appended to a copy of the catalogue
+                tree = copy.deepcopy(response_body)
+                tree.xpath(".//tei:publicationStmt//tei:availability", namespaces=XmlTei.ns)[0].extend(
+                    tei_availability
+                )
+                body = etree.tostring(tree, pretty_print=True)
+
+        response = APIGlobal.set_headers(body, req["format"], status_code)
         return response
 
     @staticmethod
@@ -0,0 +1,123 @@
+from difflib import SequenceMatcher
+from collections import Counter
+import numpy as np
+
+
+# ---------------------------------------------------------
+# an n-gram index of names, to find the names similar to
+# a query without comparing the query to every name
+#
+# used by reconciliator() (through Columns.author_index,
+# the index of the authors of export_item.json)
+#
+# contains:
+# - AuthorIndex
+# ---------------------------------------------------------
+
+
+class AuthorIndex:
+    """
+    a fuzzy index of names. lookup() returns the names whose SequenceMatcher ratio with a query,
+    once both are lowercased, is higher than a cutoff: the same names as comparing the query to
+    every name, but the query is only compared to a few candidates.
+
+    the names are lowercased and deduplicated, and each lowercased name is split into n-grams
+    (bigrams by default), with a marker at its start and end. an inverted index maps each n-gram
+    to the names that contain it, and how many times.
+
+    the candidates are found with a filter that never rejects a matching name:
+    - a ratio higher than the cutoff c implies that the number of characters to insert and delete
+      to turn one name into the other is d < (1 - c) * (len(a) + len(b)). so the lengths of the
+      names can't differ by more than d ;
+    - each edit destroys at most n of the n-grams of a name: two names that are d edits apart
+      share at least max(len(a), len(b)) + n - 1 - n * d n-grams (with the markers, a name of
+      length l has l + n - 1 n-grams).
+    with bigrams, this minimal number of shared n-grams is always positive for c = 0.8: most
+    names don't share enough n-grams with the query and are never compared to it.
+    """
+    start = "\x02"  # markers of the start and end of a name
+    end = "\x03"
+
+    def __init__(self, names, n=2):
+        """
+        :param names: a list of names (the same name can appear several times)
+        :param n: the length of the n-grams
+        """
+        self.n = n
+        self.names = {}  # lowercased name: list of the names with that lowercase
+        for name in names:
+            self.names.setdefault(self.normalize(name), []).append(name)
+        self.keys = list(self.names)  # the lowercased names, in the order of their positions in the index
+        self.lengths = np.array([len(k) for k in self.keys], dtype=np.int64)
+
+        postings = {}  # n-gram: ([positions of the names], [number of times the name contains the n-gram])
+        for position, key in enumerate(self.keys):
+            for gram, count in self.grams(key).items():
+                posting = postings.setdefault(gram, ([], []))
+                posting[0].append(position)
+                posting[1].append(count)
+        self.postings = {
+            gram: (np.array(positions, dtype=np.int64), np.array(counts, dtype=np.int64))
+            for gram, (positions, counts) in postings.items()
+        }
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def normalize(name):
+        """
+        normalize a name the way it is compared by lookup()
+        :param name: the name
+        :return: the normalized name
+        """
+        return name.lower()
+
+    def grams(self, name):
+        """
+        split a normalized name into n-grams
+        :param name: the normalized name
+        :return: a Counter of the n-grams of the name
+        """
+        padded = self.start * (self.n - 1) + name + self.end * (self.n - 1)
+        return Counter(padded[i:i + self.n] for i in range(len(padded) - self.n + 1))
+
+    def candidates(self, query, cutoff):
+        """
+        find the names that could have a ratio higher than cutoff with a query
+        :param query: the normalized query
+        :param cutoff: the minimal ratio
+        :return: an array of the positions of the candidates in self.keys
+        """
+        shared = np.zeros(len(self.keys), dtype=np.int64)  # number of n-grams shared with the query
+        for gram, count in self.grams(query).items():
+            if gram in self.postings:
+                positions, counts = self.postings[gram]
+                shared[positions] += np.minimum(counts, count)
+        # the maximal number of edits between the query and each name, for their ratio to be higher
+        # than cutoff (rounded up, so that floating point errors can only let more candidates in)
+        edits = np.floor((1 - cutoff) * (len(query) + self.lengths) + 1e-9).astype(np.int64)
+        possible = (np.abs(self.lengths - len(query)) <= edits) \
+            & (shared >= np.maximum(self.lengths, len(query)) + self.n - 1 - self.n * edits)
+        return np.flatnonzero(possible)
+
+    def lookup(self, query, cutoff=0.80):
+        """
+        find the names similar to a query: SequenceMatcher(None, name, query).ratio() > cutoff,
+        both the name and the query being normalized
+        :param query: the query
+        :param cutoff: the minimal ratio
+        :return: the list of similar names (as they were given to the index)
+        """
+        query = self.normalize(query)
+        similar = []
+        # like in difflib.get_close_matches(), the query is set once as the 2nd sequence (on which
+        # SequenceMatcher caches its data), and the cheap upper bounds of ratio() are checked first.
+        matcher = SequenceMatcher()
+        matcher.set_seq2(query)
+        for position in self.candidates(query, cutoff):
+            key = self.keys[position]
+            matcher.set_seq1(key)
+            if matcher.real_quick_ratio() > cutoff and matcher.quick_ratio() > cutoff and matcher.ratio() > cutoff:
+                similar.extend(self.names[key])
+        return similar
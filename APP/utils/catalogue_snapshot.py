@@ -0,0 +1,173 @@
+import threading
+import hashlib
+import json
+import glob
+import os
+import re
+
+from .constantes import DATA, CACHE
+
+
+# ---------------------------------------------------------
+# an on-disk snapshot of the metadata of every catalogue,
+# so that the index isn't rebuilt by parsing the whole
+# corpus every time the app is launched
+#
+# used by main_functions.create_index() and
+# main_functions.get_cat_metadata()
+#
+# contains:
+# - CatalogueSnapshot
+# - catalogue_snapshot (the instance shared by the whole app)
+# ---------------------------------------------------------
+
+
+class CatalogueSnapshot:
+    """
+    the output of main_functions.get_metadata() for every catalogue in DATA, saved in
+    a json file. each catalogue is stored with the mtime, size and sha1 hash of its xml
+    file. when the snapshot is refreshed:
+    - if the mtime and size of a file haven't changed, its metadata is reused as is ;
+    - if they have, the file is hashed: if the hash hasn't changed either (the file has
+      been copied or touched), its metadata is reused ;
+    - else, or if the file isn't in the snapshot, its metadata is extracted again.
+    the snapshot is written back to disk only if something has changed.
+
+    snapshot structure:
+    {
+        "version": 1,
+        "catalogues": {
+            "CAT_id": {"mtime": 0, "size": 0, "hash": "sha1", "metadata": {"output of get_metadata()"}},
+            ...
+        }
+    }
+    """
+    version = 1  # to be incremented when the format of the snapshot or of get_metadata() changes
+
+    def __init__(self, fpath):
+        """
+        :param fpath: the path to the json file containing the snapshot
+        """
+        self.fpath = fpath
+        self.catalogues = None  # the content of the snapshot, loaded lazily
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def stamp(fpath):
+        """
+        get the mtime and size of a file
+        :param fpath: the path to the file
+        :return: a tuple (mtime in nanoseconds, size in bytes)
+        """
+        stat = os.stat(fpath)
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def hash(fpath):
+        """
+        hash the content of a file
+        :param fpath: the path to the file
+        :return: the sha1 hash of the file, as an hexadecimal string
+        """
+        sha1 = hashlib.sha1()
+        with open(fpath, mode="rb") as fh:
+            for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def load(self):
+        """
+        load the snapshot from disk. if there is no snapshot or if it can't
+        be used, start from an empty snapshot
+        :return: None
+        """
+        try:
+            with open(self.fpath, mode="r") as fh:
+                snapshot = json.load(fh)
+            if snapshot["version"] == self.version:
+                self.catalogues = snapshot["catalogues"]
+            else:
+                self.catalogues = {}
+        except (OSError, ValueError, KeyError, TypeError):
+            self.catalogues = {}
+        return None
+
+    def save(self):
+        """
+        write the snapshot to disk. the snapshot is written to a temporary file which then
+        replaces the former snapshot, so that a worker never reads a half written file.
+        if the snapshot can't be written (read-only deploy for example), the app still works:
+        the snapshot will just be rebuilt at the next launch.
+        :return: None
+        """
+        tmp = f"{self.fpath}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.fpath), exist_ok=True)
+            with open(tmp, mode="w") as fh:
+                json.dump({"version": self.version, "catalogues": self.catalogues}, fh)
+            os.replace(tmp, self.fpath)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return None
+
+    def refresh(self, extract):
+        """
+        update the snapshot with the catalogues currently in DATA: new and modified catalogues
+        are processed with `extract`, all at once (so that they can be processed in parallel),
+        the others are loaded from the snapshot.
+        :param extract: a function taking a list of paths to catalogues and returning
+                        the list of their metadata, in the same order
+        :return: a dict mapping to each catalogue's id its metadata
+        """
+        with self._lock:
+            if self.catalogues is None:
+                self.load()
+            changed = False
+            catalogues = {}
+            stale = []  # (cat_id, fpath) of the catalogues to extract
+            for fpath in glob.glob(os.path.join(DATA, "CAT_*.xml")):
+                cat_id = re.sub(r"\.xml$", "", os.path.basename(fpath))
+                mtime, size = self.stamp(fpath)
+                entry = self.catalogues.get(cat_id)
+                if entry is None or entry["mtime"] != mtime or entry["size"] != size:
+                    fhash = self.hash(fpath)
+                    if entry is None or entry["hash"] != fhash:
+                        entry = {"hash": fhash, "metadata": None}
+                        stale.append((cat_id, fpath))
+                    entry["mtime"] = mtime
+                    entry["size"] = size
+                    changed = True
+                catalogues[cat_id] = entry
+            if stale:
+                for (cat_id, fpath), metadata in zip(stale, extract([fpath for cat_id, fpath in stale])):
+                    catalogues[cat_id]["metadata"] = metadata
+            # catalogues that have been removed from DATA are removed from the snapshot
+            if changed or len(catalogues) != len(self.catalogues):
+                self.catalogues = catalogues
+                self.save()
+            return {cat_id: entry["metadata"] for cat_id, entry in self.catalogues.items()}
+
+    def get(self, cat_id):
+        """
+        get the metadata of a catalogue from the snapshot, if it is up to date
+        :param cat_id: the catalogue's id
+        :return: the metadata (output of get_metadata()), or None if the catalogue isn't
+                 in the snapshot or if its file has changed since the snapshot was made
+        """
+        with self._lock:
+            if self.catalogues is None:
+                self.load()
+            entry = self.catalogues.get(cat_id)
+        if entry is None:
+            return None
+        try:
+            mtime, size = self.stamp(os.path.join(DATA, f"{cat_id}.xml"))
+        except OSError:
+            return None
+        if entry["mtime"] != mtime or entry["size"] != size:
+            return None
+        return entry["metadata"]
+
+
+catalogue_snapshot = CatalogueSnapshot(os.path.join(CACHE, "catalogue_index.json"))
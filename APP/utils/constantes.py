@@ -6,3 +6,35 @@ TEST = os.path.abspath(os.path.join(ROOT, "test"))  # test directory
 TEMPLATES = os.path.join(ROOT, "templates")  # templates directory
 STATIC = os.path.join(ROOT, "static")  # statics directory
 DATA = os.path.join(ROOT, "data")  # data directory
+CACHE = os.path.join(ROOT, "cache")  # directory for the files derived from the data (snapshots, indexes...)
+
+# budgets of the cache of parsed catalogues (see tree_cache.py). can be overridden with environment variables
+TREE_CACHE_MAX_ENTRIES = int(os.environ.get("KATABASE_TREE_CACHE_ENTRIES", 32))  # max number of parsed catalogues
+TREE_CACHE_MAX_BYTES = int(os.environ.get("KATABASE_TREE_CACHE_BYTES", 64 * 1024 * 1024))  # max size of their xml
+
+# number of processes used to parse the catalogues in bulk (see main_functions.ingest_catalogues()).
+# 1 parses them one after the other, in the current process
+INGEST_WORKERS = int(os.environ.get("KATABASE_INGEST_WORKERS", os.cpu_count() or 1))
+
+# number of threads used to read the catalogues of the results of a search (see main_functions.get_catalogues_entries()).
+# 1 reads them one after the other (the reads are mostly parsing, so threads only help with several cores and slow disks)
+SEARCH_THREADS = int(os.environ.get("KATABASE_SEARCH_THREADS", 1))
+
+# maximal number of searches whose results are kept in memory to move between their pages (see search_cache.py)
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("KATABASE_SEARCH_CACHE_ENTRIES", 64))
+
+# number of processes used to reconcile the whole export_item.json ahead of time
+# (see reconciliator.reconcile_corpus()). 1 reconciles it in the current process
+RECONCILE_WORKERS = int(os.environ.get("KATABASE_RECONCILE_WORKERS", os.cpu_count() or 1))
+# minimal number of entries for the pairs of a search to be scored by RECONCILE_WORKERS processes
+# (see reconciliator.double_loop()). smaller searches are scored in the current process
+RECONCILE_PARALLEL_THRESHOLD = int(os.environ.get("KATABASE_RECONCILE_PARALLEL_THRESHOLD", 2000))
+# time budget of a search, in seconds (see reconciliator.reconciliator()): when it runs out, the pairs that
+# haven't been scored yet are skipped. it must be shorter than the timeout of the gunicorn workers (30s by
+# default). 0 means no budget
+RECONCILE_BUDGET = float(os.environ.get("KATABASE_RECONCILE_BUDGET", 20))
+
+# number of threads running the jobs submitted to the job queue of each app process (see jobs.py),
+# and number of seconds during which the output of a job is kept on disk once it is finished
+JOB_WORKERS = int(os.environ.get("KATABASE_JOB_WORKERS", 2))
+JOB_EXPIRY = int(os.environ.get("KATABASE_JOB_EXPIRY", 24 * 60 * 60))
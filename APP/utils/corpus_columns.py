@@ -0,0 +1,411 @@
+import numpy as np
+import threading
+import bisect
+import json
+import os
+import re
+
+from .constantes import CACHE
+from .corpus_store import item_store
+from .author_index import AuthorIndex
+
+
+# ---------------------------------------------------------
+# a columnar snapshot of export_item.json: one numpy array
+# per field, saved in a single file that every process maps
+# in memory, so that the filters on the whole corpus are run
+# on arrays shared by all the workers instead of looping over
+# every entry of the json in python
+#
+# used by katapi_item(), figmaker_cat() and reconciliator()
+#
+# contains:
+# - save_arrays(), open_arrays()
+# - StringTable
+# - Columns
+# - ItemColumns
+# - item_columns (the instance shared by the whole app)
+# ---------------------------------------------------------
+
+
+ALIGN = 64  # the arrays saved by save_arrays() start on a multiple of ALIGN bytes
+
+
+def save_arrays(fpath, header, arrays):
+    """
+    save numpy arrays in a single file that can be mapped in memory by open_arrays(): 16 bytes
+    giving the length of a json header, the header, and the arrays, each one starting on a
+    multiple of ALIGN bytes. the dtype, offset and length of the arrays are added to the header.
+    the file is written to a temporary file which then replaces the former file, so that a process
+    never opens a half written file. if it can't be written, nothing is saved.
+    :param fpath: the path to the file
+    :param header: a dict of json data to save with the arrays
+    :param arrays: a dict mapping names to 1 dimensional arrays
+    :return: None
+    """
+    header = dict(header, arrays={})
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "offset": offset, "length": len(array)}
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    encoded = json.dumps(header).encode("utf-8")
+    start = -(-(16 + len(encoded)) // ALIGN) * ALIGN  # where the arrays start
+
+    tmp = f"{fpath}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        with open(tmp, mode="wb") as fh:
+            fh.write(b"%016d" % len(encoded))
+            fh.write(encoded)
+            for name, array in arrays.items():
+                fh.seek(start + header["arrays"][name]["offset"])
+                fh.write(array.tobytes())
+            fh.truncate(start + offset)
+        os.replace(tmp, fpath)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return None
+
+
+def open_arrays(fpath):
+    """
+    open a file saved by save_arrays(). the file is mapped in memory with a single read-only
+    numpy.memmap, and the arrays are views on it.
+    :param fpath: the path to the file
+    :return: a tuple (header, arrays), or None if the file doesn't exist or can't be read
+    """
+    try:
+        # the header is read from the mapped file, in case the file is replaced in the meantime
+        buffer = np.memmap(fpath, dtype=np.uint8, mode="r")
+        length = int(buffer[:16].tobytes())
+        header = json.loads(buffer[16:16 + length].tobytes())
+        start = -(-(16 + length) // ALIGN) * ALIGN
+        arrays = {}
+        for name, array in header["arrays"].items():
+            dtype = np.dtype(array["dtype"])
+            offset = start + array["offset"]
+            arrays[name] = buffer[offset:offset + array["length"] * dtype.itemsize].view(dtype)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return header, arrays
+
+
+class StringTable:
+    """
+    a list of strings stored as two arrays: the utf-8 bytes of all the strings,
+    one after the other, and the offset where each string starts in those bytes.
+    string i is data[offsets[i]:offsets[i+1]]
+    """
+    def __init__(self, offsets, data):
+        """
+        :param offsets: an int64 array of len(strings) + 1 offsets
+        :param data: an uint8 array of the bytes of the strings
+        """
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @staticmethod
+    def encode(strings):
+        """
+        build the arrays of a string table
+        :param strings: a list of strings (None is stored as an empty string)
+        :return: a tuple (offsets, data)
+        """
+        encoded = [s.encode("utf-8") if s is not None else b"" for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return offsets, data
+
+
+class Columns:
+    """
+    the columns of export_item.json. row i is the i-th entry of the json, in the order of the file.
+
+    numeric columns (missing values are NaN for floats, -1 for integers):
+    - price, price_c, number_of_pages: float64
+    - sell_year, orig_year: int16. the year at the start of sell_date and date, as read
+      by Match.match_items() (re.match(r"\\d{4}"))
+    - date: int32. the position of the entry's date in self.dates
+    - catalogue: int32. the position of the entry's catalogue id in self.catalogues
+    - author: int32. the position of the entry's author in self.authors
+    - term, format, currency: int32. the position of the entry's value in self.tables[field]
+
+    string tables:
+    - ids: the id of each entry (CAT_\\d+_e\\d+_d\\d+)
+    - authors: each distinct author, once
+    - descs: the desc of each entry
+    - dates: each distinct date, once, in ascending order: the order of the positions in the date
+      column is the order of the dates (as strings)
+
+    sorted indexes, to select the entries whose value is in a range with a binary search
+    instead of comparing every entry (see rows_between()):
+    - {column}_order for each column in Columns.orders: int32. the rows with a value (not -1),
+      sorted by value and then by row
+    """
+    numeric = {
+        "price": np.float64, "price_c": np.float64, "number_of_pages": np.float64,
+        "sell_year": np.int16, "orig_year": np.int16, "date": np.int32, "catalogue": np.int32,
+        "author": np.int32, "term": np.int32, "format": np.int32, "currency": np.int32
+    }
+    strings = ("ids", "authors", "descs", "dates")
+    categories = ("term", "format", "currency")
+    orders = ("sell_year", "orig_year", "date")
+
+    def __init__(self, arrays, catalogues, tables):
+        """
+        :param arrays: a dict mapping each column name in Columns.numeric, "{table}_offsets" and
+                       "{table}_data" for each table in Columns.strings and "{column}_order" for
+                       each column in Columns.orders to its array
+        :param catalogues: the list of catalogue ids
+        :param tables: a dict mapping each field in Columns.categories to the list of its distinct values
+        """
+        for name in self.numeric:
+            setattr(self, name, arrays[name])
+        for name in self.strings:
+            setattr(self, name, StringTable(arrays[f"{name}_offsets"], arrays[f"{name}_data"]))
+        for name in self.orders:
+            setattr(self, f"{name}_order", arrays[f"{name}_order"])
+        self.catalogues = catalogues
+        self.tables = tables
+        self._catalogue_index = {c: i for i, c in enumerate(catalogues)}
+        self._author_index = None
+        self._sorted = {}  # column: its values, in the order of {column}_order
+        self._dates = None  # self.dates as a list
+
+    @property
+    def author_index(self):
+        """
+        the fuzzy index of the distinct authors (see author_index.py), built the first time it is used
+        :return: an AuthorIndex
+        """
+        if self._author_index is None:
+            self._author_index = AuthorIndex(self.authors)
+        return self._author_index
+
+    def __len__(self):
+        return len(self.catalogue)
+
+    @staticmethod
+    def year(value):
+        """
+        read a year at the start of a date (re.match(r"\\d{4}"))
+        :param value: the date
+        :return: the year as an int, or -1 if there is none
+        """
+        if isinstance(value, str):
+            match = re.match(r"\d{4}", value)
+            if match:
+                return int(match[0])
+        return -1
+
+    @staticmethod
+    def build(data):
+        """
+        build the arrays of the columns from the content of export_item.json
+        :param data: the content of export_item.json (a mapping of ids to entries)
+        :return: a tuple (arrays, catalogues, tables), the arguments of Columns()
+        """
+        n = len(data)
+        arrays = {name: np.full(n, np.nan if dtype is np.float64 else -1, dtype=dtype)
+                  for name, dtype in Columns.numeric.items()}
+        catalogues = {}  # catalogue id: position
+        authors = {}  # author: position
+        dates = sorted({entry["date"] for entry in data.values() if entry.get("date") is not None})
+        date_positions = {date: i for i, date in enumerate(dates)}
+        tables = {field: {} for field in Columns.categories}  # value: position
+        ids = []
+        descs = []
+        for i, (key, entry) in enumerate(data.items()):
+            ids.append(key)
+            descs.append(entry.get("desc"))
+            for name in ("price", "price_c", "number_of_pages"):
+                value = entry.get(name)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    arrays[name][i] = value
+            arrays["sell_year"][i] = Columns.year(entry.get("sell_date"))
+            arrays["orig_year"][i] = Columns.year(entry.get("date"))
+            if entry.get("date") is not None:
+                arrays["date"][i] = date_positions[entry["date"]]
+            cat_id = re.match(r"CAT_\d+", key)
+            if cat_id:
+                arrays["catalogue"][i] = catalogues.setdefault(cat_id[0], len(catalogues))
+            if entry.get("author") is not None:
+                arrays["author"][i] = authors.setdefault(entry["author"], len(authors))
+            for field in Columns.categories:
+                if entry.get(field) is not None:
+                    arrays[field][i] = tables[field].setdefault(entry[field], len(tables[field]))
+        for name, strings in (("ids", ids), ("authors", list(authors)), ("descs", descs), ("dates", dates)):
+            arrays[f"{name}_offsets"], arrays[f"{name}_data"] = StringTable.encode(strings)
+        for name in Columns.orders:
+            rows = np.flatnonzero(arrays[name] != -1)
+            # a stable sort keeps the rows of a same value in ascending order
+            arrays[f"{name}_order"] = rows[np.argsort(arrays[name][rows], kind="stable")].astype(np.int32)
+        return arrays, list(catalogues), {field: list(values) for field, values in tables.items()}
+
+    def keys(self, mask):
+        """
+        get the ids of the entries selected by a mask, in the order of the json
+        :param mask: a boolean array, one value per entry
+        :return: a list of ids
+        """
+        return [self.ids[i] for i in np.flatnonzero(mask)]
+
+    def author_mask(self, match):
+        """
+        select the entries whose author matches a condition. the condition is tested
+        once per distinct author, and not once per entry.
+        :param match: a function taking an author (not None) and returning a bool
+        :return: a boolean array, one value per entry (False for entries without an author)
+        """
+        matching = np.zeros(len(self.authors) + 1, dtype=bool)  # the last value is for author == -1
+        matching[:-1] = [match(author) for author in self.authors]
+        return matching[self.author]
+
+    def rows_between(self, name, start, end):
+        """
+        select the entries whose value in a column is in [start, end[, with a binary search
+        in the sorted index of the column: in O(log(n)) plus the number of entries selected
+        :param name: the name of the column, in Columns.orders
+        :param start: the minimal value (included)
+        :param end: the maximal value (excluded)
+        :return: an array of rows, sorted by value and then by row
+        """
+        if name not in self._sorted:
+            self._sorted[name] = getattr(self, name)[getattr(self, f"{name}_order")]
+        values = self._sorted[name]
+        order = getattr(self, f"{name}_order")
+        return order[np.searchsorted(values, start, side="left"):np.searchsorted(values, end, side="left")]
+
+    def date_rows(self, low=None, high=None):
+        """
+        select the entries whose date, compared as a string, is between low and high (included)
+        (see reconciliator.date_bounds()). the bounds are looked up with bisect in self.dates,
+        and the entries with rows_between()
+        :param low: the minimal date, or None
+        :param high: the maximal date, or None
+        :return: an array of rows (the entries without a date are never selected)
+        """
+        if self._dates is None:
+            self._dates = list(self.dates)
+        start = bisect.bisect_left(self._dates, low) if low is not None else 0
+        end = bisect.bisect_right(self._dates, high) if high is not None else len(self._dates)
+        return self.rows_between("date", start, end)
+
+    def mask(self, rows):
+        """
+        turn rows into a mask
+        :param rows: an array of rows
+        :return: a boolean array, one value per entry, True for the rows
+        """
+        mask = np.zeros(len(self), dtype=bool)
+        mask[rows] = True
+        return mask
+
+    def catalogue_mask(self, cat_id):
+        """
+        select the entries of a catalogue
+        :param cat_id: the catalogue's id (CAT_\\d+)
+        :return: a boolean array, one value per entry
+        """
+        if cat_id not in self._catalogue_index:
+            return np.zeros(len(self), dtype=bool)
+        return self.catalogue == self._catalogue_index[cat_id]
+
+
+class ItemColumns:
+    """
+    builds, saves and opens the columnar snapshot of export_item.json.
+
+    the snapshot is a single file (see save_arrays()), whose header stores the mtime and size
+    of the export_item.json it was built from. the file is opened with a single read-only
+    numpy.memmap and each column is a view on it: the pages are shared by all the processes
+    that open the file.
+
+    the snapshot is rebuilt (from item_store) when export_item.json changes. it is written
+    to a temporary file which then replaces the former snapshot ; if it can't be written,
+    the columns are kept in memory only.
+    """
+    version = 2  # to be incremented when the format of the snapshot changes
+
+    def __init__(self, fpath):
+        """
+        :param fpath: the path to the snapshot
+        """
+        self.fpath = fpath
+        self.builds = 0  # number of times the snapshot has been built
+        self._columns = None  # (stamp of export_item.json, Columns)
+        self._lock = threading.Lock()
+
+    def save(self, stamp, arrays, catalogues, tables):
+        """
+        write the snapshot to disk
+        :param stamp: the (mtime, size) of export_item.json
+        :param arrays: see Columns()
+        :param catalogues: see Columns()
+        :param tables: see Columns()
+        :return: None
+        """
+        header = {"version": self.version, "mtime": stamp[0], "size": stamp[1],
+                  "catalogues": catalogues, "tables": tables}
+        save_arrays(self.fpath, header, arrays)
+        return None
+
+    def open(self, stamp):
+        """
+        open the snapshot saved on disk
+        :param stamp: the current (mtime, size) of export_item.json
+        :return: the Columns, or None if there is no snapshot or if it is outdated
+        """
+        saved = open_arrays(self.fpath)
+        if saved is None:
+            return None
+        header, arrays = saved
+        if header.get("version") != self.version or (header.get("mtime"), header.get("size")) != stamp:
+            return None
+        return Columns(arrays, header["catalogues"], header["tables"])
+
+    def get(self):
+        """
+        get the columns of the current export_item.json, opening or building the snapshot if needed
+        :raises FileNotFoundError: if export_item.json doesn't exist
+        :return: the Columns
+        """
+        stamp = item_store.stamp(item_store.fpath)
+        columns = self._columns  # read once: another thread can replace self._columns in the meantime
+        if columns is not None and columns[0] == stamp:
+            return columns[1]
+        with self._lock:
+            columns = self._columns
+            if columns is None or columns[0] != stamp:
+                columns = self.open(stamp)
+                if columns is None:
+                    arrays, catalogues, tables = Columns.build(item_store.get())
+                    self.save(stamp, arrays, catalogues, tables)
+                    self.builds += 1
+                    # use the saved snapshot, so that the pages are shared with the other processes
+                    columns = self.open(stamp) or Columns(arrays, catalogues, tables)
+                columns = (stamp, columns)
+                self._columns = columns
+        return columns[1]
+
+    def refresh(self):
+        """
+        build the snapshot if it doesn't exist or if export_item.json has changed since it was built
+        :return: None
+        """
+        self.get()
+        return None
+
+
+item_columns = ItemColumns(os.path.join(CACHE, "item_columns.bin"))
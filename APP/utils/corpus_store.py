@@ -0,0 +1,170 @@
+from collections.abc import Mapping
+import threading
+import json
+import os
+
+from .constantes import DATA
+
+
+# ---------------------------------------------------------
+# a read-only, in-memory copy of the json exports of the
+# corpus (export_item.json and export_catalog.json), loaded
+# once per process instead of once per request
+#
+# used by figmaker, reconciliator, katapi_item() and
+# katapi_cat_stat()
+#
+# contains:
+# - Entry
+# - CorpusStore
+# - item_store, catalogue_store (the instances shared by the whole app)
+# ---------------------------------------------------------
+
+
+class Entry(Mapping):
+    """
+    a compact, read-only json object, used for every object in the json exports
+    (the exports themselves, their entries and the objects inside the entries).
+
+    an entry is a tuple of values and a shape: a dict mapping the keys to the position
+    of their values in the tuple. the shape is shared by all the entries with the same
+    keys in the same order, so that the keys are stored once per file and not once per
+    entry ; the keys and values are accessed like in a dict (entry["price"], "price" in
+    entry, entry.items()...). the order of the keys is the one in the json file.
+    """
+    __slots__ = ("_shape", "_values")
+
+    def __init__(self, shape, values):
+        """
+        :param shape: a dict mapping each key to the position of its value in values
+        :param values: a tuple of values
+        """
+        self._shape = shape
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._shape[key]]
+
+    def __contains__(self, key):
+        return key in self._shape
+
+    def __iter__(self):
+        return iter(self._shape)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return f"Entry({self.to_dict()!r})"
+
+    def __reduce__(self):
+        # the shape can't be shared across processes: it is rebuilt from the keys
+        return Entry.from_dict, (self.to_dict(),)
+
+    @staticmethod
+    def from_dict(data):
+        """
+        build an entry from a dict
+        :param data: the dict
+        :return: the entry
+        """
+        return Entry({k: i for i, k in enumerate(data.keys())}, tuple(data.values()))
+
+    def to_dict(self):
+        """
+        copy an entry (and the entries inside it) to a dict that can be modified
+        and serialized to json
+        :return: the dict
+        """
+        return {k: v.to_dict() if isinstance(v, Entry) else v for k, v in zip(self._shape, self._values)}
+
+    @staticmethod
+    def load(fh):
+        """
+        decode a json file to entries. the json objects are converted to entries as soon as
+        they are decoded, and their strings and floats are interned: a value that is repeated
+        across the file (an author, a currency, a sell_date, a price...) is stored once.
+        :param fh: the json file, opened in read mode
+        :return: the content of the file, as an entry of entries
+        """
+        shapes = {}  # tuple of keys: shape
+        values = {}  # value: interned value (str and float only, which can't be equal to each other)
+
+        def hook(pairs):
+            keys = tuple(k for k, v in pairs)
+            shape = shapes.get(keys)
+            if shape is None:
+                shape = shapes[keys] = {k: i for i, k in enumerate(keys)}
+            return Entry(shape, tuple(
+                values.setdefault(v, v) if type(v) is str or type(v) is float else v
+                for k, v in pairs
+            ))
+
+        return json.load(fh, object_pairs_hook=hook)
+
+
+class CorpusStore:
+    """
+    a thread-safe store for a json file mapping ids to entries ({"id": {"key": "value"}}).
+
+    the file is decoded the first time it is needed, and then again only if it changes
+    on disk (its mtime or size are different). a new version of the file is fully decoded
+    before it replaces the former one, so that a request always sees a complete version
+    of the data, and a request that started with the former version can keep using it.
+
+    the data is shared by all the threads of a process, so it is exposed as a read-only
+    view: the content of the file is an Entry, and so is each of its entries. to modify
+    or return an entry, make a copy: entry.to_dict().
+    """
+    def __init__(self, fpath):
+        """
+        :param fpath: the path to the json file
+        """
+        self.fpath = fpath
+        self.loads = 0  # number of times the file has been decoded
+        self._data = None  # (stamp of the file, read-only view of its content)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def stamp(fpath):
+        """
+        get the mtime and size of a file
+        :param fpath: the path to the file
+        :return: a tuple (mtime in nanoseconds, size in bytes)
+        """
+        stat = os.stat(fpath)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self):
+        """
+        get the content of the json file, decoding it if it hasn't been decoded
+        yet or if it has changed since it was decoded.
+        :raises FileNotFoundError: if the file doesn't exist
+        :return: a read-only mapping of the ids to their entries (an Entry of Entries)
+        """
+        stamp = self.stamp(self.fpath)
+        data = self._data  # read once: another thread can replace self._data in the meantime
+        if data is not None and data[0] == stamp:
+            return data[1]
+        # only one thread decodes the file ; the others wait for it and use its result
+        with self._lock:
+            data = self._data
+            if data is None or data[0] != stamp:
+                with open(self.fpath, mode="r") as fh:
+                    data = (stamp, Entry.load(fh))
+                self._data = data
+                self.loads += 1
+        return data[1]
+
+    def clear(self):
+        """
+        forget the content of the file: it will be decoded again the next time it is needed
+        :return: None
+        """
+        with self._lock:
+            self._data = None
+        return None
+
+
+item_store = CorpusStore(os.path.join(DATA, "json", "export_item.json"))
+catalogue_store = CorpusStore(os.path.join(DATA, "json", "export_catalog.json"))
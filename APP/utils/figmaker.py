@@ -2,18 +2,16 @@ from statistics import median, mean, quantiles
 from plotly.colors import make_colorscale
 from plotly.subplots import make_subplots
 import plotly.graph_objs as go
-import json
 import re
 import os
 
 from .constantes import TEMPLATES
+from .corpus_store import item_store, catalogue_store
+from .corpus_columns import item_columns
 
 
-# VARIABLES USED BY ALL FUNCTIONS: json, output directory, colors
-with open("APP/data/json/export_catalog.json", mode="r") as f:
-    js_cat = json.load(f)
-with open("APP/data/json/export_item.json", mode="r") as f:
-    js_item = json.load(f)
+# VARIABLES USED BY ALL FUNCTIONS: output directory, colors
+# (the json files are read from the corpus store when the figures are created)
 outdir = os.path.join(TEMPLATES, "partials")
 colors = {"cream": "#fcf8f7", "blue": "#0000ef", "burgundy1": "#890c0c", "burgundy2": "#a41a6a", "pink": "#ff94c9"}
 scale = make_colorscale([colors["blue"], colors["burgundy2"]])  # create a colorscale
@@ -60,6 +58,8 @@ def figmaker_idx():
     :return: figpath (boolean; True if figures are created; False if not)
     """
     # ============== DEFINING VARIABLES ============== #
+    js_cat = catalogue_store.get()  # export_catalog.json
+    js_item = item_store.get()  # export_item.json
     x = []  # x axis of the plot : years
     y_total = []  # first y axis of the plot: total of the sales in a year
     y_avg_cat = []  # y axis of the plot: average sales per catalog in a year
@@ -336,6 +336,8 @@ def figmaker_cat(cat_id):
     :return: figpath (boolean: True if there is price info and a price is created, false if not)
     """
     # ============== DEFINING VARIABLES ============== #
+    js_item = item_store.get()  # export_item.json
+    columns = item_columns.get()  # the columns of export_item.json
     x1 = []  # x axis of the 1st plot (violin plot): the prices of all items in a catalogue
     x2 = []  # x axis of the 2nd plot: tei:name of the most expensive items
     y2 = []  # y axis of the 2nd plot: top 10 prices
@@ -349,8 +351,11 @@ def figmaker_cat(cat_id):
     currency = ""
 
     # ============== PREPARE THE DATA ============== #
+    # only the catalogue's items are looped over: they are selected in the columns of the json
+    cat_items = columns.keys(columns.catalogue_mask(cat_id))
+
     # prepare data for the x1 (the x axis of the first figure)
-    for i in js_item:
+    for i in cat_items:
         if js_item[i]["price"] is not None \
                 and re.match(f"{cat_id}_e\d+(_d\d+)?", i):
             if nloop == 0:
@@ -365,7 +370,7 @@ def figmaker_cat(cat_id):
         top_price = sorted(x1)[-10:]  # 10 highest prices prices
     else:
         top_price = sorted(x1)
-    for i in js_item:
+    for i in cat_items:
         if re.match(f"{cat_id}_e\d+(_d\d+)?", i) \
                 and js_item[i]["price"] is not None \
                 and js_item[i]["price"] in top_price:
@@ -0,0 +1,222 @@
+from lxml import etree
+import threading
+import json
+import glob
+import os
+import re
+
+from .constantes import DATA, CACHE
+
+
+# ---------------------------------------------------------
+# an index of the position of every tei:item inside the
+# xml files, so that a single catalogue entry can be read
+# and parsed without parsing its whole catalogue
+#
+# used by main_functions.get_items() and XmlTei.get_item_from_id()
+#
+# contains:
+# - ItemIndex
+# - item_index (the instance shared by the whole app)
+# ---------------------------------------------------------
+
+
+class ItemIndex:
+    """
+    maps every tei:item's @xml:id (CAT_\\d+_e\\d+) to the bytes where the item starts and ends
+    in its catalogue. there is one index per catalogue, saved as a json file in CACHE/items/
+    with the mtime and size of the catalogue it was built from:
+    {
+        "mtime": 0,
+        "size": 0,
+        "items": {"CAT_id_e1": [start, end], ...}
+    }
+    when a catalogue changes, its index (and only its index) is rebuilt the next time
+    it is used. the indexes are built by scanning the bytes of the catalogues for
+    <item> and </item> tags: no xml is parsed.
+    """
+    tei_open = b'<TEI xmlns="http://www.tei-c.org/ns/1.0">'  # to wrap an item in its namespace before parsing it
+    tei_close = b'</TEI>'
+    tag = re.compile(rb"<(/?)item\b[^>]*?(/?)>")  # an opening, closing or self-closing tei:item tag
+    xmlid = re.compile(rb'\sxml:id="([^"]+)"')
+
+    def __init__(self, dpath):
+        """
+        :param dpath: the directory in which the indexes are saved
+        """
+        self.dpath = dpath
+        self.catalogues = {}  # cat_id: index, for the indexes that have been loaded
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def stamp(fpath):
+        """
+        get the mtime and size of a file
+        :param fpath: the path to the file
+        :return: a tuple (mtime in nanoseconds, size in bytes)
+        """
+        stat = os.stat(fpath)
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def scan(content):
+        """
+        find the position of all tei:items with an @xml:id in a catalogue
+        :param content: the content of the catalogue, as bytes
+        :return: a dict mapping to each item's @xml:id a list [start, end] of byte offsets
+        """
+        items = {}
+        opened = []  # stack of the items that are opened: (@xml:id or None, start)
+        for match in ItemIndex.tag.finditer(content):
+            if match.group(1):  # </item>
+                if opened:
+                    xmlid, start = opened.pop()
+                    if xmlid is not None:
+                        items[xmlid] = [start, match.end()]
+                continue
+            xmlid = ItemIndex.xmlid.search(match.group(0))
+            xmlid = xmlid.group(1).decode("utf-8") if xmlid else None
+            if match.group(2):  # <item/>
+                if xmlid is not None:
+                    items[xmlid] = [match.start(), match.end()]
+            else:
+                opened.append((xmlid, match.start()))
+        return items
+
+    def _save(self, cat_id, index):
+        """
+        write the index of a catalogue to disk. if it can't be written, it will
+        just be rebuilt the next time it is needed.
+        :param cat_id: the catalogue's id
+        :param index: the index to save
+        :return: None
+        """
+        fpath = os.path.join(self.dpath, f"{cat_id}.json")
+        tmp = f"{fpath}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.dpath, exist_ok=True)
+            with open(tmp, mode="w") as fh:
+                json.dump(index, fh)
+            os.replace(tmp, fpath)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return None
+
+    def _load(self, cat_id, stamp):
+        """
+        load the index of a catalogue from disk
+        :param cat_id: the catalogue's id
+        :param stamp: the current (mtime, size) of the catalogue
+        :return: the index, or None if there is no index or if it is outdated
+        """
+        try:
+            with open(os.path.join(self.dpath, f"{cat_id}.json"), mode="r") as fh:
+                index = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if (index.get("mtime"), index.get("size")) != stamp:
+            return None
+        return index
+
+    def get(self, cat_id, keep=True):
+        """
+        get the index of a catalogue, from memory, from disk, or by scanning the catalogue
+        if the index doesn't exist or if the catalogue has changed since it was built.
+        :param cat_id: the catalogue's id
+        :param keep: if True, keep the index in memory
+        :raises FileNotFoundError: if there is no file for that catalogue
+        :return: the index of the catalogue
+        """
+        fpath = os.path.join(DATA, f"{cat_id}.xml")
+        stamp = self.stamp(fpath)
+        with self._lock:
+            index = self.catalogues.get(cat_id)
+        if index is not None and (index["mtime"], index["size"]) == stamp:
+            return index
+
+        index = self._load(cat_id, stamp)
+        if index is None:
+            with open(fpath, mode="rb") as fh:
+                content = fh.read()
+            index = {"mtime": stamp[0], "size": stamp[1], "items": self.scan(content)}
+            self._save(cat_id, index)
+        if keep:
+            with self._lock:
+                self.catalogues[cat_id] = index
+        return index
+
+    def refresh(self):
+        """
+        build the indexes of the catalogues that are new or have changed
+        :return: None
+        """
+        for fpath in glob.glob(os.path.join(DATA, "CAT_*.xml")):
+            self.get(re.sub(r"\.xml$", "", os.path.basename(fpath)), keep=False)
+        return None
+
+    def locate(self, item_id):
+        """
+        find where an item is
+        :param item_id: the tei:item's @xml:id (CAT_\\d+_e\\d+)
+        :return: a tuple (cat_id, start, end), or None if the item isn't in the index
+        """
+        cat_id = re.match(r"CAT_\d+", item_id)[0]
+        try:
+            index = self.get(cat_id)
+        except FileNotFoundError:
+            return None
+        if item_id not in index["items"]:
+            return None
+        start, end = index["items"][item_id]
+        return cat_id, start, end
+
+    def read(self, item_id):
+        """
+        read and parse a single tei:item from its catalogue
+        :param item_id: the tei:item's @xml:id (CAT_\\d+_e\\d+)
+        :return: the tei:item (an lxml element that doesn't belong to any catalogue tree),
+                 or None if it can't be found
+        """
+        return self.read_many([item_id])[item_id]
+
+    def read_many(self, item_ids):
+        """
+        read and parse several tei:items. each catalogue is opened once, and its items
+        are read in the order in which they are in the file
+        :param item_ids: a list of tei:item @xml:ids (CAT_\\d+_e\\d+)
+        :return: a dict mapping each @xml:id to its tei:item (an lxml element that doesn't
+                 belong to any catalogue tree), or to None if it can't be found
+        """
+        items = {item_id: None for item_id in item_ids}
+        catalogues = {}  # cat_id: [(start, end, item_id)]
+        for item_id in items:
+            location = self.locate(item_id)
+            if location is not None:
+                cat_id, start, end = location
+                catalogues.setdefault(cat_id, []).append((start, end, item_id))
+        for cat_id, locations in catalogues.items():
+            with open(os.path.join(DATA, f"{cat_id}.xml"), mode="rb") as fh:
+                for start, end, item_id in sorted(locations):
+                    fh.seek(start)
+                    items[item_id] = self.parse(fh.read(end - start), item_id)
+        return items
+
+    def parse(self, fragment, item_id):
+        """
+        parse a tei:item read from its catalogue
+        :param fragment: the bytes of the item
+        :param item_id: the tei:item's @xml:id
+        :return: the tei:item, or None if it can't be parsed
+        """
+        try:
+            item = etree.fromstring(self.tei_open + fragment + self.tei_close)[0]
+        except (etree.XMLSyntaxError, IndexError):
+            return None
+        # in case the catalogue has been modified while it was read
+        if item.get("{http://www.w3.org/XML/1998/namespace}id") != item_id:
+            return None
+        return item
+
+
+item_index = ItemIndex(os.path.join(CACHE, "items"))
@@ -0,0 +1,212 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+import json
+import time
+import uuid
+import os
+import re
+
+from .constantes import CACHE, JOB_WORKERS, JOB_EXPIRY
+
+
+# ---------------------------------------------------------
+# a local queue of jobs: the long queries (searches, queries
+# of the api) are submitted to a pool of threads, so that the
+# workers serving the app answer at once with the id of the
+# job and stay free for the cheap requests ; the client then
+# polls the status of the job and gets its output when done
+#
+# used by routes_jobs.py
+#
+# contains:
+# - JobQueue
+# - job_queue (the instance shared by the whole app)
+# ---------------------------------------------------------
+
+
+class JobQueue:
+    """
+    a queue of jobs run by a pool of JOB_WORKERS threads. a job is of a kind registered with
+    register(), which names the function running it, and has json serializable parameters.
+
+    the state of the jobs and their outputs are kept on disk, in `dpath`:
+    - {id}.json: the status of the job (see submit()), rewritten at each change of its state
+      and at each step of the job
+    - {id}.result: the output of the job, once it is done
+    so that the status and the output of a job can be read by any process of the app (and not
+    only by the one running it). both files are written to a temporary file first and then
+    moved, so that they are never read half written.
+
+    a job expires JOB_EXPIRY seconds after it is finished (or after it is submitted, if the
+    process running it has stopped before it is finished): its files are removed when they
+    are accessed or when another job is submitted (see purge()).
+    """
+    states = ("queued", "running", "done", "failed")
+
+    def __init__(self, dpath, workers=JOB_WORKERS, expiry=JOB_EXPIRY):
+        """
+        :param dpath: the path to the directory containing the jobs
+        :param workers: the number of threads running the jobs
+        :param expiry: the number of seconds during which a finished job is kept
+        """
+        self.dpath = dpath
+        self.workers = workers
+        self.expiry = expiry
+        self.kinds = {}  # kind of job: function running it
+        self._executor = None  # created by the first job (after the app processes are forked by gunicorn)
+        self._lock = threading.Lock()
+
+    def register(self, kind, run):
+        """
+        register a kind of job
+        :param kind: the name of the kind of job
+        :param run: the function running a job: run(params, progress) returns the output of the job, a
+                    tuple (data, mimetype, status_code) where data is bytes. progress(step) can be called
+                    with the name of the current step of the job, which is reported in its status
+        :return: None
+        """
+        self.kinds[kind] = run
+        return None
+
+    def submit(self, kind, params):
+        """
+        add a job to the queue
+        :param kind: the kind of job (see register())
+        :param params: the parameters of the job, json serializable
+        :return: the status of the job, with its id
+        """
+        if kind not in self.kinds:
+            raise KeyError(f"unknown kind of job: {kind}")
+        self.purge()
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "params": params,
+            "state": "queued",
+            "step": None,  # the current step of a running job
+            "submitted": now,  # times are in seconds since the epoch
+            "started": None,
+            "finished": None,
+            "expires": now + self.expiry,
+            "mimetype": None,  # the mimetype and http status code of the output of a done job
+            "status_code": None,
+            "error": None  # the error of a failed job
+        }
+        self._write_status(job)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+            self._executor.submit(self._run, dict(job))
+        return job
+
+    def status(self, job_id):
+        """
+        get the status of a job
+        :param job_id: the id of the job
+        :return: the status of the job (see submit()), or None if there is no such job or if it has expired
+        """
+        if not re.match(r"^[0-9a-f]{32}$", job_id):  # the ids are used in paths
+            return None
+        try:
+            with open(self._path(job_id, "json"), mode="r") as fh:
+                job = json.load(fh)
+        except FileNotFoundError:
+            return None
+        if job["expires"] < time.time():
+            self._remove(job_id)
+            return None
+        return job
+
+    def result_path(self, job_id):
+        """
+        :param job_id: the id of a done job
+        :return: the path to the output of the job
+        """
+        return self._path(job_id, "result")
+
+    def purge(self):
+        """
+        remove the expired jobs
+        :return: the number of jobs removed
+        """
+        removed = 0
+        if not os.path.isdir(self.dpath):
+            return removed
+        now = time.time()
+        for fname in os.listdir(self.dpath):
+            job_id, ext = os.path.splitext(fname)
+            if ext != ".json":
+                continue
+            try:
+                with open(os.path.join(self.dpath, fname), mode="r") as fh:
+                    expires = json.load(fh)["expires"]
+            except (OSError, ValueError, KeyError):  # removed or replaced in the meantime
+                continue
+            if expires < now:
+                self._remove(job_id)
+                removed += 1
+        return removed
+
+    def _run(self, job):
+        """
+        run a job in a thread of the pool and record its state
+        :param job: the status of the job
+        :return: None
+        """
+        job.update(state="running", started=time.time())
+        self._write_status(job)
+
+        def progress(step):
+            job["step"] = step
+            self._write_status(job)
+
+        try:
+            data, mimetype, status_code = self.kinds[job["kind"]](job["params"], progress)
+        except Exception as e:
+            logging.getLogger(__name__).exception(f"job {job['id']} ({job['kind']}) failed")
+            job.update(state="failed", error=f"{type(e).__name__}: {e}")
+        else:
+            self._write(self.result_path(job["id"]), data)
+            job.update(state="done", mimetype=mimetype, status_code=status_code)
+        job["finished"] = time.time()
+        job["expires"] = job["finished"] + self.expiry
+        self._write_status(job)
+        return None
+
+    def _path(self, job_id, ext):
+        return os.path.join(self.dpath, f"{job_id}.{ext}")
+
+    def _write_status(self, job):
+        self._write(self._path(job["id"], "json"), json.dumps(job).encode("utf-8"))
+        return None
+
+    def _write(self, fpath, data):
+        """
+        write a file atomically: write a temporary file and move it
+        :param fpath: the path to the file
+        :param data: the content of the file, as bytes
+        :return: None
+        """
+        os.makedirs(self.dpath, exist_ok=True)
+        tmp = f"{fpath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, mode="wb") as fh:
+                fh.write(data)
+            os.replace(tmp, fpath)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return None
+
+    def _remove(self, job_id):
+        for ext in ("result", "json"):
+            try:
+                os.remove(self._path(job_id, ext))
+            except FileNotFoundError:
+                pass
+        return None
+
+
+job_queue = JobQueue(os.path.join(CACHE, "jobs"))
@@ -1,14 +1,69 @@
 from lxml import etree
 import os
-import glob
+import itertools
 import traceback
 import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-from .constantes import DATA
+from .constantes import DATA, INGEST_WORKERS, SEARCH_THREADS
+from .tree_cache import tree_cache
+from .catalogue_snapshot import catalogue_snapshot
+from .item_index import item_index
 
 
 # Namespace definition :
 ns = {'tei': 'http://www.tei-c.org/ns/1.0'}
+XML_NS = 'http://www.w3.org/XML/1998/namespace'  # namespace of @xml:id
+
+# Size of the chunks read by parse_header() (most teiHeaders fit in the first chunks).
+HEADER_CHUNK_SIZE = 16 * 1024
+
+
+# Registry of the XPath expressions used by get_metadata(), compiled once when the module is imported.
+# The first expressions locate the sections of the teiHeader ; the others are evaluated
+# from these sections (or from a tei:witness, for the "ms_*", "desc" and "ptr" expressions).
+metadata_xpaths = {
+    name: etree.XPath(expression, namespaces=ns) for name, expression in {
+        # Sections of the teiHeader.
+        "teiHeader": "/tei:TEI/tei:teiHeader",
+        "titleStmt": ".//tei:titleStmt",
+        "sourceDesc": ".//tei:sourceDesc",
+        "publicationStmt": ".//tei:publicationStmt",
+        # From the tei:titleStmt.
+        "main_title": ".//tei:title/text()",
+        "encoder": ".//tei:respStmt/tei:persName/text()",
+        # From the tei:publicationStmt.
+        "XML_publisher": ".//tei:publisher/text()",
+        "licence": ".//tei:licence/text()",
+        # From the tei:sourceDesc.
+        "title": ".//tei:bibl/tei:title/text()",
+        "num": ".//tei:bibl/tei:num/text()",
+        "editor": ".//tei:bibl/tei:editor/text()",
+        "publisher": ".//tei:bibl/tei:publisher/text()",
+        "pubPlace": ".//tei:bibl/tei:pubPlace/text()",
+        "date": ".//tei:bibl/tei:date",
+        "date_text": ".//tei:bibl/tei:date/text()",
+        "date_when": ".//tei:bibl/tei:date/@when",
+        "date_to": ".//tei:bibl/tei:date/@to",
+        "auction": './/tei:event[@type="auction"]',
+        "auction_place": './/tei:event[@type="auction"]//tei:addrLine/text()',
+        "auctioneer": './/tei:event[@type="auction"]//tei:persName[@type="auctioneer"]/text()',
+        "expert": './/tei:event[@type="auction"]//tei:persName[@type="expert"]/text()',
+        "collector": './/tei:event[@type="auction"]//tei:persName[@type="collector"]/text()',
+        "auction_date": './/tei:event[@type="auction"]//tei:date/text()',
+        "msDesc": ".//tei:listWit//tei:msDesc",
+        "witness": ".//tei:listWit/tei:witness",
+        # From a tei:witness.
+        "ms_country": ".//tei:country/text()",
+        "ms_settlement": ".//tei:settlement/text()",
+        "ms_repository": ".//tei:repository/text()",
+        "ms_institution": ".//tei:institution/text()",
+        "ms_idno": ".//tei:idno/text()",
+        "desc": ".//tei:desc/text()",
+        "ptr": "./tei:ptr",
+    }.items()
+}
 
 
 # ======= FUNCTIONS USED TO OPEN XML FILES ======= #
@@ -38,36 +93,57 @@ def validate_entry_id(id):
 def open_file(good_id):
     """
     This function opens the file that matches the id in oder to be able to parse it.
+    The parsed file is retrieved from the cache of parsed catalogues (see tree_cache.py):
+    it is shared between requests and must not be modified.
     :param good_id: an id created before
     :return: the matching file parsed by lxml
     """
-    file = DATA + "/" + good_id + ".xml"
-    return etree.parse(file)
+    return tree_cache.get(good_id)
+
+
+def parse_header(file):
+    """
+    This function parses the teiHeader of a file only: the file is pull-parsed chunk by chunk
+    and the parsing stops as soon as the end of the teiHeader is reached, so that the
+    tei:items of the catalogue are never (or barely) parsed. The tree that is returned
+    can be used with get_metadata(), which only reads the teiHeader.
+    :param file: the path to an XML file
+    :return: the partially parsed file
+    """
+    parser = etree.XMLPullParser(events=("end",), tag="{%s}teiHeader" % ns["tei"])
+    with open(file, mode="rb") as fh:
+        for chunk in iter(lambda: fh.read(HEADER_CHUNK_SIZE), b""):
+            parser.feed(chunk)
+            for event, header in parser.read_events():
+                return header.getroottree()
+    # There is no teiHeader: the whole file has been parsed.
+    return etree.ElementTree(parser.close())
 
 
 # ======= FUNCTIONS USED TO GENERATE AN INDEX ======= #
 
-def create_index():
+def create_index(workers=INGEST_WORKERS):
     """
     This function creates an index of all catalogues to display.
+    The metadata of the catalogues is read from an on-disk snapshot (see catalogue_snapshot.py):
+    only the catalogues that are new or have changed since the last launch are parsed.
+    :param workers: the number of processes used to parse these catalogues (see ingest_catalogues())
     :return: a list of ids, one id per catalogue.
     """
     index = []
     # Only catalogues that have been tagged are displayed.
-    files = glob.glob(os.path.join(DATA, "CAT_*.xml"))
-    for file in files:
+    catalogues = catalogue_snapshot.refresh(
+        lambda files: [catalogue["metadata"] for catalogue in ingest_catalogues(files, workers=workers, sort=False)]
+    )
+    for file_id, metadata in catalogues.items():
         file_info = {}
-        file_id = os.path.basename(file)
-        file_id = re.sub(r"\.xml$", "", file_id)
         file_info["id"] = file_id
         # The main title is used.
-        opened_file = open_file(file_id)
-        metadata = get_metadata(opened_file)
         file_info["title"] = metadata["main_title"]
         try:
             file_info["date"] = metadata["date"]
         except:
-            print(file)
+            print(file_id)
             print(traceback.format_exc())
         if 'publisher' in metadata:
             file_info["publisher"] = metadata["publisher"]
@@ -77,90 +153,171 @@ def create_index():
     return index
 
 
+def extract_metadata(file):
+    """
+    This function extracts the metadata of a catalogue to build the snapshot used by create_index().
+    Only the teiHeader is parsed, and not through the cache of parsed catalogues, to avoid
+    filling the cache with every catalogue of the corpus.
+    :param file: the path to an XML file
+    :return: a dictionary containing the metadata
+    """
+    return get_metadata(parse_header(file))
+
+
+def ingest_catalogue(file, entries=False):
+    """
+    This function extracts the metadata and, if asked, the entries of a catalogue.
+    It is the unit of work of ingest_catalogues(), and must stay a top-level function
+    so that it can be sent to another process.
+    :param file: the path to an XML file
+    :param entries: if True, the entries are extracted as well (the whole file is parsed)
+    :return: a dictionary {"id": the catalogue's id, "metadata": {...}, "entries": [...]}
+             ("entries" is only there if entries is True)
+    """
+    catalogue = {"id": re.sub(r"\.xml$", "", os.path.basename(file))}
+    if entries:
+        # The catalogues are not parsed through the cache of parsed catalogues, for the same reason
+        # as in extract_metadata(): a bulk extraction would only fill it with every catalogue.
+        tree = etree.parse(file)
+        catalogue["metadata"] = get_metadata(tree)
+        catalogue["entries"] = get_entries(tree)
+    else:
+        catalogue["metadata"] = extract_metadata(file)
+    return catalogue
+
+
+def ingest_catalogues(files, workers=INGEST_WORKERS, entries=False, sort=True):
+    """
+    This function extracts the metadata (and, if asked, the entries) of several catalogues.
+    If workers > 1, the catalogues are parsed in parallel by a pool of processes. The output
+    is the same as with workers=1: the results are merged in the same order, whatever the
+    order in which the processes finish. If the pool can't be started, the catalogues are
+    parsed in the current process.
+    :param files: a list of paths to XML files
+    :param workers: the number of processes to use
+    :param entries: if True, the entries are extracted as well (see ingest_catalogue())
+    :param sort: if True, the results are sorted by catalogue id ; else they are in the order of files
+    :return: a list of dictionaries, one per catalogue (output of ingest_catalogue())
+    """
+    files = list(files)
+    workers = min(workers, len(files))
+    catalogues = None
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # Executor.map() yields the results in the order of the input.
+                catalogues = list(pool.map(
+                    ingest_catalogue, files, itertools.repeat(entries),
+                    chunksize=max(1, len(files) // (workers * 4))
+                ))
+        except (OSError, NotImplementedError, BrokenProcessPool):
+            # No process can be started (sandboxed deploy for example).
+            catalogues = None
+    if catalogues is None:
+        catalogues = [ingest_catalogue(file, entries) for file in files]
+    if sort:
+        catalogues = sorted(catalogues, key=lambda c: c["id"])
+    return catalogues
+
+
+def get_cat_metadata(good_id):
+    """
+    This function retrieves the metadata of a catalogue from the snapshot built by create_index().
+    If the catalogue isn't in the snapshot or has changed since, it is extracted from the file.
+    :param good_id: an id created before
+    :return: a dictionary containing the metadata
+    """
+    metadata = catalogue_snapshot.get(good_id)
+    if metadata is None:
+        metadata = extract_metadata(DATA + "/" + good_id + ".xml")
+    return metadata
+
+
 # ======= FUNCTIONS USED TO GET INFORMATIONS ======= #
 
 def get_metadata(file):
     """
     This function retrieves metadata from the file.
+    The sections of the teiHeader are located once, and each expression of the registry of
+    compiled XPath expressions (see metadata_xpaths) is evaluated once, from the relevant section.
     :param file: an XML file
     :return: a dictionary containing the metadata
     """
+    xp = metadata_xpaths
     metadata = {}
+    # The sections are searched in the teiHeader only, so that the tei:text isn't scanned ;
+    # if the file has no teiHeader at its root, they are searched in the whole file.
+    header = xp["teiHeader"](file) or [file]
+    title_stmts = [s for h in header for s in xp["titleStmt"](h)]
+    source_descs = [s for h in header for s in xp["sourceDesc"](h)]
+    publication_stmts = [s for h in header for s in xp["publicationStmt"](h)]
+
+    def select(name, sections):
+        # The results of an expression, evaluated from each section, in document order.
+        results = []
+        for section in sections:
+            results.extend(xp[name](section))
+        return results
+
+    def first(key, name, sections):
+        # The first result of an expression is saved in metadata, if there is one.
+        results = select(name, sections)
+        if results:
+            metadata[key] = results[0]
+
     # Information about the printed publication.
-    if file.xpath('//tei:titleStmt//tei:title/text()', namespaces=ns):
-        metadata["main_title"] = file.xpath('//tei:titleStmt//tei:title/text()', namespaces=ns)[0]
-    if file.xpath('//tei:sourceDesc//tei:bibl/tei:title/text()', namespaces=ns):
-        metadata["title"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:title/text()', namespaces=ns)[0]
-    if file.xpath('//tei:sourceDesc//tei:bibl/tei:num/text()', namespaces=ns):
-        metadata["num"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:num/text()', namespaces=ns)[0]
-    if file.xpath('//tei:sourceDesc//tei:bibl/tei:editor/text()', namespaces=ns):
-        metadata["editor"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:editor/text()', namespaces=ns)[0]
-    if file.xpath('//tei:sourceDesc//tei:bibl/tei:publisher/text()', namespaces=ns):
-        metadata["publisher"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:publisher/text()', namespaces=ns)[0]
-    if file.xpath('//tei:sourceDesc//tei:bibl/tei:pubPlace/text()', namespaces=ns):
-        metadata["pubPlace"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:pubPlace/text()', namespaces=ns)[0]
-    if file.xpath('//tei:sourceDesc//tei:bibl/tei:date', namespaces=ns):
+    first("main_title", "main_title", title_stmts)
+    first("title", "title", source_descs)
+    first("num", "num", source_descs)
+    first("editor", "editor", source_descs)
+    first("publisher", "publisher", source_descs)
+    first("pubPlace", "pubPlace", source_descs)
+    if select("date", source_descs):
         try:
-            metadata["date"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:date/text()', namespaces=ns)[0]
+            metadata["date"] = select("date_text", source_descs)[0]
         except:
-            metadata["date"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:date/@when', namespaces=ns)[0]
-    if file.xpath('//tei:sourceDesc//tei:bibl/tei:date/@when', namespaces=ns):
-        metadata["norm_date"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:date/@when', namespaces=ns)[0]
-    if file.xpath('//tei:sourceDesc//tei:bibl/tei:date/@to', namespaces=ns):
-        metadata["norm_date"] = file.xpath('//tei:sourceDesc//tei:bibl/tei:date/@to', namespaces=ns)[0]
+            metadata["date"] = select("date_when", source_descs)[0]
+    first("norm_date", "date_when", source_descs)
+    first("norm_date", "date_to", source_descs)
 
     # Information about the digital publication.
-    if file.xpath('//tei:titleStmt//tei:respStmt/tei:persName/text()', namespaces=ns):
-        metadata["encoder"] = file.xpath('//tei:titleStmt//tei:respStmt/tei:persName/text()', namespaces=ns)[0]
-    if file.xpath('//tei:publicationStmt//tei:publisher/text()', namespaces=ns):
-        metadata["XML_publisher"] = file.xpath('//tei:publicationStmt//tei:publisher/text()', namespaces=ns)[0]
-    if file.xpath('//tei:publicationStmt//tei:licence/text()', namespaces=ns):
-        metadata["licence"] = file.xpath('//tei:publicationStmt//tei:licence/text()', namespaces=ns)[0]
+    first("encoder", "encoder", title_stmts)
+    first("XML_publisher", "XML_publisher", publication_stmts)
+    first("licence", "licence", publication_stmts)
 
     # Information about the auction.
-    if file.xpath('//tei:sourceDesc//tei:event[@type="auction"]', namespaces=ns):
-        if file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:addrLine/text()', namespaces=ns):
-            metadata["auction_place"] = file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:addrLine/text()', namespaces=ns)[0]
-        if file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:persName[@type="auctioneer"]/text()', namespaces=ns):
-            metadata["auctioneer"] = file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:persName[@type="auctioneer"]/text()', namespaces=ns)
-        if file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:persName[@type="expert"]/text()', namespaces=ns):
-            metadata["expert"] = file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:persName[@type="expert"]/text()', namespaces=ns)
-        if file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:persName[@type="collector"]/text()', namespaces=ns):
-            metadata["collector"] = file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:persName[@type="collector"]/text()', namespaces=ns)
-        if file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:date/text()', namespaces=ns):
-            metadata["auction_date"] = file.xpath('//tei:sourceDesc//tei:event[@type="auction"]//tei:date/text()', namespaces=ns)[0]
+    if select("auction", source_descs):
+        first("auction_place", "auction_place", source_descs)
+        for key in ["auctioneer", "expert", "collector"]:
+            # All the names are kept.
+            names = select(key, source_descs)
+            if names:
+                metadata[key] = names
+        first("auction_date", "auction_date", source_descs)
 
     # Information about the witness(es)
-    if file.xpath('//tei:sourceDesc//tei:listWit//tei:msDesc', namespaces=ns):
-        witnesses = file.xpath('//tei:sourceDesc//tei:listWit/tei:witness', namespaces=ns)
+    if select("msDesc", source_descs):
         witnesses_list = []
-        for witness in witnesses:
+        for witness in select("witness", source_descs):
             witness_dict = {}
-            if witness.xpath('.//tei:country/text()', namespaces=ns):
-                witness_dict["ms_country"] = witness.xpath('.//tei:country/text()', namespaces=ns)[0]
-            if witness.xpath('.//tei:settlement/text()', namespaces=ns):
-                witness_dict["ms_settlement"] = witness.xpath('.//tei:settlement/text()', namespaces=ns)[0]
-            if witness.xpath('.//tei:repository/text()', namespaces=ns):
-                witness_dict["ms_repository"] = witness.xpath('.//tei:repository/text()', namespaces=ns)[0]
-            if witness.xpath('.//tei:institution/text()', namespaces=ns):
-                witness_dict["ms_institution"] = witness.xpath('.//tei:institution/text()', namespaces=ns)[0]
-            if witness.xpath('.//tei:idno/text()', namespaces=ns):
-                witness_dict["ms_idno"] = witness.xpath('.//tei:idno/text()', namespaces=ns)[0]
-            if witness.xpath('.//tei:desc/text()', namespaces=ns):
-                witness_dict["desc"] = witness.xpath('.//tei:desc/text()', namespaces=ns)[0]
+            for key in ["ms_country", "ms_settlement", "ms_repository", "ms_institution", "ms_idno", "desc"]:
+                results = xp[key](witness)
+                if results:
+                    witness_dict[key] = results[0]
             # Sometimes, there are multiple pointers for a single witness.
-            if witness.xpath('./tei:ptr', namespaces=ns):
-                ptrs = witness.xpath('./tei:ptr', namespaces=ns)
+            ptrs = xp["ptr"](witness)
+            if ptrs:
                 ptrs_list = []
                 for ptr in ptrs:
                     ptr_dict = {}
-                    if ptr.xpath('./@type', namespaces=ns):
-                        if ptr.xpath('./@type', namespaces=ns)[0] == "digit":
+                    ptr_type = ptr.get("type")
+                    if ptr_type is not None:
+                        if ptr_type == "digit":
                             ptr_dict["ptr_type"] = "digital version"
                         else:
-                            ptr_dict["ptr_type"] = ptr.xpath('./@type', namespaces=ns)[0]
-                    if ptr.xpath('./@target', namespaces=ns):
-                        ptr_dict["ptr_target"] = ptr.xpath('./@target', namespaces=ns)[0]
+                            ptr_dict["ptr_type"] = ptr_type
+                    if ptr.get("target") is not None:
+                        ptr_dict["ptr_target"] = ptr.get("target")
                     ptrs_list.append(ptr_dict)
                 witness_dict["ptr"] = ptrs_list
 
@@ -177,16 +334,24 @@ def get_entries(file):
     :param file: an XML file
     :return: a dictionary of dictionaries containing the entries
     """
-    item_list = []
-    # Only items with an @xml:id are used.
-    items = file.xpath('//tei:text//tei:item[@xml:id]', namespaces=ns)
+    return list(iter_entries(file))
 
-    for item in items:
-        data = get_entry(item)
 
-        item_list.append(data)
+def iter_entries(file, start=0, stop=None):
+    """
+    This function retrieves entries from the file one by one: the items are found and turned
+    into dictionaries lazily, as the entries are consumed. Only the entries between start and stop
+    are retrieved (the items before start are skipped without being read).
+    :param file: an XML file
+    :param start: the position of the first entry to retrieve
+    :param stop: the position after the last entry to retrieve (None to retrieve all entries)
+    :return: a generator of dictionaries, one per entry
+    """
+    # Only items with an @xml:id are used.
+    items = file.iterfind('.//{%s}text//{%s}item[@{%s}id]' % (ns["tei"], ns["tei"], XML_NS))
 
-    return item_list
+    for item in itertools.islice(items, start, stop):
+        yield get_entry(item)
 
 
 def get_entry(item):
@@ -229,15 +394,46 @@ def get_entry(item):
                 # Desc information are contained in a dictionary.
                 desc_dict = {}
                 desc_dict["id"] = desc.xpath('./@xml:id', namespaces=ns)[0]
-                # strip_tags is used to remove children tags of a tag, keeping the text.
-                etree.strip_tags(desc, '{http://www.tei-c.org/ns/1.0}*')
-                desc_dict["text"] = desc.text
+                # The text is read without removing the children tags, so that the tree stays untouched.
+                desc_dict["text"] = get_text(desc)
                 descs_list.append(desc_dict)
             data["desc"] = descs_list
 
     return data
 
 
+def get_text(element):
+    """
+    This function retrieves the text of an element and of its TEI children, as it would be
+    after removing the children tags with etree.strip_tags(), but without modifying the tree.
+    As with strip_tags(), the text stops at the first child that is not a TEI element
+    (a comment, for example), since only the TEI tags would have been removed.
+    :param element: an XML element
+    :return: a string, or None if there is no text
+    """
+    chunks = [element.text or ""]
+    _get_children_text(element, chunks)
+    text = "".join(chunks)
+    return text if text else None
+
+
+def _get_children_text(element, chunks):
+    """
+    This function adds to chunks the text and tail of the TEI children of an element, in document order.
+    :param element: an XML element
+    :param chunks: the list of strings retrieved so far
+    :return: True if a child that is not a TEI element has been met (and the text stops there), else False
+    """
+    for child in element:
+        if not isinstance(child.tag, str) or not child.tag.startswith("{%s}" % ns["tei"]):
+            return True
+        chunks.append(child.text or "")
+        if _get_children_text(child, chunks):
+            return True
+        chunks.append(child.tail or "")
+    return False
+
+
 def id_to_item(file, id):
     """
     This function transforms an id into an XML item to be parsed.
@@ -253,3 +449,68 @@ def id_to_item(file, id):
         return item[0]
     except IndexError:
         return None
+
+
+def get_items(ids):
+    """
+    This function transforms ids into XML items to be parsed, without opening their whole files: only the
+    items are read from the files, using the index of the items' positions (see item_index.py). The items
+    of a catalogue are read in a single pass over its file, and an item is read once, even if several of
+    its descs are in ids.
+    :param ids: a list of strings
+    :return: a dictionary mapping each id to its item to be parsed
+    """
+    # First, the id of a desc element is changed to the id of its entry.
+    id_entries = {id: re.match("CAT_[0-9]+_e[0-9]+", id)[0] for id in ids}
+
+    items = item_index.read_many(list(dict.fromkeys(id_entries.values())))
+    # If an item can't be read alone, it is searched in the whole file.
+    for id_entry, item in items.items():
+        if item is None:
+            items[id_entry] = id_to_item(open_file(validate_id(id_entry)), id_entry)
+    return {id: items[id_entry] for id, id_entry in id_entries.items()}
+
+
+def get_catalogue_entries(good_id, ids):
+    """
+    This function retrieves the metadata of a catalogue and the data of some of its items (see get_entry()).
+    Each item is read and its data retrieved once, even if several of its descs are in ids: the descs of
+    an item share the same dictionary.
+    :param good_id: an id created before
+    :param ids: a list of ids of the catalogue's descs
+    :return: a tuple (dictionary containing the metadata, dictionary mapping each id to the data of its item)
+    """
+    metadata = get_cat_metadata(good_id)
+    items = get_items(ids)
+    entries = {}  # id of an item: its data
+    data = {}
+    for id, item in items.items():
+        id_entry = re.match("CAT_[0-9]+_e[0-9]+", id)[0]
+        if id_entry not in entries:
+            entries[id_entry] = get_entry(item)
+        data[id] = entries[id_entry]
+    return metadata, data
+
+
+def get_catalogues_entries(ids, workers=SEARCH_THREADS):
+    """
+    This function runs get_catalogue_entries() for the descs of several catalogues: the ids are grouped
+    by catalogue, so that each catalogue is read once, whatever the number of its descs in ids. If
+    workers > 1, the catalogues are read concurrently by a pool of threads.
+    :param ids: a list of ids of descs
+    :param workers: the number of threads to use
+    :return: a dictionary mapping each id to a tuple (metadata of its catalogue, data of its item)
+    """
+    catalogues = {}  # id of a catalogue: ids of its descs
+    for id in ids:
+        catalogues.setdefault(validate_id(id), []).append(id)
+    if workers > 1 and len(catalogues) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(catalogues))) as pool:
+            results = list(pool.map(get_catalogue_entries, catalogues.keys(), catalogues.values()))
+    else:
+        results = [get_catalogue_entries(good_id, cat_ids) for good_id, cat_ids in catalogues.items()]
+    decorations = {}
+    for metadata, data in results:
+        for id, entry in data.items():
+            decorations[id] = metadata, entry
+    return decorations
@@ -0,0 +1,93 @@
+from contextlib import contextmanager
+import logging
+import time
+
+
+# ---------------------------------------------------------
+# the time spent in each phase of a reconciliation and the
+# counts of what it has processed (entries, pairs...), to
+# see which phase dominates for a search
+#
+# used by reconciliator() ; the profile is displayed on the
+# Search page in debug mode and logged by search(), and its
+# phases are the progress of the search jobs
+#
+# contains:
+# - Profile
+# - profile_logger (the logger of the profiles of the searches)
+# ---------------------------------------------------------
+
+
+class Profile:
+    """
+    the profile of a reconciliation: the time spent in named phases (in the order in which they
+    first start) and named counters. a phase can be timed several times: its times are added.
+    a phase is timed with a `with profile.phase("name"):` block, a counter is set with profile.count().
+
+    the counters of a search (see reconciliator.double_loop() and reconciliator.score_pairs()):
+    - entries: the number of entries of the search
+    - pairs: the number of pairs of entries
+    - considered: the number of candidate pairs (sharing a block key) ; pruned: the other pairs
+    - author_rejected_after_bound: the number of candidate pairs whose score could still be higher than
+      the threshold, but whose authors are too different. the candidate pairs rejected by the bound on
+      their score don't have their authors compared: they aren't counted
+    - scored: the number of pairs whose descs have been compared
+    - precomputed: the number of pairs read from the reconciliation computed ahead of time, if any
+    - clusters: the number of groups of entries
+    """
+    def __init__(self, on_phase=None):
+        """
+        :param on_phase: a function called with the name of each phase when it starts, or None
+                         (used to report the progress of a reconciliation run as a job, see routes_jobs.py)
+        """
+        self.phases = {}  # name: time spent in the phase, in seconds
+        self.counters = {}  # name: count
+        self.on_phase = on_phase
+
+    @contextmanager
+    def phase(self, name):
+        """
+        time a phase: the time spent in the `with` block is added to the phase
+        :param name: the name of the phase
+        """
+        if self.on_phase is not None:
+            self.on_phase(name)
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - start
+
+    def count(self, name, n=1):
+        """
+        add n to a counter
+        :param name: the name of the counter
+        :param n: the number to add
+        :return: None
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+        return None
+
+    def total(self):
+        """
+        :return: the time spent in all the phases, in seconds
+        """
+        return sum(self.phases.values())
+
+    def to_dict(self):
+        """
+        :return: the profile as a json serializable dict
+        """
+        return {"phases": dict(self.phases), "counters": dict(self.counters), "total": self.total()}
+
+
+# The profiles are logged at the INFO level, which the logger of the app only emits in debug mode (its
+# level is WARNING otherwise): they have a logger of their own, which writes them to stderr (the error
+# log of gunicorn) whatever the mode of the app.
+profile_logger = logging.getLogger("katabase.profile")
+profile_logger.setLevel(logging.INFO)
+profile_logger.propagate = False
+if not profile_logger.handlers:
+    profile_handler = logging.StreamHandler()
+    profile_handler.setFormatter(logging.Formatter(r"%(asctime)s - %(levelname)s - %(name)s - %(message)s"))
+    profile_logger.addHandler(profile_handler)
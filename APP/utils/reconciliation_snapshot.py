@@ -0,0 +1,111 @@
+import threading
+import os
+
+from .constantes import CACHE
+from .corpus_store import item_store
+from .corpus_columns import save_arrays, open_arrays
+
+
+# ---------------------------------------------------------
+# the reconciliation of the whole export_item.json, computed
+# ahead of time (`python run.py --reconcile`), so that a
+# search only has to read the pairs of entries it contains
+# instead of comparing its entries with each other. when
+# export_item.json changes, the snapshot is updated: only
+# the new entries are compared
+#
+# used by reconciliator.reconciliator()
+#
+# contains:
+# - ReconciliationSnapshot
+# - reconciliation_snapshot (the instance shared by the whole app)
+# ---------------------------------------------------------
+
+
+class ReconciliationSnapshot:
+    """
+    the matching pairs of entries of export_item.json (see reconciliator.reconcile_corpus()),
+    saved with save_arrays() with the mtime and size of the export_item.json they were computed from:
+    - first, second: int32. the rows of the entries of each pair (their positions in export_item.json
+      and in its Columns), sorted by first and then by second row
+    - score, distance: float64. the similarity score and the author distance of each pair
+    - cluster: int32. for each entry of export_item.json, the cluster (connected component of the pairs)
+      it belongs to, or -1 if it isn't in any pair
+    - ids_offsets, ids_data: the StringTable of the ids of the entries, and fingerprint: uint64, the
+      fingerprint of each entry. with them, the snapshot can be updated when export_item.json changes
+      (see reconciliator.reconcile_update())
+    the snapshot is never computed on the fly: it is recomputed by refresh(), and only when
+    export_item.json has changed since it was computed. until then, get() returns None.
+    """
+    version = 2  # to be incremented when the snapshot or the way pairs are scored change
+
+    def __init__(self, fpath):
+        """
+        :param fpath: the path to the snapshot
+        """
+        self.fpath = fpath
+        self._arrays = None  # (stamp of export_item.json, arrays)
+        self._lock = threading.Lock()
+
+    def open(self, stamp):
+        """
+        open the snapshot saved on disk
+        :param stamp: the current (mtime, size) of export_item.json, or None to open the
+                      snapshot whatever the export_item.json it has been computed from
+        :return: a dict of arrays, or None if there is no snapshot or if it is outdated
+        """
+        saved = open_arrays(self.fpath)
+        if saved is None:
+            return None
+        header, arrays = saved
+        if header.get("version") != self.version or (
+                stamp is not None and (header.get("mtime"), header.get("size")) != stamp):
+            return None
+        return arrays
+
+    def get(self):
+        """
+        get the reconciliation of the current export_item.json
+        :return: a dict of arrays, or None if the reconciliation hasn't been computed
+                 for the current export_item.json
+        """
+        try:
+            stamp = item_store.stamp(item_store.fpath)
+        except OSError:
+            return None
+        arrays = self._arrays  # read once: another thread can replace self._arrays in the meantime
+        if arrays is not None and arrays[0] == stamp:
+            return arrays[1]
+        with self._lock:
+            arrays = self._arrays
+            if arrays is None or arrays[0] != stamp:
+                arrays = (stamp, self.open(stamp))
+                # an outdated or missing snapshot isn't kept: it is looked for again on the next call
+                self._arrays = arrays if arrays[1] is not None else None
+        return arrays[1]
+
+    def refresh(self, reconcile, update=None, force=False):
+        """
+        compute the reconciliation of export_item.json, if it hasn't been computed yet
+        or if export_item.json has changed since it was computed
+        :param reconcile: a function taking the content of export_item.json and returning the arrays
+        :param update: an optional function taking the content of export_item.json and the arrays of the
+                       former snapshot, and returning the updated arrays (or None if it can't update them).
+                       if there is a former snapshot, it is updated instead of being computed again
+        :param force: if True, compute it in any case, without updating the former snapshot
+        :return: True if the reconciliation has been computed, False if it was up to date
+        """
+        stamp = item_store.stamp(item_store.fpath)
+        if not force and self.open(stamp) is not None:
+            return False
+        previous = self.open(None) if update is not None and not force else None
+        arrays = update(item_store.get(), previous) if previous is not None else None
+        if arrays is None:
+            arrays = reconcile(item_store.get())
+        save_arrays(self.fpath, {"version": self.version, "mtime": stamp[0], "size": stamp[1]}, arrays)
+        with self._lock:
+            self._arrays = None
+        return True
+
+
+reconciliation_snapshot = ReconciliationSnapshot(os.path.join(CACHE, "reconciliation.bin"))
@@ -1,11 +1,18 @@
-from networkx.algorithms.components.connected import connected_components
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from difflib import SequenceMatcher
-import networkx
+import numpy as np
+import itertools
+import hashlib
 import json
-import tqdm
+import time
 
 from .main_functions import *
-from .constantes import DATA
+from .constantes import RECONCILE_WORKERS, RECONCILE_PARALLEL_THRESHOLD, RECONCILE_BUDGET
+from .corpus_store import item_store
+from .corpus_columns import item_columns, StringTable
+from .reconciliation_snapshot import reconciliation_snapshot
+from .profiler import Profile
 
 
 # https://stackoverflow.com/a/17388505
@@ -19,88 +26,565 @@ def similar(a, b):
     return SequenceMatcher(None, a, b).ratio()
 
 
-# https://stackoverflow.com/a/4843408
-def to_graph(l):
+def clusters(pairs, size):
     """
-    This function is used to create graphs (collections of nodes).
-    :param l: a list
-    :return: a list with graphs
+    This function groups the entries linked by pairs into clusters (the connected components of the graph
+    whose nodes are the entries and whose edges are the pairs), with a union-find: each entry points to
+    another entry of its cluster, up to a root that identifies the cluster.
+    :param pairs: a list of pairs (i, j) of positions of entries
+    :param size: the number of entries
+    :return: a list of clusters (lists of positions) of the entries that are in a pair. the clusters, and
+             the entries of each cluster, are in the order in which they first appear in pairs
     """
-    graphed_list = networkx.Graph()
-    for part in l:
-        # each sublist is a bunch of nodes
-        graphed_list.add_nodes_from(part)
-        # it also imlies a number of edges:
-        graphed_list.add_edges_from(to_edges(part))
-    return graphed_list
+    parent = list(range(size))
+    rank = [0] * size
+
+    def find(node):
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        # Path compression: all the nodes on the way now point to the root.
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for i, j in pairs:
+        root_i, root_j = find(i), find(j)
+        if root_i == root_j:
+            continue
+        # Union by rank: the shallower tree is attached to the root of the deeper one.
+        if rank[root_i] < rank[root_j]:
+            root_i, root_j = root_j, root_i
+        parent[root_j] = root_i
+        if rank[root_i] == rank[root_j]:
+            rank[root_i] += 1
+
+    grouped = {}  # root: cluster
+    seen = set()
+    for node in itertools.chain.from_iterable(pairs):
+        if node not in seen:
+            seen.add(node)
+            grouped.setdefault(find(node), []).append(node)
+    return list(grouped.values())
+
+
+# The block keys used by candidate_pairs(). Only keys that two entries must share for their
+# similarity_score() to exceed the 0.6 threshold of double_loop() can be used here, else
+# pairs that match would not be compared: whatever the other fields, a pair of entries
+# with different dates (or without a date) has a score of at most 0.3.
+block_keys = {
+    "date": lambda desc: desc["date"],
+}
+
+
+# The parts of the similarity score of two entries, in the order in which they are added to the score:
+# field: (added if the values are equal, added if they aren't). The descs are "equal" if they are
+# similar (see similarity_score()), and the dates only if there is one.
+score_weights = {
+    "desc": (0.3, -0.2),
+    "term": (0.2, -0.1),
+    "date": (0.5, -0.5),
+    "number_of_pages": (0.1, -0.1),
+    "format": (0.1, -0.3),
+    "price": (0.1, -0.1),
+}
 
 
-# https://stackoverflow.com/a/4843408
-def to_edges(l):
+def similarity_score(desc_a, desc_b):
     """
-    This function creates edges from graphs :
-    It reats the param `l` as a Graph and returns it's edges :
-    Ex : to_edges(['a','b','c','d']) -> [(a,b), (b,c),(c,d)]
-    :param l: a list of graphs
+    This function calculates the similarity score between two descs, with the weights of score_weights.
+    double_loop() computes the same score for many pairs at once with score_pairs().
+    :param desc_a: first desc to compare
+    :param desc_b: second desc to compare
+    :return: the score
     """
-    it = iter(l)
-    last = next(it)
+    score = 0
+    for field, (same, different) in score_weights.items():
+        if field == "desc":
+            # Desc of a same document are often strongly similar.
+            equal = similar(desc_b["desc"], desc_a["desc"]) > 0.75
+        elif field == "date":
+            equal = desc_a["date"] == desc_b["date"] and desc_b["date"] is not None
+        else:
+            equal = desc_a[field] == desc_b[field]
+        score = score + (same if equal else different)
+    return score
 
-    for current in it:
-        yield last, current
-        last = current
 
+def encode(items, field):
+    """
+    This function encodes a field of the entries as integers, so that it can be compared for many pairs at once.
+    :param items: a list of tuples (id, entry)
+    :param field: the field to encode
+    :return: an array of integer codes, one per entry: two entries have the same code if their values are equal
+    """
+    codes = {}
+    return np.array([codes.setdefault(desc[field], len(codes)) for id_, desc in items], dtype=np.int64)
 
-def similarity_score(desc_a, desc_b):
+
+def score_pairs(items, candidates, sensibility=0.6, min_author_distance=0.4, report=None, deadline=None):
     """
-    This function calculates the similarity score between two descs.
-    :param desc_a: first desc to compare
-    :param desc_b: second desc to compare
-    :return: the score
+    This function scores pairs of entries, and returns those that match: it gives the same result as
+    computing similarity_score() and the author distance of each pair, like double_loop() used to, and
+    keeping the pairs with a score higher than sensibility and an author distance of at least min_author_distance.
+    - the fields compared for equality are encoded as integers, and their part of the score is computed
+      for all pairs at once with NumPy. the parts are added in the same order as in similarity_score(), so
+      that the scores are exactly the same ;
+    - the desc is compared (with SequenceMatcher, which is slow) only for the pairs whose score can still
+      be higher than sensibility if their descs are similar, and whose authors are close enough.
+    :param items: a list of tuples (id, entry)
+    :param candidates: a list of pairs (i, j) of positions in items (see candidate_pairs())
+    :param sensibility: the score a pair must exceed to match
+    :param min_author_distance: the minimal author distance of a pair to match
+    :param report: an optional dictionary, filled with the number of pairs rejected because their authors are
+                   different ("author_rejected_after_bound": only the pairs whose score can still be higher than
+                   sensibility have their authors compared, so the pairs rejected by that bound aren't counted)
+                   and of pairs whose descs have been compared ("scored")
+    :param deadline: an optional time.monotonic() after which no more pair is scored: the pairs that haven't been
+                     scored yet are skipped, and report["partial"] is set to True
+    :return: a list of tuples (i, j, score, author distance), one per matching pair, in the order of candidates
+    """
+    def expired():
+        return deadline is not None and time.monotonic() > deadline
+
+    if report is not None:
+        report["author_rejected_after_bound"] = report["scored"] = 0
+        report["partial"] = False
+    if not candidates:
+        return []
+    pairs = np.array(candidates, dtype=np.int64)
+    first, second = pairs[:, 0], pairs[:, 1]
+
+    # For each field, whether it is equal for each pair.
+    equal = {}
+    for field in score_weights:
+        if field != "desc":
+            codes = encode(items, field)
+            equal[field] = codes[first] == codes[second]
+    # The date only counts if there is one.
+    has_date = np.array([desc["date"] is not None for id_, desc in items], dtype=bool)
+    equal["date"] &= has_date[second]
+
+    def total(desc_part, subset):
+        # similarity_score() for the pairs in subset, given the part of the score for the descs
+        score = desc_part
+        for field, (same, different) in score_weights.items():
+            if field != "desc":
+                score = score + np.where(equal[field][subset], same, different)
+        return score
+
+    # To compare two sub-entries (two tei:desc from the same item) makes no sense.
+    entries = encode(items, "cat_entry")
+    possible = entries[first] != entries[second]
+    # The best score of each pair, if its descs are similar.
+    everything = np.arange(len(pairs))
+    possible &= total(np.full(len(pairs), score_weights["desc"][0]), everything) > sensibility
+
+    # The authors are compared once per pair of distinct authors.
+    distances = {}
+    subset = []
+    author_distances = []
+    partial = False
+    author_rejected_after_bound = 0
+    for n in np.flatnonzero(possible):
+        if expired():
+            partial = True
+            break
+        author_a = items[first[n]][1]["author"]
+        author_b = items[second[n]][1]["author"]
+        if (author_b, author_a) not in distances:
+            try:
+                distances[(author_b, author_a)] = similar(author_b, author_a)
+            except:
+                distances[(author_b, author_a)] = None  # no author distance can be computed
+        distance = distances[(author_b, author_a)]
+        # If there is a strong possibility that autors are not the same, we simply pass.
+        # Only the pairs that passed the bound on the score get here: they are the ones counted.
+        if author_b and author_a and distance < 0.75:
+            author_rejected_after_bound += 1
+            continue
+        distance = distance if distance is not None else 0
+        if distance >= min_author_distance:
+            subset.append(n)
+            author_distances.append(distance)
+    # Finally, the descs are compared and the scores computed.
+    similar_descs = []
+    for n in subset:
+        if expired():
+            partial = True
+            break
+        similar_descs.append(similar(items[second[n]][1]["desc"], items[first[n]][1]["desc"]) > 0.75)
+    subset = np.array(subset[:len(similar_descs)], dtype=np.int64)
+    if report is not None:
+        report["author_rejected_after_bound"] = author_rejected_after_bound
+        report["scored"] = len(subset)
+        report["partial"] = partial
+    if not len(subset):
+        return []
+    similar_descs = np.array(similar_descs, dtype=bool)
+    scores = total(np.where(similar_descs, *score_weights["desc"]), subset)
+    return [
+        (int(first[n]), int(second[n]), float(score), distance)
+        for n, score, distance in zip(subset, scores, author_distances)
+        if score > sensibility
+    ]
+
+
+def make_blocks(items):
+    """
+    This function puts the entries in blocks: an entry is put in a block for each of its
+    block keys (see block_keys) ; entries without a value for a key aren't put in the block
+    of that key. Only the entries in the same block can match.
+    :param items: a list of tuples (id, entry)
+    :return: a dictionary mapping (name of the key, value) to the positions in items of the
+             entries of the block, in ascending order
     """
+    blocks = {}
+    for i, (id_, desc) in enumerate(items):
+        for name, key in block_keys.items():
+            value = key(desc)
+            if value is not None:
+                blocks.setdefault((name, value), []).append(i)
+    return blocks
 
-    def equals(field):
-        return desc_a[field] == desc_b[field]
 
-    score = 0
-    # Desc of a same document are often strongly similar.
-    if similar(desc_b["desc"], desc_a["desc"]) > 0.75:
-        score = score + 0.3
-    else:
-        score = score - 0.2
+def candidate_pairs(items):
+    """
+    This function is the blocking stage of double_loop(): only the pairs of entries in the
+    same block are compared (see make_blocks()).
+    :param items: a list of tuples (id, entry)
+    :return: the list of candidate pairs (i, j), i < j being positions in items, in the order
+             in which double_loop() used to compare them
+    """
+    candidates = set()
+    for block in make_blocks(items).values():
+        # The positions in a block are in ascending order, so i < j.
+        candidates.update(itertools.combinations(block, 2))
+    return sorted(candidates)
 
-    if equals("term"):
-        score = score + 0.2
-    else:
-        score = score - 0.1
 
-    if equals("date") and desc_b["date"] is not None:
-        score = score + 0.5
-    else:
-        score = score - 0.5
+# The entries scored by the processes of score_pairs_parallel(): they are sent once to each process.
+worker_items = None
 
-    if equals("number_of_pages"):
-        score = score + 0.1
-    else:
-        score = score - 0.1
 
-    if equals("format"):
-        score = score + 0.1
-    else:
-        score = score - 0.3
+def init_worker(items):
+    """
+    This function is run once by each process of score_pairs_parallel(), when it starts.
+    :param items: a list of tuples (id, entry)
+    :return: None
+    """
+    global worker_items
+    worker_items = items
+    return None
 
-    if equals("price"):
-        score = score + 0.1
-    else:
-        score = score - 0.1
 
-    return score
+def score_chunk(candidates, deadline=None):
+    """
+    This function scores a chunk of the candidate pairs in a process of score_pairs_parallel().
+    :param candidates: a list of pairs (i, j) of positions in worker_items
+    :param deadline: see score_pairs()
+    :return: a tuple (report of score_pairs(), output of score_pairs())
+    """
+    report = {}
+    scored_pairs = score_pairs(worker_items, candidates, report=report, deadline=deadline)
+    return report, scored_pairs
+
+
+def score_pairs_parallel(items, candidates, workers=RECONCILE_WORKERS, report=None, deadline=None):
+    """
+    This function gives the same output as score_pairs(), but the pairs are scored by a pool of processes:
+    the candidates are split into chunks of consecutive 1st entries (ranges of the outer loop of the former
+    double_loop()), and the scored pairs of the chunks are merged in the order of the chunks, whatever the
+    order in which the processes finish. If the pool can't be started, the pairs are scored by score_pairs().
+    :param items: a list of tuples (id, entry)
+    :param candidates: a list of pairs (i, j) of positions in items, sorted (see candidate_pairs())
+    :param workers: the number of processes to use
+    :param report: an optional dictionary, filled like by score_pairs()
+    :param deadline: see score_pairs(). time.monotonic() is system-wide, so it is the same in the processes
+    :return: a list of tuples (i, j, score, author distance), one per matching pair, in the order of candidates
+    """
+    # Each chunk holds about the same number of pairs, and all the pairs of its 1st entries.
+    size = max(1, len(candidates) // (workers * 4))
+    chunks = []
+    start = 0
+    while start < len(candidates):
+        end = min(start + size, len(candidates))
+        while end < len(candidates) and candidates[end][0] == candidates[end - 1][0]:
+            end += 1
+        chunks.append(candidates[start:end])
+        start = end
+
+    results = None
+    if workers > 1 and len(chunks) > 1:
+        # Only the fields compared by score_pairs() are sent to the processes.
+        fields = ("author", "desc", "term", "date", "number_of_pages", "format", "price", "cat_entry")
+        shipped = [(id_, {field: desc.get(field) for field in fields}) for id_, desc in items]
+        try:
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(chunks)), initializer=init_worker, initargs=(shipped,)
+            ) as pool:
+                # Executor.map() yields the results in the order of the input.
+                results = list(pool.map(score_chunk, chunks, itertools.repeat(deadline)))
+        except (OSError, NotImplementedError, BrokenProcessPool):
+            # No process can be started (sandboxed deploy for example).
+            results = None
+    if results is None:
+        return score_pairs(items, candidates, report=report, deadline=deadline)
+
+    if report is not None:
+        for key in ("author_rejected_after_bound", "scored"):
+            report[key] = sum(chunk_report[key] for chunk_report, scored_pairs in results)
+        report["partial"] = any(chunk_report["partial"] for chunk_report, scored_pairs in results)
+    return [pair for chunk_report, scored_pairs in results for pair in scored_pairs]
+
+
+# The fields of the entries compared by score_pairs() when export_item.json is reconciled ahead of time.
+reconcile_fields = ("author", "desc", "term", "date", "number_of_pages", "format", "price")
+
+
+def reconcile_blocks(blocks):
+    """
+    This function scores the pairs of entries of blocks of export_item.json. It is run by the
+    processes of score_blocks().
+    :param blocks: a list of tuples (block, fresh): block is a list of tuples (row, id, entry) in ascending
+                   order of rows, and fresh is None to score all the pairs of the block, or the positions in
+                   block of its new entries, to only score the pairs with a new entry (see reconcile_update())
+    :return: a list of tuples (row of the 1st entry, row of the 2nd entry, score, author distance),
+             one per matching pair
+    """
+    pairs = []
+    for block, fresh in blocks:
+        items = [(id_, desc) for row, id_, desc in block]
+        for id_, desc in items:
+            desc["cat_entry"] = validate_entry_id(id_)
+        if fresh is None:
+            candidates = list(itertools.combinations(range(len(items)), 2))
+        else:
+            # The 1st entry of a pair is the one with the lowest row, as when all the pairs are scored.
+            candidates = sorted({(min(i, j), max(i, j)) for j in fresh for i in range(len(items)) if i != j})
+        for i, j, score, distance in score_pairs(items, candidates):
+            pairs.append((block[i][0], block[j][0], score, distance))
+    return pairs
+
+
+def score_blocks(blocks, workers=RECONCILE_WORKERS):
+    """
+    This function scores the pairs of blocks of export_item.json with reconcile_blocks(). If workers > 1,
+    the blocks are scored in parallel by a pool of processes ; the output doesn't depend on the number of
+    workers. If the pool can't be started, the blocks are scored in the current process.
+    :param blocks: a list of tuples (block, fresh) (see reconcile_blocks())
+    :param workers: the number of processes to use
+    :return: a dictionary mapping the pairs of rows (i, j) to a tuple (score, author distance)
+    """
+    # The biggest blocks are spread first across the batches, so that the batches have similar costs.
+    blocks = sorted(blocks, key=lambda block: len(block[0]) * len(block[1] if block[1] is not None else block[0]),
+                    reverse=True)
+    batches = [blocks[n::max(1, workers * 4)] for n in range(min(len(blocks), max(1, workers * 4)))]
+
+    results = None
+    if workers > 1 and len(batches) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(reconcile_blocks, batches))
+        except (OSError, NotImplementedError, BrokenProcessPool):
+            # No process can be started (sandboxed deploy for example).
+            results = None
+    if results is None:
+        results = [reconcile_blocks(batch) for batch in batches]
+
+    # A pair in several blocks (with several block keys) is only kept once.
+    pairs = {}
+    for i, j, score, distance in itertools.chain.from_iterable(results):
+        pairs[(i, j)] = (score, distance)
+    return pairs
+
+
+def fingerprints(items):
+    """
+    This function computes a fingerprint of the compared fields of each entry, to find the entries that have
+    changed since export_item.json was reconciled (see reconcile_update()).
+    :param items: a list of tuples (id, entry) of the entries of export_item.json
+    :return: an uint64 array of the fingerprints of the entries
+    """
+    return np.array([
+        int.from_bytes(hashlib.blake2b(
+            json.dumps([desc[field] for field in reconcile_fields]).encode("utf-8"), digest_size=8
+        ).digest(), "little")
+        for id_, desc in items
+    ], dtype=np.uint64)
+
+
+def reconciliation_arrays(items, pairs, cluster, fingerprint):
+    """
+    This function builds the arrays of the reconciliation of export_item.json (see reconcile_corpus()).
+    :param items: a list of tuples (id, entry) of the entries of export_item.json
+    :param pairs: a dictionary mapping the matching pairs of rows (i, j) to a tuple (score, author distance)
+    :param cluster: an int32 array of the cluster of each entry
+    :param fingerprint: the fingerprints of the entries (see fingerprints())
+    :return: a dictionary of arrays
+    """
+    ordered = sorted(pairs)
+    ids_offsets, ids_data = StringTable.encode([id_ for id_, desc in items])
+    return {
+        "first": np.array([i for i, j in ordered], dtype=np.int32),
+        "second": np.array([j for i, j in ordered], dtype=np.int32),
+        "score": np.array([pairs[pair][0] for pair in ordered], dtype=np.float64),
+        "distance": np.array([pairs[pair][1] for pair in ordered], dtype=np.float64),
+        "cluster": cluster,
+        "ids_offsets": ids_offsets,
+        "ids_data": ids_data,
+        "fingerprint": fingerprint,
+    }
+
+
+def cluster_labels(pairs, size):
+    """
+    This function numbers the clusters of the entries of export_item.json (see clusters()).
+    :param pairs: a sorted list of pairs of rows (i, j)
+    :param size: the number of entries
+    :return: an int32 array of the cluster of each entry (-1 if it isn't in any pair)
+    """
+    cluster = np.full(size, -1, dtype=np.int32)
+    for n, members in enumerate(clusters(pairs, size)):
+        cluster[members] = n
+    return cluster
+
+
+def reconcile_corpus(data, workers=RECONCILE_WORKERS):
+    """
+    This function reconciles the whole export_item.json ahead of time (see reconciliation_snapshot.py):
+    every pair of entries in the same block is scored, like double_loop() does for the entries of a query.
+    The scores of a pair don't depend on the other entries, so the matching pairs between the entries
+    of a query are the precomputed pairs whose both entries are in the query.
+    :param data: the content of export_item.json
+    :param workers: the number of processes to use (see score_blocks())
+    :return: a dictionary of arrays: the rows of the entries of the matching pairs ("first" and "second",
+             sorted), their "score" and author "distance", the "cluster" of each entry (-1 if none), and the
+             ids ("ids_offsets" and "ids_data", a StringTable) and "fingerprint" of the entries, with which
+             the reconciliation can be updated when export_item.json changes (see reconcile_update())
+    """
+    items = [(key, {field: entry.get(field) for field in reconcile_fields}) for key, entry in data.items()]
+    blocks = [
+        ([(row, items[row][0], items[row][1]) for row in block], None)
+        for block in make_blocks(items).values()
+        if len(block) > 1
+    ]
+    pairs = score_blocks(blocks, workers)
+    return reconciliation_arrays(items, pairs, cluster_labels(sorted(pairs), len(items)), fingerprints(items))
 
 
-def double_loop(input_dict):
+def reconcile_update(data, previous, workers=RECONCILE_WORKERS):
+    """
+    This function updates the reconciliation of export_item.json after it has changed (new catalogues for
+    example), instead of reconciling it again with reconcile_corpus(). The entries that have been added or
+    whose compared fields have changed (see fingerprints()) are the new entries: only the pairs of a new entry
+    and of the entries of its blocks (new or not) are scored. The other pairs are kept, with their scores.
+    The new pairs are then merged into the persisted clusters: the clusters linked by a new pair are merged
+    (the entries of a cluster don't have to be compared with each other again). If some pairs have been
+    removed (with removed or changed entries), a cluster may be split: the clusters are computed again from
+    the pairs, which doesn't score any pair.
+    The pairs are the same as with reconcile_corpus(), and so are the clusters, but for their numbers (which
+    aren't consecutive after a merge). The time spent scoring pairs depends on the number of new entries.
+    :param data: the content of export_item.json
+    :param previous: the arrays of the former reconciliation (see reconcile_corpus())
+    :param workers: the number of processes to use (see score_blocks())
+    :return: a dictionary of arrays like reconcile_corpus(), or None if the reconciliation can't be updated:
+             the former reconciliation doesn't have the ids of the entries, or the entries that are kept aren't
+             in the same order (the 1st entry of a pair being the one with the lowest row, their pairs would
+             have to be scored again)
+    """
+    if "ids_offsets" not in previous:
+        return None
+    items = [(key, {field: entry.get(field) for field in reconcile_fields}) for key, entry in data.items()]
+    fingerprint = fingerprints(items)
+
+    # The row of each former entry in export_item.json, if it is kept (-1 if it has been removed or changed).
+    row = {id_: n for n, (id_, desc) in enumerate(items)}
+    remap = np.array([row.get(id_, -1) for id_ in StringTable(previous["ids_offsets"], previous["ids_data"])],
+                     dtype=np.int64)
+    changed = remap >= 0
+    changed[changed] = fingerprint[remap[changed]] != previous["fingerprint"][changed]
+    remap[changed] = -1
+    kept = remap[remap >= 0]
+    if (np.diff(kept) < 0).any():
+        return None
+    fresh = np.ones(len(items), dtype=bool)
+    fresh[kept] = False
+
+    # The former pairs are kept if both their entries are.
+    first, second = remap[previous["first"]], remap[previous["second"]]
+    selected = np.flatnonzero((first >= 0) & (second >= 0))
+    pairs = {
+        (int(first[n]), int(second[n])): (float(previous["score"][n]), float(previous["distance"][n]))
+        for n in selected
+    }
+
+    # The new entries are only compared with the entries of their blocks.
+    blocks = []
+    for block in make_blocks(items).values():
+        new = [n for n, i in enumerate(block) if fresh[i]]
+        if len(block) > 1 and new:
+            blocks.append(([(i, items[i][0], items[i][1]) for i in block], new))
+    new_pairs = score_blocks(blocks, workers)
+    pairs.update(new_pairs)
+
+    if len(selected) < len(previous["first"]):
+        return reconciliation_arrays(items, pairs, cluster_labels(sorted(pairs), len(items)), fingerprint)
+
+    # The new pairs link clusters (numbered like the former ones) and entries that weren't in any cluster
+    # (numbered from the number of former clusters, by row): the linked ones are merged, and take the lowest
+    # former number of the merged clusters, or a new number.
+    cluster = np.full(len(items), -1, dtype=np.int64)
+    cluster[kept] = previous["cluster"][remap >= 0]
+    offset = int(previous["cluster"].max()) + 1 if len(previous["cluster"]) else 0
+    node = np.where(cluster >= 0, cluster, offset + np.arange(len(items)))
+    label = np.arange(offset + len(items))
+    next_label = offset
+    for merged in clusters(sorted((int(node[i]), int(node[j])) for i, j in new_pairs), offset + len(items)):
+        former = [n for n in merged if n < offset]
+        if former:
+            label[merged] = min(former)
+        else:
+            label[merged] = next_label
+            next_label += 1
+    linked = np.zeros(len(items), dtype=bool)
+    linked[[i for pair in new_pairs for i in pair]] = True
+    cluster = np.where((cluster >= 0) | linked, label[node], -1).astype(np.int32)
+    return reconciliation_arrays(items, pairs, cluster, fingerprint)
+
+
+def precomputed_pairs(reconciliation, rows):
+    """
+    This function reads the matching pairs between some entries in the reconciliation of
+    export_item.json computed by reconcile_corpus().
+    :param reconciliation: the arrays returned by reconcile_corpus()
+    :param rows: the rows of the entries in export_item.json, in ascending order
+    :return: a list of tuples (i, j, score, author distance) like score_pairs(), i and j being positions
+             in rows, in the order of candidate_pairs()
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    # Only the entries in a cluster are in a pair.
+    if not len(rows) or (reconciliation["cluster"][rows] == -1).all():
+        return []
+    position = np.full(len(reconciliation["cluster"]), -1, dtype=np.int64)
+    position[rows] = np.arange(len(rows))
+    first, second = position[reconciliation["first"]], position[reconciliation["second"]]
+    # The pairs are sorted by rows, and the rows in ascending order: they are sorted by positions too.
+    selected = np.flatnonzero((first >= 0) & (second >= 0))
+    return [
+        (int(first[n]), int(second[n]), float(reconciliation["score"][n]), float(reconciliation["distance"][n]))
+        for n in selected
+    ]
+
+
+def double_loop(input_dict, report=None, reconciliation=None, rows=None, deadline=None, profile=None):
     """
     This function creates pairs of matching entries.
     the input is a subset of export_item.json filtered by author name (and possibly date)
+    only the pairs of entries sharing a block key are compared (see candidate_pairs()) ;
+    if export_item.json has been reconciled ahead of time, the pairs are read from its
+    reconciliation instead (see precomputed_pairs()). the pairs of an input of at least
+    RECONCILE_PARALLEL_THRESHOLD entries are scored by several processes (see score_pairs_parallel())
     returns structure:
     filtered_list_with_score =
         [
@@ -123,57 +607,83 @@ def double_loop(input_dict):
         ]  # all similar items with, 1st: a list of all similar items, 2nd: dicts with complete data on all items
     reconciliated_desc_list = ["item1_id", "itemN_id"]  # list of ids of all reconciliated items
     :param input_dict: a dictionary
+    :param report: an optional dictionary, filled with the number of pairs of entries ("pairs"), of pairs
+                   that are compared ("considered") and of pairs that aren't ("pruned"), like by score_pairs()
+                   and with the number of clusters ("clusters")
+    :param reconciliation: the reconciliation of export_item.json (see reconcile_corpus()), optional
+    :param rows: with reconciliation, the rows of the entries of input_dict in export_item.json
+    :param deadline: an optional time.monotonic() after which no more pair is scored (see score_pairs()):
+                     the clusters are made of the pairs scored until then
+    :param profile: an optional Profile, in which the time spent scoring the pairs ("scoring") and
+                    making the clusters ("clustering") is recorded
     :return: 3 lists
     """
-
-    output_dict1 = {}
-    # First we compare each entry with each other one and give a score to each pair.
-    items = list(input_dict.items())  # list of tuples (id, input_dict[id])
-    for i in tqdm.tqdm(range(len(items))):
-        id_a, desc_a = items[i]
+    profile = profile if profile is not None else Profile()
+
+    items = prepare_items(input_dict)
+
+    # First we compare the entries that can match with each other and give a score to each pair.
+    with profile.phase("scoring"):
+        if reconciliation is None:
+            candidates = candidate_pairs(items)
+            if report is not None:
+                report["pairs"] = len(items) * (len(items) - 1) // 2
+                report["considered"] = len(candidates)
+                report["pruned"] = report["pairs"] - report["considered"]
+            if len(items) >= RECONCILE_PARALLEL_THRESHOLD and RECONCILE_WORKERS > 1:
+                scored_pairs = score_pairs_parallel(items, candidates, report=report, deadline=deadline)
+            else:
+                scored_pairs = score_pairs(items, candidates, report=report, deadline=deadline)
+        # Or they have already been compared: no pair is compared again.
+        else:
+            scored_pairs = precomputed_pairs(reconciliation, rows)
+            if report is not None:
+                report["pairs"] = len(items) * (len(items) - 1) // 2
+                report["considered"] = report["author_rejected_after_bound"] = report["scored"] = 0
+                report["pruned"] = report["pairs"]
+                report["partial"] = False
+                report["precomputed"] = len(scored_pairs)
+
+    with profile.phase("clustering"):
+        results_lists = group_pairs(items, scored_pairs)
+        if report is not None:
+            report["clusters"] = len(results_lists[1])
+
+    return results_lists
+
+
+def prepare_items(input_dict):
+    """
+    This function adds to the entries the ids of their catalogue and of their catalogue entry, used to display the groups.
+    :param input_dict: a dictionary of entries
+    :return: a list of tuples (id, input_dict[id])
+    """
+    items = list(input_dict.items())
+    for id_a, desc_a in items:
         desc_a["cat_id"] = validate_id(id_a)
-        entry_id_a = validate_entry_id(id_a)
-        desc_a["cat_entry"] = entry_id_a
-        # check for matching items in input_dict
-        # We can pass items from 0 to i since we already have processed it.
-        for j in range(i + 1, len(items)):
-            id_b, desc_b = items[j]
-            entry_id_b = validate_entry_id(id_b)
-            # To compare two sub-entries (two tei:desc from the same item) makes no sense.
-            if entry_id_a == entry_id_b:
-                continue
-            # If there is a strong possibility that autors are not the same, we simply pass.
-            if desc_b["author"] and desc_a["author"] and similar(desc_b["author"], desc_a["author"]) < 0.75:
-                continue
-            # This dict will contain the score and the author distance.
-            score_entry = {}
-            score_entry["score"] = similarity_score(desc_a, desc_b)
-            try:
-                score_entry["author_distance"] = similar(desc_b["author"], desc_a["author"])
-            except:
-                score_entry["author_distance"] = 0
-            output_dict1["%s-%s" % (id_a, id_b)] = score_entry
-
-    # The final list contains the result of the whole comparison process, without filtering, sorted by score.
-    final_list = []
-    for key in output_dict1:
-        first_entry = key.split("-")[0]
-        second_entry = key.split("-")[1]
-        final_list.append((
-                          output_dict1[key]["score"], [first_entry, second_entry], output_dict1[key]["author_distance"],
-                          {first_entry: input_dict[first_entry]}, {second_entry: input_dict[second_entry]}))
-    # We sort by author distance first, and then by the score.
-    final_list.sort(reverse=True, key=lambda x: (x[2], x[0]))
-
-    # The filtered list removes all entries with a score lower or equal to 0.6
-    sensibility = 0.6
-    filtered_list_with_score = [[item[1], item[0]] for item in final_list if item[0] > sensibility and item[2] >= 0.4]
-
-    # Now let's create the clusters. We transform the list of pairs into a graph. The connected nodes are our clusters !
-    # See https://stackoverflow.com/a/4843408
-    filtered_list = [item[0] for item in filtered_list_with_score]
-    graphed_list = to_graph(filtered_list)
-    cleaned_list = [list(item) for item in list(connected_components(graphed_list))]
+        desc_a["cat_entry"] = validate_entry_id(id_a)
+    return items
+
+
+def group_pairs(items, scored_pairs):
+    """
+    This function makes the 3 lists returned by double_loop() (see its docstring) from the matching pairs.
+    :param items: a list of tuples (id, entry), prepared by prepare_items()
+    :param scored_pairs: a list of tuples (i, j, score, author distance), i and j being positions in items.
+                         it is sorted in place
+    :return: 3 lists
+    """
+    # The filtered list only contains the pairs with a score higher than 0.6 and an author distance of
+    # at least 0.4, sorted by author distance first, and then by the score.
+    scored_pairs.sort(reverse=True, key=lambda x: (x[3], x[2]))
+    filtered_list_with_score = [[[items[i][0], items[j][0]], score] for i, j, score, distance in scored_pairs]
+
+    # Now let's create the clusters: the entries linked by the filtered pairs are grouped together.
+    cleaned_list = [
+        [items[n][0] for n in cluster]
+        for cluster in clusters([(i, j) for i, j, score, distance in scored_pairs], len(items))
+    ]
+    input_dict = dict(items)
     cleaned_output_list = []
     reconciliated_desc_list = []
     n = 0
@@ -187,79 +697,217 @@ def double_loop(input_dict):
         cleaned_output_list[n].append(item)
         temp_list.reverse()
         n += 1
-
     return filtered_list_with_score, cleaned_output_list, reconciliated_desc_list
 
 
-def author_filtering(dictionary, name):
-    """
-    This function extracts the entries based on the similarity with the searched author name.
-    :param dictionary: a dictionary
-    :param name: a string
-    :return: a dictionary
-    """
-    output_dict = {}
-    for key in dictionary:
-        if dictionary[key]["author"] is not None and similar(dictionary[key]["author"].lower(), name.lower()) > 0.80:
-            output_dict[key] = dictionary[key]
+# The orders in which the entries of a search can be displayed (see sort_entries()): name: field of the entries
+# to sort them by ("id" keeps the order of export_item.json, which is the order of the catalogues).
+sort_fields = {
+    "id": None,
+    "sell_date": "sell_date",
+    "date": "date",
+    "price": "price",
+}
 
-    return output_dict
 
-
-def year_filtering(dictionary, date):
-    output_dict = {}
+def sort_entries(entries, sort):
+    """
+    This function sorts the entries of a search, to display them page by page.
+    :param entries: a dictionary of entries (final_results["filtered_data"])
+    :param sort: a name in sort_fields, prefixed by "-" for a descending order
+    :return: the list of the ids of the entries, sorted. the entries without a value
+             for the field are always at the end, in the order of export_item.json
+    """
+    field = sort_fields[sort.lstrip("-")]
+    descending = sort.startswith("-")
+    ids = list(entries)
+    if field is None:
+        return ids[::-1] if descending else ids
+    # sorted() is stable: the entries with the same value stay in the order of export_item.json.
+    present = sorted(
+        (key for key in ids if entries[key].get(field) is not None),
+        key=lambda key: entries[key][field], reverse=descending
+    )
+    return present + [key for key in ids if entries[key].get(field) is None]
+
+
+def date_bounds(date):
+    """
+    This function reads the bounds of the searched range of dates. The dates are compared as strings.
+    :param date: a string: "a=YYYY" (after), "b=YYYY" (before) or "YYYY-YYYY" (range)
+    :return: a tuple (minimal date or None, maximal date or None), both included
+    """
     # a= stands for after.
     if re.compile("^a=").match(date):
-        norm_date = date.split("=")[1]
-        for key in dictionary:
-            if dictionary[key]["date"] is not None and dictionary[key]["date"] >= norm_date:
-                output_dict[key] = dictionary[key]
+        return date.split("=")[1], None
     # b= stands for before.
     elif re.compile("^b=").match(date):
-        norm_date = date.split("=")[1]
-        for key in dictionary:
-            if dictionary[key]["date"] is not None and dictionary[key]["date"] <= norm_date:
-                output_dict[key] = dictionary[key]
+        return None, date.split("=")[1]
     # Any year range.
     else:
-        date_before = date.split("-")[0]
-        date_after = date.split("-")[1]
-        for key in dictionary:
-            if dictionary[key]["date"] is not None and date_before <= dictionary[key]["date".split("-")[0]] <= date_after:
-                output_dict[key] = dictionary[key]
+        return date.split("-")[0], date.split("-")[1]
+
+
+def filter_entries(author, date, profile=None):
+    """
+    This function is the first part of a query: it finds the entries of the searched author (and date).
+    :param author: a string
+    :param date: a string, optional parameter
+    :param profile: the Profile of the query, in which the time spent in each phase is recorded (optional)
+    :return: a dictionary of copies of the entries (id: entry), the rows of the entries in export_item.json,
+             and the reconciliation of export_item.json if it has been computed ahead of time (else None)
+    """
+    profile = profile if profile is not None else Profile()
+    # All the data in JSON, from the corpus store (see corpus_store.py).
+    with profile.phase("loading"):
+        all_data = item_store.get()
+        columns = item_columns.get()
+        reconciliation = reconciliation_snapshot.get()
+
+    # Only entries of the searched author are remained. The authors similar to the searched one are found
+    # with the index of the authors (see author_index.py), without comparing the searched author to every entry.
+    with profile.phase("author_filtering"):
+        authors = set(columns.author_index.lookup(author, cutoff=0.80))
+        mask = columns.author_mask(lambda a: a in authors)
+
+    # Entries are filtered by date, if there is one: the entries in the range of dates are found with a binary
+    # search in the sorted index of the dates (see corpus_columns.py), without comparing every entry's date.
+    if date:
+        with profile.phase("year_filtering"):
+            mask &= columns.mask(columns.date_rows(*date_bounds(date)))
 
-    return output_dict
+    # The entries are copied: they are modified later on, and those of the corpus store are read-only.
+    with profile.phase("copying"):
+        rows = dict(zip(columns.keys(mask), np.flatnonzero(mask)))  # id: row in export_item.json
+        author_dict = {key: all_data[key].to_dict() for key in rows}
+    profile.count("entries", len(author_dict))
+    return author_dict, [rows[key] for key in author_dict], reconciliation
 
 
-def reconciliator(author, date):
+def reconciliator(author, date, budget=RECONCILE_BUDGET, progress=None):
     """
     This function is the main function used for queries.
     :param author: a string
     :param date: a string, optional parameter
+    :param budget: the time budget of the query, in seconds (0 or None: no budget). when it runs out,
+                   the pairs of entries that haven't been scored yet are skipped, and final_results["partial"]
+                   is True: the groups are only made of the pairs scored until then
+    :param progress: a function called with the name of each phase of the query when it starts, or None
     """
+    deadline = time.monotonic() + budget if budget else None
     final_results = {}
-    # Loading of all the data in JSON.
-    json_file = f"{DATA}/json/export_item.json"
-    with open(json_file, 'r') as data:
-        all_data = json.load(data)
-
-    # Only entries of the searched author are remained.
-    author_dict = author_filtering(all_data, author)
-
-    # Entries are filtered by date, if there is one.
-    if date:
-        author_dict = year_filtering(author_dict, date)
+    # The time spent in each phase and the counts of entries, pairs and clusters (see profiler.py).
+    profile = Profile(on_phase=progress)
+    author_dict, rows, reconciliation = filter_entries(author, date, profile)
 
     # The dictionary containing entries of an author are remained in the final dictionary.
     final_results["filtered_data"] = author_dict
 
-    # double_loop is fed with a dict of entries filtered by author and/or date
-    results_lists = double_loop(author_dict)
+    # double_loop is fed with a dict of entries filtered by author and/or date, and with the reconciliation of
+    # export_item.json if it has been computed ahead of time (`python run.py --reconcile`).
+    # It counts the pairs of entries compared, skipped and matched in the profile.
+    results_lists = double_loop(
+        author_dict, report=profile.counters, reconciliation=reconciliation,
+        rows=rows, deadline=deadline, profile=profile
+    )
 
     final_results["score"] = results_lists[0]
     final_results["groups"] = results_lists[1]
     final_results["recon_desc"] = results_lists[2]
     final_results["result"] = len(author_dict)
+    final_results["partial"] = profile.counters.pop("partial")
+    final_results["profile"] = profile.to_dict()
 
     return final_results
 
+
+def reconciliator_stream(author, date, budget=RECONCILE_BUDGET, filtered=None):
+    """
+    This function is a generator version of reconciliator(), to send the results of a query as they are
+    computed (see the search_stream() route). It yields tuples (event, data):
+    - ("entries", {"filtered_data": ..., "result": ...}) once the entries have been filtered, before any
+      pair is scored
+    - ("groups", groups) each time a block of entries (see make_blocks()) has been scored, if it contains
+      groups. groups is a list in the format of final_results["groups"]. Only the entries of a same block
+      can match, and the entries have a single block key (the date), so a group is made of entries of a
+      single block: it is complete when its block has been scored
+    - ("done", final_results) at the end, final_results being the same as the output of reconciliator()
+    The blocks are scored one after the other in the current process, the smallest first so that the first
+    groups come as soon as possible. The groups of a precomputed reconciliation all come at once.
+    :param author: a string
+    :param date: a string, optional parameter
+    :param budget: see reconciliator(). when it runs out, the blocks that haven't been scored are skipped
+    :param filtered: the output of filter_entries() for this query, if its entries have already been
+                     filtered (see search_cache.entries()): they aren't filtered again
+    """
+    deadline = time.monotonic() + budget if budget else None
+    profile = Profile()
+    if filtered is None:
+        author_dict, rows, reconciliation = filter_entries(author, date, profile)
+    else:
+        author_dict, rows, reconciliation = filtered
+        profile.count("entries", len(author_dict))
+    items = prepare_items(author_dict)
+    yield "entries", {"filtered_data": author_dict, "result": len(author_dict)}
+
+    report = profile.counters
+    report["pairs"] = len(items) * (len(items) - 1) // 2
+    report["considered"] = report["author_rejected_after_bound"] = report["scored"] = 0
+    report["partial"] = False
+    if reconciliation is None:
+        with profile.phase("scoring"):
+            blocks = sorted((block for block in make_blocks(items).values() if len(block) > 1), key=len)
+        # A pair of entries is in a single block, so the candidate pairs are the pairs of each block.
+        report["considered"] = sum(len(block) * (len(block) - 1) // 2 for block in blocks)
+    else:
+        with profile.phase("scoring"):
+            precomputed = precomputed_pairs(reconciliation, rows)
+        report["precomputed"] = len(precomputed)
+        blocks = [range(len(items))]
+    report["pruned"] = report["pairs"] - report["considered"]
+
+    scored_pairs = []
+    for block in blocks:
+        if report["partial"]:
+            break
+        if reconciliation is None:
+            with profile.phase("scoring"):
+                block_report = {}
+                block_pairs = score_pairs(
+                    items, list(itertools.combinations(block, 2)), report=block_report, deadline=deadline
+                )
+            for key in ("author_rejected_after_bound", "scored"):
+                report[key] += block_report[key]
+            report["partial"] = block_report["partial"]
+        else:
+            block_pairs = precomputed
+        if not block_pairs:
+            continue
+        scored_pairs.extend(block_pairs)
+
+        # The groups of the block are made with the entries of the block only.
+        with profile.phase("clustering"):
+            position = {i: n for n, i in enumerate(block)}
+            groups = group_pairs(
+                [items[i] for i in block],
+                [(position[i], position[j], score, distance) for i, j, score, distance in block_pairs]
+            )[1]
+        yield "groups", groups
+
+    # The output is made from all the pairs in the order of candidate_pairs(), so that it is the same as
+    # the output of reconciliator().
+    with profile.phase("clustering"):
+        scored_pairs.sort()
+        results_lists = group_pairs(items, scored_pairs)
+    report["clusters"] = len(results_lists[1])
+
+    final_results = {
+        "filtered_data": author_dict,
+        "score": results_lists[0],
+        "groups": results_lists[1],
+        "recon_desc": results_lists[2],
+        "result": len(author_dict),
+        "partial": report.pop("partial"),
+        "profile": profile.to_dict()
+    }
+    yield "done", final_results
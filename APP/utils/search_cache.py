@@ -0,0 +1,165 @@
+from collections import OrderedDict
+import threading
+
+from .constantes import SEARCH_CACHE_MAX_ENTRIES
+from .corpus_store import item_store
+
+
+# ---------------------------------------------------------
+# a bounded cache of the outputs of reconciliator(), so that
+# moving between the pages of a search (or sorting it) slices
+# the output of the search instead of running it again ; and
+# of the entries of the streamed searches, so that they are
+# filtered once for the page and its stream
+#
+# used by the search() and search_stream() routes
+#
+# contains:
+# - SearchCache
+# - search_cache (the instance shared by the whole app)
+# ---------------------------------------------------------
+
+
+class SearchCache:
+    """
+    a thread-safe LRU cache of the outputs of reconciliator(), keyed by (author, date).
+
+    an output is only valid as long as export_item.json has the same mtime and size as
+    when it was computed: if the file changes, the search is run again on the next request.
+    partial outputs (when the time budget of reconciliator() ran out) aren't cached, so that
+    the next request gets another chance to compute the complete output.
+
+    the outputs are shared: callers must not modify them (make a copy first).
+
+    a streamed search is run in two requests: the search page, which only needs the entries of
+    the search, and then its stream, which reconciles them (see the search() and search_stream()
+    routes). the entries filtered for the page are kept (see entries()) until the stream caches
+    the output of the search, so that they aren't filtered twice. two identical searches run at
+    the same time (in two tabs, before either of them is cached) are still run twice.
+    """
+    def __init__(self, max_entries=SEARCH_CACHE_MAX_ENTRIES):
+        """
+        :param max_entries: the maximum number of outputs kept in the cache
+        """
+        self.max_entries = max_entries
+        self.hits = 0  # number of searches answered from the cache
+        self.misses = 0  # number of searches that have been run
+        self._results = OrderedDict()  # (author, date): (stamp, output), from least to most recently used
+        self._entries = OrderedDict()  # (author, date): (stamp, entries), for the searches being streamed
+        self._lock = threading.Lock()
+
+    def get(self, author, date, search):
+        """
+        return the output of a search, running it if it isn't cached or if
+        export_item.json has changed since it was cached.
+        :param author: the searched author
+        :param date: the searched date, or None
+        :param search: the function running the search: search(author, date) returns the output
+        :return: the output of the search (shared: do not modify it)
+        """
+        stamp = self.stamp()
+        results = self.peek(author, date)
+        if results is not None:
+            return results
+        with self._lock:
+            self.misses += 1
+
+        # search outside of the lock so that other searches can be served in the meantime
+        results = search(author, date)
+        self.put(author, date, stamp, results)
+        return results
+
+    def peek(self, author, date):
+        """
+        get the output of a search if it is cached, without running it
+        :param author: the searched author
+        :param date: the searched date, or None
+        :return: the output of the search (shared: do not modify it), or None if it isn't cached
+        """
+        key = (author, date)
+        stamp = self.stamp()
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and cached[0] == stamp:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+        return None
+
+    def entries(self, author, date, select):
+        """
+        return the entries of a search, selecting them if they aren't kept or if export_item.json
+        has changed since they were selected. they are kept until the output of the search is cached
+        :param author: the searched author
+        :param date: the searched date, or None
+        :param select: the function selecting the entries: select(author, date) returns them
+                       (see reconciliator.filter_entries())
+        :return: the entries of the search (shared)
+        """
+        key = (author, date)
+        stamp = self.stamp()
+        with self._lock:
+            kept = self._entries.get(key)
+            if kept is not None and kept[0] == stamp:
+                self._entries.move_to_end(key)
+                return kept[1]
+
+        entries = select(author, date)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (stamp, entries)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entries
+
+    def put(self, author, date, stamp, results):
+        """
+        cache the output of a search run outside of get() (see the search_stream() route)
+        :param author: the searched author
+        :param date: the searched date, or None
+        :param stamp: the stamp of export_item.json before the search was run (see stamp())
+        :param results: the output of the search. it isn't cached if it is partial
+        :return: None
+        """
+        key = (author, date)
+        with self._lock:
+            self._entries.pop(key, None)  # the entries are in the output
+            self._results.pop(key, None)
+            if not results.get("partial"):
+                self._results[key] = (stamp, results)
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+        return None
+
+    @staticmethod
+    def stamp():
+        """
+        :return: the current mtime and size of export_item.json, which an output is computed from
+        """
+        return item_store.stamp(item_store.fpath)
+
+    def clear(self):
+        """
+        empty the cache (the counters are kept)
+        :return: None
+        """
+        with self._lock:
+            self._results.clear()
+            self._entries.clear()
+        return None
+
+    def stats(self):
+        """
+        describe the current state of the cache
+        :return: a dict with the counters and the current size of the cache
+        """
+        with self._lock:
+            return {
+                "entries": len(self._results),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+search_cache = SearchCache()
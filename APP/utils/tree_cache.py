@@ -0,0 +1,140 @@
+from collections import OrderedDict
+from lxml import etree
+import threading
+import os
+
+from .constantes import DATA, TREE_CACHE_MAX_ENTRIES, TREE_CACHE_MAX_BYTES
+
+
+# ---------------------------------------------------------
+# a bounded cache of parsed xml-tei catalogues, so that a
+# catalogue requested often is parsed once per worker and
+# not once per request
+#
+# used by main_functions.open_file(), XmlTei.get_item_from_id()
+# and katapi_cat_full()
+#
+# contains:
+# - TreeCache
+# - tree_cache (the instance shared by the whole app)
+# ---------------------------------------------------------
+
+
+class TreeCache:
+    """
+    a thread-safe LRU cache of lxml trees, keyed by catalogue id.
+
+    an entry is only valid as long as the catalogue file on disk has the same
+    mtime and size as when it was parsed: if the file changes, it is parsed
+    again on the next request. the cache is bounded both by a number of entries
+    and by a number of bytes (the size of the xml files on disk, which is a
+    good enough proxy of the size of the parsed trees to compare catalogues
+    with each other). the least recently used trees are evicted first.
+
+    the trees are shared: callers must not modify them (make a copy first).
+    """
+    def __init__(self, max_entries=TREE_CACHE_MAX_ENTRIES, max_bytes=TREE_CACHE_MAX_BYTES):
+        """
+        :param max_entries: the maximum number of trees kept in the cache
+        :param max_bytes: the maximum total size (in bytes of xml on disk) of the cached trees
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0  # number of requests answered from the cache
+        self.misses = 0  # number of requests for which a file had to be parsed
+        self.evictions = 0  # number of trees removed from the cache to respect the budgets
+        self._trees = OrderedDict()  # cat_id: (stamp, nbytes, tree), from least to most recently used
+        self._nbytes = 0  # current total size of the cached trees
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fpath(cat_id):
+        """
+        build the path to a catalogue from its id
+        :param cat_id: the catalogue's id (CAT_\\d+)
+        :return: the path to the xml file
+        """
+        return os.path.join(DATA, f"{cat_id}.xml")
+
+    def get(self, cat_id):
+        """
+        return the parsed tree for a catalogue, parsing it if it isn't cached
+        or if the file has changed since it was cached.
+        :param cat_id: the catalogue's id (CAT_\\d+)
+        :raises FileNotFoundError: if there is no file for that id
+        :return: the lxml tree of the catalogue (shared: do not modify it)
+        """
+        fpath = self.fpath(cat_id)
+        stat = os.stat(fpath)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            cached = self._trees.get(cat_id)
+            if cached is not None and cached[0] == stamp:
+                self._trees.move_to_end(cat_id)
+                self.hits += 1
+                return cached[2]
+            self.misses += 1
+
+        # parse outside of the lock so that other catalogues can be served in the meantime
+        tree = etree.parse(fpath)
+
+        with self._lock:
+            self._discard(cat_id)
+            if stat.st_size <= self.max_bytes:
+                self._trees[cat_id] = (stamp, stat.st_size, tree)
+                self._nbytes += stat.st_size
+                self._evict()
+        return tree
+
+    def _discard(self, cat_id):
+        """
+        remove a tree from the cache, if it is there. the lock must be held.
+        :param cat_id: the catalogue's id
+        :return: None
+        """
+        cached = self._trees.pop(cat_id, None)
+        if cached is not None:
+            self._nbytes -= cached[1]
+        return None
+
+    def _evict(self):
+        """
+        evict the least recently used trees until the cache respects its budgets.
+        the lock must be held.
+        :return: None
+        """
+        while self._trees and (len(self._trees) > self.max_entries or self._nbytes > self.max_bytes):
+            cat_id, cached = self._trees.popitem(last=False)
+            self._nbytes -= cached[1]
+            self.evictions += 1
+        return None
+
+    def clear(self):
+        """
+        empty the cache (the counters are kept)
+        :return: None
+        """
+        with self._lock:
+            self._trees.clear()
+            self._nbytes = 0
+        return None
+
+    def stats(self):
+        """
+        describe the current state of the cache
+        :return: a dict with the counters and the current size of the cache
+        """
+        with self._lock:
+            return {
+                "entries": len(self._trees),
+                "bytes": self._nbytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+tree_cache = TreeCache()
@@ -9,13 +9,40 @@ if __name__ == "__main__":
     parser.add_argument("-t", "--test",
                         help="run a series of tests on the API.",
                         action="store_true")
+    parser.add_argument("-b", "--build",
+                        help="build the files derived from the data (index, columns of export_item.json...) and exit.",
+                        action="store_true")
+    parser.add_argument("-r", "--reconcile",
+                        help="reconcile the whole export_item.json ahead of time, if it has changed since"
+                             + " it was last reconciled, and exit. only the new entries are compared, unless"
+                             + " --full is given.",
+                        action="store_true")
+    parser.add_argument("-f", "--full",
+                        help="with --reconcile, reconcile the whole export_item.json again instead of"
+                             + " updating its former reconciliation.",
+                        action="store_true")
     args = parser.parse_args()
 
     # run tests
     if args.test:
         # extra imports to run the tests
         from APP.test.api_test import run
-        run()  # run tests
+        from APP.test import metadata_test, reconciliator_test, cache_test, routes_test
+        run(metadata_test.suite(), reconciliator_test.suite(), cache_test.suite(), routes_test.suite())  # run tests
+
+    # build the files derived from the data: most of them are built when the app
+    # is imported ; the columns of export_item.json are (re)built if needed.
+    elif args.build:
+        from APP.utils.corpus_columns import item_columns
+        item_columns.refresh()
+
+    # reconcile the whole corpus, so that the searches read the precomputed pairs of
+    # entries instead of comparing the entries (see reconciliation_snapshot.py). if the
+    # corpus has been reconciled before, only its new entries are compared.
+    elif args.reconcile:
+        from APP.utils.reconciliator import reconcile_corpus, reconcile_update
+        from APP.utils.reconciliation_snapshot import reconciliation_snapshot
+        reconciliation_snapshot.refresh(reconcile_corpus, update=reconcile_update, force=args.full)
 
     # normal functionning
     else: